@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (adaptive.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# adaptive.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Adaptive sending rate and concurrency, driven by the server replies.
+A HostController paces the deliveries to one server (all its
+connections together) and is told the outcome of each one by the
+sender objects (see SendMails.controller). It works like the TCP
+congestion control (AIMD): every round of successful deliveries the
+rate grows by INCREASE messages per second, a deferral (a 4xx reply,
+like 421 or 450, or a dropped connection) halves it, at most once per
+round trip. The connections allowed follow the rate: by Little's law
+rate * latency deliveries are in progress at once, latency being the
+smoothed time a delivery takes. The senders of a process share the
+controller of their server (see shared()); separate processes (like
+the queue workers) control their own rate.
+"""
+
+import math
+import time
+import threading
+
+
+INITIAL_RATE = 2.0   # messages per second
+MIN_RATE = 0.1
+MAX_RATE = 20.0
+INCREASE = 1.0       # messages per second, every round
+DECREASE = 0.5
+SMOOTHING = 0.2      # weight of the last sample in the latency average
+
+
+def is_deferral(error):
+    """True if *error* (raised by a delivery) asks to slow down."""
+    import smtplib
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return any(400 <= code < 500
+                   for code, msg in error.recipients.values())
+    code = getattr(error, 'smtp_code', None)
+    return code is not None and 400 <= code < 500
+
+
+class HostController(object):
+    """
+    Rate (messages per second) and connections limit for the server
+    *host*, between *min_rate* and *max_rate* and up to *max_limit*
+    connections.
+    """
+    def __init__(self, host, max_rate=MAX_RATE, max_limit=1,
+                 rate=INITIAL_RATE, min_rate=MIN_RATE):
+        self.host = host
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.max_limit = max(1, max_limit)
+        self.rate = min(rate, max_rate)
+        self.limit = 1
+        self.latency = None
+        self.sent = self.deferred = 0
+        self.active = 0
+        self._next = 0
+        self._round = 0
+        self._decreased = 0
+        self._cond = threading.Condition()
+
+    def wait(self):
+        """Wait for the turn of the next delivery."""
+        with self._cond:
+            now = time.time()
+            when = max(now, self._next)
+            self._next = when + 1.0 / self.rate
+        if when > now:
+            time.sleep(when - now)
+
+    def acquire(self):
+        """Wait until a connection is allowed."""
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def record(self, latency, error=None):
+        """Account a delivery which took *latency* seconds, *error*
+        being the exception raised (if any)."""
+        with self._cond:
+            now = time.time()
+            if error is not None and is_deferral(error):
+                self.deferred += 1
+                # a burst of deferrals is one congestion signal.
+                rtt = (self.latency or 0) + 1.0 / self.rate
+                if now - self._decreased >= rtt:
+                    self.rate = max(self.min_rate, self.rate * DECREASE)
+                    self.limit = max(1, self.limit // 2)
+                    self._decreased = now
+                    self._round = 0
+                    self._next = now + 1.0 / self.rate
+                return
+            self.sent += 1
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += SMOOTHING * (latency - self.latency)
+            self._round += 1
+            if self._round >= max(1, int(self.rate)):
+                self._round = 0
+                self.rate = min(self.max_rate, self.rate + INCREASE)
+            limit = int(math.ceil(self.rate * self.latency))
+            limit = min(self.max_limit, max(1, limit))
+            if limit > self.limit:
+                self.limit = limit
+                self._cond.notify_all()
+
+    def stats(self):
+        return dict(host=self.host, rate=round(self.rate, 2),
+                    limit=self.limit, sent=self.sent, deferred=self.deferred,
+                    latency=round(self.latency or 0, 3))
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared(key, **kwargs):
+    """
+    Return the HostController of the server *key* shared by all the
+    senders of the process, made with *kwargs* the first time.
+    """
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = HostController(key, **kwargs)
+        return _shared[key]
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (addrcheck.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# addrcheck.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Syntactic address validation, done before sending so the malformed
+addresses don't cost a refused SMTP transaction each. The local part
+must be a RFC 5321 dot-string or quoted-string, the domain a host name
+(internationalized ones are converted to their IDNA ascii form) or an
+address literal; the lengths are checked too. The verdict on a domain,
+allow/deny lists included, is computed once and then cached, so
+checking many addresses of few domains costs a regex match each.
+"""
+
+import io
+import re
+
+from Multimail.recipients import RecipientTable
+
+
+BATCH_SIZE = 1000
+MAX_LOCAL, MAX_DOMAIN, MAX_ADDRESS = 64, 253, 254
+
+_ATEXT = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]"
+_DOT_STRING = re.compile(r'^%s+(?:\.%s+)*$' % (_ATEXT, _ATEXT))
+_QUOTED_STRING = re.compile(r'^"(?:[\x20\x21\x23-\x5b\x5d-\x7e]'
+                            r'|\\[\x20-\x7e])*"$')
+_LABEL = re.compile(r'^[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?$')
+_LITERAL = re.compile(r'^\[(?:\d{1,3}(?:\.\d{1,3}){3}'
+                      r'|IPv6:[0-9A-Fa-f:.]+)\]$')
+_ASCII = re.compile(r'^[\x00-\x7f]*$')
+
+
+def _idna(domain):
+    """Return the ascii (IDNA) form of *domain*, raise ValueError."""
+    if not isinstance(domain, type(u'')):
+        domain = domain.decode('utf-8')
+    ascii = domain.encode('idna')
+    return ascii if isinstance(ascii, str) else ascii.decode('ascii')
+
+
+def check_domain(domain):
+    """Return (ascii_domain, None) or (domain, reason) if invalid."""
+    if _LITERAL.match(domain):
+        return domain, None
+    if not _ASCII.match(domain):
+        try:
+            domain = _idna(domain)
+        except (UnicodeError, ValueError):
+            return domain, "invalid international domain"
+    if len(domain) > MAX_DOMAIN:
+        return domain, "domain too long"
+    labels = domain.split('.')
+    if len(labels) < 2:
+        return domain, "not a fully qualified domain"
+    for label in labels:
+        if not _LABEL.match(label):
+            return domain, "invalid domain label: '%s'" % label
+    if labels[-1].isdigit():
+        return domain, "numeric top level domain"
+    return domain, None
+
+
+def _matches(domain, names):
+    """True if *domain* is one of *names* or a subdomain of them."""
+    for name in names:
+        if domain == name or domain.endswith('.' + name):
+            return True
+    return False
+
+
+class Checker(object):
+    """
+    Address checker. If *allow* (a sequence of domains) is not empty
+    only the addresses of those domains (or their subdomains) pass,
+    the domains in *deny* never pass.
+    """
+    def __init__(self, allow=(), deny=()):
+        self.allow = tuple(self._ascii(d) for d in allow)
+        self.deny = tuple(self._ascii(d) for d in deny)
+        self._domains = {}
+
+    def _ascii(self, domain):
+        return check_domain(domain.lower())[0]
+
+    def _domain(self, domain):
+        verdict = self._domains.get(domain)
+        if verdict is None:
+            ascii, reason = check_domain(domain)
+            if reason is None:
+                lowered = ascii.lower()
+                if _matches(lowered, self.deny):
+                    reason = "domain denied"
+                elif self.allow and not _matches(lowered, self.allow):
+                    reason = "domain not allowed"
+            verdict = self._domains[domain] = (ascii, reason)
+        return verdict
+
+    def check(self, address):
+        """
+        Return (address, reason): the normalized *address* (domain
+        in IDNA form) and None, or the address and why it's invalid.
+        """
+        address = address.strip()
+        if address.startswith('<') and address.endswith('>'):
+            address = address[1:-1]
+        local, at, domain = address.rpartition('@')
+        if not at:
+            return address, "missing @"
+        if not local:
+            return address, "empty local part"
+        if len(local) > MAX_LOCAL:
+            return address, "local part too long"
+        if not (_DOT_STRING.match(local) or _QUOTED_STRING.match(local)):
+            if not _ASCII.match(local):
+                return address, "non ascii local part"
+            return address, "invalid local part"
+        domain, reason = self._domain(domain)
+        if reason is not None:
+            return address, reason
+        address = local + '@' + domain
+        if len(address) > MAX_ADDRESS:
+            return address, "address too long"
+        return address, None
+
+    def filter(self, addresses, reject_file=None, batch_size=BATCH_SIZE):
+        """
+        Check the (streamed) *addresses*, the blank ones are skipped.
+        Return (valid, rejected): a RecipientTable of the valid ones
+        and the number of invalid ones, which are appended in batches
+        to *reject_file* (if given) as "address<TAB>reason" lines,
+        utf-8 encoded.
+        """
+        valid = RecipientTable()
+        rejected = []
+        count = 0
+        out = None
+        if reject_file:
+            out = io.open(reject_file, 'a', encoding='utf-8')
+        try:
+            for address in addresses:
+                if not address.strip():
+                    continue
+                address, reason = self.check(address)
+                if reason is None:
+                    valid.add(address)
+                    continue
+                count += 1
+                if isinstance(address, bytes):  # python 2 str
+                    address = address.decode('utf-8', 'replace')
+                rejected.append(u'%s\t%s\n' % (address, reason))
+                if len(rejected) >= batch_size:
+                    if out is not None:
+                        out.writelines(rejected)
+                    del rejected[:]
+            if out is not None:
+                out.writelines(rejected)
+        finally:
+            if out is not None:
+                out.close()
+        return valid, count
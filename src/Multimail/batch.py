@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (batch.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# batch.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Batch mode: many campaigns sent by one process. The manifest is an
+INI file with one section per campaign:
+    [newsletter]
+    profile = work                ;; config file section (default DEFAULT)
+    subject = The news
+    text = news.txt               ;; the text, or the file to read it from
+    recipients = a@b.org c@d.org
+    recipients_file = list1.txt list2.txt
+    attachments = report.pdf data ;; optional, as for the command line
+    compression = gz              ;; optional, tar|gz|bz2|zip
+    archive_name = data           ;; optional
+    sign = clear                  ;; optional, clear|detach|pgp-mime
+    sender =                      ;; optional, overrides the profile
+    text_type =                   ;; optional, overrides the profile
+the values of the DEFAULT section apply to every campaign, relative
+paths are relative to the manifest directory.
+
+The campaigns using the same server (and login) share one logged in
+connection, equal attachment sets are archived once and equal texts
+signed once (the PGP/MIME signatures are made in parallel, see the
+signing module). Recipients are sent in rounds of *chunk* per campaign,
+so a large campaign doesn't hold back the others.
+"""
+
+from __future__ import print_function
+
+import os
+import os.path as osp
+try:
+    import ConfigParser as configparser
+except ImportError:
+    import configparser
+
+from Multimail import mmutils
+from Multimail import settings
+from Multimail.recipients import RecipientTable
+
+
+CHUNK = 50
+COMPRESSIONS = ('tar', 'gz', 'bz2', 'zip')
+SIGNATURES = ('clear', 'detach', 'pgp-mime')
+
+
+class BatchError(Exception):
+    pass
+
+
+def _words(value):
+    return value.replace(',', ' ').split()
+
+def _port(config):
+    if config.secure_conn:
+        return config.ssl_port or config.port
+    return config.port
+
+
+class Campaign(object):
+    """A message, its recipients and the Settings used to send it."""
+    __slots__ = ('name', 'config', 'sender', 'subject', 'text', 'recipients',
+                 'text_type', 'attachments', 'compression', 'archive_name',
+                 'sign', 'msg', 'sent', 'errors', 'retval', 'suppressed',
+                 'rejected')
+
+    def __init__(self, name, config, sender, subject, text, recipients,
+                 text_type=None, attachments=(), compression=None,
+                 archive_name=None, sign=None):
+        self.name = name
+        self.config = config
+        self.sender = sender or config.sender
+        self.subject = subject
+        self.text = text
+        self.recipients = RecipientTable(recipients)
+        self.text_type = text_type or config.text_type
+        self.attachments = list(attachments)
+        self.compression = compression
+        self.archive_name = archive_name
+        self.sign = sign
+        self.msg = None
+        self.sent = self.errors = self.retval = 0
+        self.suppressed = self.rejected = 0
+        self.check()
+
+    def check(self):
+        """Raise BatchError if the campaign can't be sent."""
+        plain = self.text_type == 'plain'
+        delivery = self.config.delivery
+        # (failed, reason), checked in order
+        rules = (
+            (not self.recipients, "no recipients"),
+            (not self.sender, "sender address not found"),
+            (self.text_type not in settings.TEXT_TYPES,
+             "unknown text type: %s" % self.text_type),
+            (self.compression and self.compression not in COMPRESSIONS,
+             "unknown archive type: %s" % self.compression),
+            (self.compression and not self.attachments, "nothing to compress"),
+            (self.archive_name and not self.compression,
+             "can't naming without compression"),
+            (self.sign is not None and self.sign not in SIGNATURES,
+             "sign must be clear, detach or pgp-mime, not %s" % self.sign),
+            (plain and self.attachments,
+             "can't send attachments in plain text mode"),
+            (plain and self.sign == 'detach',
+             "can't make detached signature in plain text mode"),
+            (plain and self.sign == 'pgp-mime',
+             "can't make PGP/MIME signature in plain text mode"),
+            (self.sign == 'pgp-mime' and delivery in ('daemon', 'queue'),
+             "can't make PGP/MIME signature with %s delivery" % delivery),
+            (not self.compression
+             and any(osp.isdir(p) for p in self.attachments),
+             "directories need compression"),
+            (self.sign and not (self.config.gpg_exe
+                                and self.config.gpg_key_id),
+             "signing needs gpg_exe and gpg_key_id in the profile"),
+        )
+        for failed, reason in rules:
+            if failed:
+                raise BatchError("campaign [%s]: %s" % (self.name, reason))
+
+    def server_key(self):
+        """The campaigns with equal keys can share a connection."""
+        c = self.config
+        if c.delivery == 'smtp':
+            return ('smtp', c.host, _port(c), c.secure_conn, c.starttls,
+                    c.login or self.sender)
+        elif c.delivery == 'pickup':
+            return ('pickup', c.pickup_dir)
+        elif c.delivery == 'sendmail':
+            return ('sendmail', c.sendmail_cmd)
+        elif c.delivery == 'daemon':
+            return ('daemon', c.daemon_socket)
+        return ('queue', c.spool_dir)
+
+
+def read_manifest(path, config_path=None):
+    """
+    Return the list of campaigns described in the manifest *path*.
+    Their profiles are read from the config file *config_path*, or
+    are the default settings if *config_path* is None.
+    """
+    manifest = configparser.RawConfigParser()
+    try:
+        with open(path) as f:
+            if hasattr(manifest, 'read_file'):
+                manifest.read_file(f)
+            else:
+                manifest.readfp(f)
+    except (IOError, OSError, configparser.Error) as e:
+        raise BatchError("Error reading the manifest %s: %s" % (path, e))
+    base = osp.dirname(osp.abspath(path))
+    def resolve(p):
+        return osp.join(base, osp.expanduser(p))
+    campaigns = []
+    for name in manifest.sections():
+        get = lambda key: manifest.get(name, key).strip() \
+                          if manifest.has_option(name, key) else ''
+        profile = get('profile') or 'DEFAULT'
+        try:
+            if config_path is None:
+                config = settings.Settings(profile)
+            else:
+                config = settings.load(config_path, profile)
+        except settings.SettingsError as e:
+            raise BatchError("campaign [%s]: %s" % (name, e))
+        text = get('text')
+        if text and osp.isfile(resolve(text)):
+            with open(resolve(text)) as f:
+                text = f.read()
+        recipients = RecipientTable(_words(get('recipients')))
+        for file in _words(get('recipients_file')):
+            try:
+                with open(resolve(file)) as f:
+                    recipients.extend(f)
+            except IOError as e:
+                raise BatchError("campaign [%s]: %s" % (name, e))
+        campaigns.append(Campaign(
+            name, config, get('sender'), get('subject'), text, recipients,
+            get('text_type'), [resolve(p) for p in _words(get('attachments'))],
+            get('compression') or None, get('archive_name') or None,
+            get('sign') or None))
+    if not campaigns:
+        raise BatchError("no campaigns in the manifest %s" % path)
+    return campaigns
+
+
+def make_sender(config):
+    """Return a new sender object for the Settings *config*."""
+    from Multimail import delivery
+    sender = delivery.get_sender(
+        config.delivery, config.host, _port(config), config.secure_conn,
+        config.timeout, config.pickup_dir,
+        config.sendmail_cmd or delivery.SENDMAIL_CMD, config.sendmail_procs,
+        config.starttls, config.daemon_socket, config.spool_dir)
+    sender.pipelining = config.pipelining
+    sender.debug_level = config.debug_mode
+    sender.delay_time = config.delay
+    return sender
+
+
+class Batch(object):
+    """
+    Send *campaigns* (a list of Campaign objects) *chunk* recipients
+    at time each, in turn. *factory* is called with a Settings object
+    and must return a new sender for it (see make_sender), *signer*
+    (if given) is called the same way to get a PGP/MIME signer (see
+    the signing module, GpgSigner is the default).
+    """
+    def __init__(self, campaigns, chunk=CHUNK, factory=make_sender,
+                 signer=None):
+        self.campaigns = campaigns
+        self.chunk = max(1, chunk)
+        self.factory = factory
+        self.signer = signer
+        self._pools = {}
+        self._senders = {}
+        self._passwords = {}
+        self._archives = {}
+        self._signed = {}
+        self._checkers = {}
+        self._deadlines = {}
+
+    def _archive(self, campaign):
+        key = (tuple(campaign.attachments), campaign.compression)
+        if key not in self._archives:
+            try:
+                self._archives[key] = mmutils.create_archive(
+                    campaign.attachments, campaign.compression)
+            except (mmutils.ArchiveError, IOError) as e:
+                raise BatchError("campaign [%s]: can't create archive: %s"
+                                 % (campaign.name, e))
+        path = self._archives[key]
+        if campaign.archive_name:
+            ext = ('.tar' if campaign.compression in ('gz', 'bz2')
+                   else '') + '.' + campaign.compression
+            return [(path, campaign.archive_name + ext)]
+        return [(path, osp.basename(path))]
+
+    def _sign(self, campaign, text):
+        c = campaign.config
+        detach = campaign.sign == 'detach'
+        key = (c.gpg_exe, c.gpg_key_id, text, detach)
+        if key not in self._signed:
+            try:
+                self._signed[key] = mmutils.gpg_sign(
+                    c.gpg_exe, c.gpg_key_id, text, detach)
+            except mmutils.SignError as e:
+                raise BatchError("campaign [%s]: %s" % (campaign.name, e))
+        return self._signed[key]
+
+    def _pool(self, campaign):
+        from Multimail import signing
+        c = campaign.config
+        key = (c.gpg_exe, c.gpg_key_id)
+        if key not in self._pools:
+            if self.signer is not None:
+                factory = lambda: self.signer(c)
+            else:
+                factory = lambda: signing.GpgSigner(*key)
+            self._pools[key] = signing.SignerPool(factory, c.sign_workers)
+        return self._pools[key]
+
+    def _check(self, campaign):
+        from Multimail import addrcheck
+        c = campaign.config
+        key = (c.allow_domains, c.deny_domains)
+        if key not in self._checkers:
+            self._checkers[key] = addrcheck.Checker(*key)
+        recipients = campaign.recipients
+        if c.sort_domains:
+            from Multimail.planner import Planner
+            recipients = Planner().sort(recipients)
+        try:
+            campaign.recipients, campaign.rejected = self._checkers[
+                key].filter(recipients, c.reject_file)
+        except IOError as e:
+            raise BatchError("campaign [%s]: %s" % (campaign.name, e))
+
+    def prepare(self, campaign):
+        """Build the message of *campaign*, drop its invalid (see the
+        addrcheck module) and suppressed (see bounces) recipients."""
+        from Multimail import bounces
+        from Multimail.message import PlainMsg, MimeMsg
+        self._check(campaign)
+        campaign.recipients, campaign.suppressed = bounces.filter_recipients(
+            campaign.recipients, (campaign.config.suppression_list
+                                  or bounces.SUPPRESSION_LIST))
+        if campaign.text_type == 'plain':
+            msg = PlainMsg(campaign.sender, '', campaign.subject,
+                           campaign.text)
+        else:
+            if campaign.compression:
+                attachments = self._archive(campaign)
+            else:
+                attachments = [(p, None) for p in campaign.attachments]
+            msg = MimeMsg(campaign.sender, '', campaign.subject,
+                          campaign.text, campaign.text_type, attachments)
+        if campaign.sign == 'pgp-mime':
+            msg.pgp_sign(self._pool(campaign))
+        elif campaign.sign:
+            msg.sign(self._sign(campaign, msg.text),
+                     campaign.sign == 'detach')
+        campaign.msg = msg
+
+    def sender(self, campaign):
+        """Return the logged in sender for *campaign*, or None (also
+        for the other campaigns of the same server, once the login
+        failed)."""
+        key = campaign.server_key()
+        if key not in self._senders:
+            config = campaign.config
+            if key not in self._passwords:
+                password = config.password
+                if password is None and config.password_source:
+                    from Multimail import credentials
+                    try:
+                        password = credentials.from_spec(
+                            config.password_source, config.password_ttl)
+                    except credentials.CredentialError as e:
+                        raise BatchError("campaign [%s]: %s"
+                                         % (campaign.name, e))
+                if config.delivery == 'smtp' and password is None:
+                    import getpass
+                    password = getpass.getpass(
+                        "password for %s@%s: " % (key[-1], config.host))
+                self._passwords[key] = password
+            sender = self.factory(config)
+            sender.verbose = False
+            if config.adaptive and config.delivery == 'smtp':
+                from Multimail import adaptive
+                sender.controller = adaptive.shared(
+                    key, max_rate=config.max_rate)
+            if config.delivery == 'smtp' and (config.phase_timeouts
+                                              or config.run_deadline):
+                sender.deadlines = self._get_deadlines(config)
+            if not sender.login(config.login or campaign.sender,
+                                self._passwords[key]):
+                sender = None
+            self._senders[key] = sender
+        return self._senders[key]
+
+    def _get_deadlines(self, config):
+        """Return the deadlines.Deadlines of *config*, shared by the
+        campaigns with the same ones (the run deadline starting when
+        first used)."""
+        from Multimail import deadlines
+        key = (config.phase_timeouts, config.run_deadline, config.timeout)
+        if key not in self._deadlines:
+            self._deadlines[key] = deadlines.parse(*key)
+        return self._deadlines[key]
+
+    def _drop(self, campaign):
+        sender = self._senders.pop(campaign.server_key(), None)
+        if sender is not None:
+            try:
+                sender.quit()
+            except Exception:
+                pass
+
+    def _abort(self, campaign, done):
+        campaign.errors += len(campaign.recipients) - done
+        campaign.retval = 3
+
+    def run(self):
+        """
+        Send all the campaigns, return 0 if all the mails have been
+        sent, 3 if some campaign has been aborted, 255 otherwise.
+        """
+        try:
+            for campaign in self.campaigns:
+                self.prepare(campaign)
+            for campaign in self.campaigns:
+                if campaign.sign == 'pgp-mime':
+                    try:
+                        campaign.msg.get_message()  # wait the signature
+                    except mmutils.SignError as e:
+                        raise BatchError("campaign [%s]: %s"
+                                         % (campaign.name, e))
+            # no session for the campaigns left without recipients
+            running = [(c, 0) for c in self.campaigns if c.recipients]
+            while running:
+                campaign, done = running.pop(0)
+                sender = self.sender(campaign)
+                if sender is None:
+                    self._abort(campaign, done)
+                    continue
+                chunk = campaign.recipients[done:done+self.chunk]
+                sender.step = sender.errors = 0
+                retval = sender.send(campaign.msg, chunk, keep_open=True)
+                campaign.sent += sender.step
+                campaign.errors += sender.errors
+                done += len(chunk)
+                if retval == 3:
+                    self._drop(campaign)
+                    self._abort(campaign, done)
+                    continue
+                campaign.retval = campaign.retval or retval
+                if done < len(campaign.recipients):
+                    running.append((campaign, done))
+        finally:
+            self.close()
+        retvals = set(c.retval for c in self.campaigns)
+        for retval in (3, 255):
+            if retval in retvals:
+                return retval
+        return 0
+
+    def close(self):
+        """Close the connections and the signers, remove the archives
+        and signatures."""
+        for key in list(self._pools):
+            self._pools.pop(key).close()
+        for key in list(self._senders):
+            sender = self._senders.pop(key)
+            if sender is None:  # login failed
+                continue
+            try:
+                sender.quit()
+            except Exception:
+                pass
+        for path in (list(self._archives.values())
+                     + list(self._signed.values())):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._archives.clear()
+        self._signed.clear()
+
+    def report(self):
+        """Return a line of summary for each campaign."""
+        return ["[%s] %d sent, %d errors%s%s%s"
+                % (c.name, c.sent, c.errors,
+                   ', %d invalid' % c.rejected if c.rejected else '',
+                   ', %d suppressed' % c.suppressed if c.suppressed else '',
+                   ' (aborted)' if c.retval == 3 else '')
+                for c in self.campaigns]
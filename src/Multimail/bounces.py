@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (bounces.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# bounces.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Bounce processing. The delivery status notifications (RFC 3464) found
+in a mbox file or a Maildir are read one message at time, each failed
+recipient is classified as a hard bounce (permanent failure, 5.x.x
+status) or a soft one (4.x.x status or a delayed action) and recorded
+in the suppression list, a dbm file keyed by the lowercased address.
+An address is suppressed after a hard bounce or SOFT_LIMIT soft ones;
+the suppressed addresses are dropped from the recipients before
+sending (see filter_recipients).
+"""
+
+from __future__ import print_function
+
+import time
+import os.path as osp
+try:
+    import anydbm as dbm
+    from whichdb import whichdb
+except ImportError:
+    import dbm
+    from dbm import whichdb
+
+
+HARD, SOFT = 'hard', 'soft'
+SOFT_LIMIT = 3
+# permanent codes which usually heal by themselves (mailbox full)
+SOFT_STATUSES = ('5.2.2',)
+SUPPRESSION_LIST = osp.expanduser('~/.multimail-suppressed')
+
+_SEEN = '\0seen:'  # key prefix of the bounce messages already processed
+
+
+class BounceError(Exception):
+    pass
+
+
+def classify(status, action=''):
+    """Return HARD, SOFT or None (not a failure) for a DSN *status*
+    code and *action*."""
+    action = action.lower()
+    if action in ('delivered', 'relayed', 'expanded'):
+        return None
+    if action == 'delayed' or status.startswith('4'):
+        return SOFT
+    if status.startswith('5'):
+        return SOFT if status in SOFT_STATUSES else HARD
+    return HARD if action == 'failed' else None
+
+
+def _address(field):
+    """The address of a *Final-Recipient: rfc822; addr* like field."""
+    addr = field.split(';', 1)[-1].strip()
+    return addr.strip('<>').strip()
+
+
+def parse_dsn(msg):
+    """
+    Return the failed recipients reported by the email.Message *msg*,
+    as a list of (address, kind, status, diagnostic) tuples. Messages
+    without a delivery-status part but with the X-Failed-Recipients
+    header (exim) give hard bounces.
+    """
+    bounces = []
+    for part in msg.walk():
+        if part.get_content_type() != 'message/delivery-status':
+            continue
+        # the per message fields first, then the per recipient ones.
+        for fields in (part.get_payload() or [])[1:]:
+            rcpt = (fields.get('Original-Recipient')
+                    or fields.get('Final-Recipient'))
+            if not rcpt:
+                continue
+            status = (fields.get('Status') or '').strip().split(' ')[0]
+            kind = classify(status, (fields.get('Action') or '').strip())
+            if kind is not None:
+                diagnostic = ' '.join((fields.get('Diagnostic-Code')
+                                       or '').split())
+                bounces.append((_address(rcpt), kind, status, diagnostic))
+    if not bounces and msg.get('X-Failed-Recipients'):
+        for addr in msg['X-Failed-Recipients'].split(','):
+            if addr.strip():
+                bounces.append((addr.strip(), HARD, '', ''))
+    return bounces
+
+
+def open_mailbox(path):
+    """Return the mailbox.Maildir or mailbox.mbox at *path*."""
+    import mailbox
+    if osp.isdir(path):
+        if not osp.isdir(osp.join(path, 'cur')):
+            raise BounceError("not a Maildir: %s" % path)
+        return mailbox.Maildir(path, factory=None, create=False)
+    if not osp.isfile(path):
+        raise BounceError("no such mailbox: %s" % path)
+    return mailbox.mbox(path, factory=None, create=False)
+
+
+def _to_str(value):
+    return value if isinstance(value, str) else value.decode('utf-8')
+
+
+class SuppressionList(object):
+    """
+    The suppression list at *path*, a dbm file mapping each address
+    to "kind count status timestamp" of its last bounce. *flag* is
+    passed to dbm.open ('r' to read, 'c' to create if needed).
+    """
+    def __init__(self, path=SUPPRESSION_LIST, flag='c'):
+        self.path = path
+        try:
+            self.db = dbm.open(path, flag)
+        except dbm.error as e:
+            raise BounceError("can't open the suppression list %s: %s"
+                              % (path, e))
+
+    def get(self, address):
+        """Return (kind, count, status, timestamp) for *address*,
+        or None if it never bounced."""
+        try:
+            value = _to_str(self.db[address.lower()])
+        except KeyError:
+            return None
+        kind, count, status, when = value.split(' ')
+        return kind, int(count), status, float(when)
+
+    def add(self, address, kind, status='', when=None):
+        """Record a bounce of *address*."""
+        record = self.get(address)
+        count = 1 if record is None else record[1] + 1
+        if record is not None and record[0] == HARD:
+            kind = HARD  # a soft bounce doesn't heal a hard one
+        self.db[address.lower()] = "%s %d %s %f" % (
+            kind, count, status or '-', time.time() if when is None else when)
+
+    def remove(self, address):
+        try:
+            del self.db[address.lower()]
+        except KeyError:
+            pass
+
+    def __contains__(self, address):
+        """True if *address* is suppressed."""
+        record = self.get(address)
+        return record is not None and (record[0] == HARD
+                                       or record[1] >= SOFT_LIMIT)
+
+    def _seen_key(self, msg):
+        msg_id = msg.get('Message-ID')
+        if not msg_id:
+            import hashlib
+            text = msg.as_string()
+            if not isinstance(text, bytes):
+                text = text.encode('utf-8', 'replace')
+            msg_id = hashlib.sha1(text).hexdigest()
+        return _SEEN + msg_id.strip()
+
+    def process(self, path):
+        """
+        Record the bounces found in the mailbox *path*. Return a dict
+        with the number of messages read, of bounce messages, of hard
+        and soft bounces.
+        """
+        stats = dict(messages=0, bounces=0, hard=0, soft=0)
+        box = open_mailbox(path)
+        for key in box.iterkeys():
+            msg = box.get_message(key)
+            stats['messages'] += 1
+            found = parse_dsn(msg)
+            if not found:
+                continue
+            seen = self._seen_key(msg)
+            if seen in self.db:
+                continue  # already processed
+            self.db[seen] = '1'
+            stats['bounces'] += 1
+            for address, kind, status, diagnostic in found:
+                self.add(address, kind, status)
+                stats[kind] += 1
+        return stats
+
+    def close(self):
+        self.db.close()
+
+
+def filter_recipients(recipients, path):
+    """
+    Return (kept, dropped): the RecipientTable of the *recipients*
+    not suppressed in the suppression list *path*, and the number
+    of those dropped. A missing list suppresses nothing.
+    """
+    from Multimail.recipients import RecipientTable
+    if not path or not whichdb(path):
+        return recipients, 0
+    suppressed = SuppressionList(path, 'r')
+    try:
+        kept = RecipientTable(r for r in recipients if r not in suppressed)
+    finally:
+        suppressed.close()
+    return kept, len(recipients) - len(kept)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (credentials.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# credentials.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Credential providers, to login without prompting and without keeping
+the password in the config file. A provider is given to the sender
+objects in place of the password: its get() method returns the secret,
+fetched once and then cached (until it expires, for the command and
+OAuth2 ones), so the connections opened in parallel by the daemon and
+the queue workers share it. After a refused login the secret is
+invalidated (see invalidate()) and fetched again once.
+The providers are made from a source specification (see from_spec):
+    env:NAME        the environment variable NAME
+    fd:NUM          the first line read from the file descriptor NUM
+    cmd:COMMAND     the first line printed by COMMAND, cached for
+                    password_ttl seconds
+    oauth2:FILE     an OAuth2 access token (XOAUTH2 authentication),
+                    refreshed as needed with the token_url, client_id,
+                    client_secret and refresh_token in the JSON FILE
+"""
+
+import os
+import time
+import json
+import threading
+
+
+TTL = 300
+EXPIRY_MARGIN = 60  # refresh the OAuth2 tokens a bit before they expire
+
+
+class CredentialError(Exception):
+    pass
+
+
+class Credentials(object):
+    """
+    Base provider, caching the secret. The subclasses define fetch(),
+    returning (secret, seconds it's valid for or None) and raising
+    CredentialError. *mechanism* is the SMTP AUTH mechanism to use,
+    None to let smtplib choose one for a password.
+    """
+    mechanism = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._secret = None
+        self._expires = None
+
+    def get(self):
+        """Return the secret, raise CredentialError."""
+        with self._lock:
+            if (self._secret is None or (self._expires is not None
+                                         and time.time() >= self._expires)):
+                secret, ttl = self.fetch()
+                self._secret = secret
+                self._expires = None if ttl is None else time.time() + ttl
+            return self._secret
+
+    def invalidate(self):
+        """Forget the secret (refused by the server)."""
+        with self._lock:
+            self._secret = None
+
+
+class EnvCredentials(Credentials):
+    """The value of the environment variable *name*."""
+    def __init__(self, name):
+        super(EnvCredentials, self).__init__()
+        self.name = name
+
+    def fetch(self):
+        try:
+            return os.environ[self.name], None
+        except KeyError:
+            raise CredentialError("environment variable %s not set"
+                                  % self.name)
+
+
+class FdCredentials(Credentials):
+    """
+    The first line read from the file descriptor *fd*, which can
+    be read only once: the secret is never invalidated.
+    """
+    def __init__(self, fd):
+        super(FdCredentials, self).__init__()
+        self.fd = fd
+
+    def fetch(self):
+        try:
+            with os.fdopen(self.fd) as f:
+                line = f.readline()
+        except (IOError, OSError) as e:
+            raise CredentialError("can't read file descriptor %d: %s"
+                                  % (self.fd, e))
+        return line.rstrip('\r\n'), None
+
+    def invalidate(self):
+        pass
+
+
+class CommandCredentials(Credentials):
+    """
+    The first line printed by the shell *command* (e.g. a password
+    manager), kept for *ttl* seconds.
+    """
+    def __init__(self, command, ttl=TTL):
+        super(CommandCredentials, self).__init__()
+        self.command = command
+        self.ttl = ttl
+        self.runs = 0
+
+    def fetch(self):
+        import subprocess as subp
+        self.runs += 1
+        try:
+            proc = subp.Popen(self.command, shell=True,
+                              stdout=subp.PIPE, stderr=subp.PIPE)
+        except OSError as e:
+            raise CredentialError("can't run %s: %s" % (self.command, e))
+        out, err = proc.communicate()
+        if proc.returncode != 0:
+            raise CredentialError("%s failed: %s" % (
+                self.command, err.decode('utf-8', 'replace').strip()))
+        lines = out.decode('utf-8').splitlines()
+        if not lines or not lines[0]:
+            raise CredentialError("%s printed no secret" % self.command)
+        return lines[0], self.ttl
+
+
+class OAuth2Credentials(Credentials):
+    """
+    OAuth2 access tokens, got with the refresh token from the token
+    endpoint. *path* is a JSON file with the token_url, client_id,
+    client_secret and refresh_token keys; a new refresh token sent
+    by the endpoint is saved in it.
+    """
+    mechanism = 'XOAUTH2'
+
+    def __init__(self, path):
+        super(OAuth2Credentials, self).__init__()
+        self.path = path
+        try:
+            with open(path) as f:
+                self.params = json.load(f)
+        except (IOError, ValueError) as e:
+            raise CredentialError("can't read %s: %s" % (path, e))
+        missing = [k for k in ('token_url', 'client_id', 'refresh_token')
+                   if not self.params.get(k)]
+        if missing:
+            raise CredentialError("%s: missing %s" % (path,
+                                                      ', '.join(missing)))
+
+    def request(self, url, data):
+        """POST *data* (a dict) to *url*, return the decoded JSON reply."""
+        try:
+            from urllib.parse import urlencode
+            from urllib.request import urlopen
+        except ImportError:
+            from urllib import urlencode
+            from urllib2 import urlopen
+        try:
+            reply = urlopen(url, urlencode(data).encode('ascii'), 30)
+            try:
+                return json.loads(reply.read().decode('utf-8'))
+            finally:
+                reply.close()
+        except (IOError, ValueError) as e:
+            raise CredentialError("token request failed: %s" % e)
+
+    def fetch(self):
+        params = self.params
+        data = dict(grant_type='refresh_token', client_id=params['client_id'],
+                    refresh_token=params['refresh_token'])
+        if params.get('client_secret'):
+            data['client_secret'] = params['client_secret']
+        reply = self.request(params['token_url'], data)
+        if 'access_token' not in reply:
+            raise CredentialError("no access token: %s" % reply.get(
+                'error_description', reply.get('error', reply)))
+        if reply.get('refresh_token', params['refresh_token']) != (
+                params['refresh_token']):
+            params['refresh_token'] = reply['refresh_token']
+            with open(self.path, 'w') as f:
+                json.dump(params, f, indent=1)
+        ttl = max(0, int(reply.get('expires_in', 3600)) - EXPIRY_MARGIN)
+        return reply['access_token'], ttl
+
+
+def xoauth2(login_name, token):
+    """Return the (base64) XOAUTH2 initial response."""
+    import base64
+    data = 'user=%s\1auth=Bearer %s\1\1' % (login_name, token)
+    return base64.b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def from_spec(spec, ttl=TTL):
+    """Return the provider of the source *spec* (see the module doc)."""
+    kind, sep, value = spec.partition(':')
+    if not sep or not value:
+        raise CredentialError("invalid password source: %s" % spec)
+    if kind == 'env':
+        return EnvCredentials(value)
+    elif kind == 'fd':
+        try:
+            return FdCredentials(int(value))
+        except ValueError:
+            raise CredentialError("invalid file descriptor: %s" % value)
+    elif kind == 'cmd':
+        return CommandCredentials(value, ttl)
+    elif kind == 'oauth2':
+        return OAuth2Credentials(os.path.expanduser(value))
+    raise CredentialError("unknown password source: %s" % kind)
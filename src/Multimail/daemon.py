@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (daemon.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# daemon.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Long running sender. The daemon keeps a pool of logged in
+connections (NOOP keepalives while idle, RSET between jobs)
+and accepts send jobs on a local unix socket, so each job
+pays neither the connection/authentication nor the program
+startup costs.
+
+Protocol: the client writes one JSON object per line, the daemon
+answers with one JSON object per line.
+    {"command": "ping"}  ->  {"ok": true}
+    {"command": "send", "message": {...}, "recipients": [...]}
+        -> {"ok": true, "retval": 0, "sent": N, "errors": N}
+errors are reported as {"ok": false, "error": "..."}.
+"""
+
+from __future__ import print_function
+
+import os
+import time
+import json
+import errno
+import signal
+import socket
+import threading
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+from Multimail.delivery import SendMails
+from Multimail.message import PlainMsg, MimeMsg
+
+SOCKET_PATH = os.path.expanduser('~/.multimail.sock')
+
+
+class DaemonError(Exception):
+    pass
+
+
+def message_to_job(msg):
+    """Return a dict describing the message object *msg*."""
+    return {'sender': msg.sender,
+            'subject': msg.subject,
+            'text': msg.text,
+            'text_type': getattr(msg, 'text_type', 'plain'),
+            'attachments': [list(a) for a in (msg.attachments or [])]}
+
+def job_to_message(job):
+    """Return the message object described by *job*."""
+    if job['text_type'] == 'plain':
+        return PlainMsg(job['sender'], '', job['subject'], job['text'])
+    return MimeMsg(job['sender'], '', job['subject'], job['text'],
+                   job['text_type'], [tuple(a) for a in job['attachments']])
+
+
+class SessionPool(object):
+    """
+    Pool of at most *size* logged in sender objects, made by *factory*
+    (a callable returning a new SendMails-like object) and logged
+    with *login_name* and *password*. Connections idle for more
+    than *keepalive* seconds are checked with NOOP before use.
+    With a *controller* (an adaptive.HostController) the senders are
+    paced by it, which also limits the connections used at once.
+    """
+    def __init__(self, factory, login_name, password, size=2, keepalive=60,
+                 controller=None):
+        self.factory = factory
+        self.login_name = login_name
+        self.password = password
+        self.keepalive = keepalive
+        self.controller = controller
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(size)
+
+    def _new(self):
+        sender = self.factory()
+        sender.verbose = False
+        if self.controller is not None:
+            sender.controller = self.controller
+        if not sender.login(self.login_name, self.password):
+            raise DaemonError("can't login")
+        return sender
+
+    def acquire(self):
+        """Return a logged in sender, blocking if the pool is exhausted."""
+        if self.controller is not None:
+            self.controller.acquire()
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    sender, last_used = self._idle.pop()
+                if (time.time() - last_used < self.keepalive
+                        or sender.noop()):
+                    return sender
+                self._discard(sender)
+            return self._new()
+        except:
+            self._slots.release()
+            if self.controller is not None:
+                self.controller.release()
+            raise
+
+    def release(self, sender, reuse=True):
+        """Give back *sender*, which is closed if not *reuse*."""
+        try:
+            if reuse and sender.reset():
+                with self._lock:
+                    self._idle.append((sender, time.time()))
+            else:
+                self._discard(sender)
+        finally:
+            self._slots.release()
+            if self.controller is not None:
+                self.controller.release()
+
+    def _discard(self, sender):
+        try:
+            sender.quit()
+        except Exception:
+            pass
+
+    def ping(self):
+        """NOOP the connections idle since too long, drop the dead ones."""
+        now = time.time()
+        with self._lock:
+            stale = [i for i in self._idle if now - i[1] >= self.keepalive]
+            for item in stale:
+                self._idle.remove(item)
+        for sender, last_used in stale:
+            if sender.noop():
+                with self._lock:
+                    self._idle.append((sender, time.time()))
+            else:
+                self._discard(sender)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sender, last_used in idle:
+            self._discard(sender)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.process(json.loads(line.decode('utf-8')))
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {'ok': False, 'error': 'bad request: %s' % e}
+            except Exception as e:
+                reply = {'ok': False, 'error': str(e)}
+            try:
+                self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+                self.wfile.flush()
+            except socket.error:
+                break  # the client has gone
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve the send jobs on the unix socket *path* using *pool*."""
+    daemon_threads = True
+
+    def __init__(self, path, pool):
+        self.path = path
+        self.pool = pool
+        self._remove_stale_socket()
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        os.chmod(path, 0o600)
+        self._stop = threading.Event()
+        self._pinger = threading.Thread(target=self._keepalive)
+        self._pinger.daemon = True
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.path):
+            return
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(self.path)
+        except socket.error:
+            os.remove(self.path)
+        else:
+            raise DaemonError("daemon already running on %s" % self.path)
+        finally:
+            s.close()
+
+    def _keepalive(self):
+        while not self._stop.is_set():
+            self._stop.wait(max(1, self.pool.keepalive / 2.0))
+            self.pool.ping()
+
+    def process(self, request):
+        command = request.get('command')
+        if command == 'ping':
+            return {'ok': True}
+        elif command == 'send':
+            try:
+                msg = job_to_message(request['message'])
+            except EnvironmentError as e:  # e.g. a missing attachment
+                return {'ok': False, 'error': "can't make the message: %s" % e}
+            try:
+                sender = self.pool.acquire()
+            except (DaemonError, EnvironmentError) as e:
+                return {'ok': False, 'error': str(e)}
+            reply = {'ok': True, 'retval': 3}
+            reuse = False
+            try:
+                reply['retval'] = sender.send(msg, request['recipients'], True)
+                reply['sent'], reply['errors'] = sender.step, sender.errors
+                reuse = reply['retval'] != 3
+            except Exception as e:
+                # SMTP, socket or encoding errors: the session state is
+                # unknown, it's dropped.
+                reply = {'ok': False,
+                         'error': '%s: %s' % (type(e).__name__, e)}
+            finally:
+                self.pool.release(sender, reuse)
+            return reply
+        return {'ok': False, 'error': 'unknown command: %s' % command}
+
+    def run(self):
+        """Serve until interrupted (SIGINT or SIGTERM)."""
+        def _terminate(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, _terminate)
+        self._pinger.start()
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        self.server_close()
+        self.pool.close()
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+def request(path, req, timeout=None):
+    """Send *req* to the daemon listening on *path*, return the reply."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(path)
+        s.sendall((json.dumps(req) + '\n').encode('utf-8'))
+        f = s.makefile('rb')
+        line = f.readline()
+        f.close()
+    finally:
+        s.close()
+    if not line:
+        raise DaemonError("no reply from the daemon")
+    return json.loads(line.decode('utf-8'))
+
+
+class DaemonClient(SendMails):
+    """Sender object handing the jobs to a running daemon."""
+    __slots__ = ('path',)
+
+    def __init__(self, path=SOCKET_PATH):
+        super(DaemonClient, self).__init__(None, None, False, None)
+        self.path = path
+
+    def connect(self):
+        try:
+            self.connection = request(self.path, {'command': 'ping'})['ok']
+        except (socket.error, DaemonError, ValueError) as e:
+            print("ERROR: can't contact the daemon on %s: %s" % (self.path, e))
+            return False
+        return True
+
+    def login(self, login_name=None, pwd=None):
+        return self.connect()
+
+    def noop(self):
+        return self.connect()
+
+    def reset(self):
+        return True
+
+    def send(self, msg, receivers, keep_open=False):
+        self.total = len(receivers)
+        self.print_progress()
+        try:
+            reply = request(self.path, {'command': 'send',
+                                        'message': message_to_job(msg),
+                                        'recipients': list(receivers)})
+        except (socket.error, DaemonError, ValueError) as e:
+            print("\nError: %s" % e)
+            self.errors, self.retval = self.total, 3
+            return self.retval
+        if not reply['ok']:
+            print("\nError: %s" % reply['error'])
+            self.errors, self.retval = self.total, 3
+            return self.retval
+        self.step, self.errors = reply['sent'], reply['errors']
+        self.retval = reply['retval']
+        self.print_progress()
+        if self.verbose:
+            print()
+        return self.retval
+
+    def quit(self):
+        self.connection = None
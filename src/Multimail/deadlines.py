@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (deadlines.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# deadlines.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Deadlines of the SMTP sessions. In place of the single timeout of the
+sender objects, each phase of a session gets its own time (the socket
+timeout is set at the start of the phase, see esmtp.set_phase):
+    connect      opening the connection
+    greeting     the server banner, EHLO and STARTTLS
+    auth         the login
+    envelope     MAIL, RCPT, RSET and NOOP
+    data         the message, plus data_per_mb seconds each MiB
+and the whole run can be given a deadline, after which no more mails
+are sent. A connection stalled in a phase is replaced by a new one
+(see SendMails.send), at most MAX_RECYCLE times for each send.
+"""
+
+import time
+
+
+PHASES = ('connect', 'greeting', 'auth', 'envelope', 'data', 'data_per_mb')
+DEFAULTS = {'connect': 30.0, 'greeting': 30.0, 'auth': 30.0,
+            'envelope': 60.0, 'data': 60.0, 'data_per_mb': 30.0}
+MAX_RECYCLE = 3
+MIN_TIMEOUT = 0.01  # a zero timeout would make the socket non blocking
+
+
+class Deadlines(object):
+    """
+    Seconds allowed for each phase (see PHASES, the missing ones
+    take the sender *timeout* if given, else the DEFAULTS) and for
+    the whole *run* (from now, None for no limit).
+    """
+    __slots__ = PHASES + ('expires',)
+
+    def __init__(self, run=None, timeout=None, **phases):
+        for name in phases:
+            if name not in PHASES:
+                raise ValueError("unknown phase: %s" % name)
+        for name in PHASES:
+            default = DEFAULTS[name]
+            if timeout and name != 'data_per_mb':
+                default = float(timeout)
+            setattr(self, name, phases.get(name, default))
+        self.expires = time.time() + run if run else None
+
+    def remaining(self):
+        """Return the seconds left to the run deadline, or None."""
+        if self.expires is None:
+            return None
+        return max(0, self.expires - time.time())
+
+    def expired(self):
+        return self.expires is not None and time.time() >= self.expires
+
+    def timeout(self, phase, size=0):
+        """Return the seconds allowed for *phase*, sending *size*
+        bytes in the data one, within the run deadline."""
+        seconds = getattr(self, phase)
+        if phase == 'data':
+            seconds += self.data_per_mb * size / float(1 << 20)
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        return max(MIN_TIMEOUT, seconds)
+
+
+def parse(spec, run=None, timeout=None):
+    """
+    Return the Deadlines of *spec*, "phase=seconds" items separated
+    by spaces or commas, *run* and *timeout*. Raise ValueError.
+    """
+    phases = {}
+    for item in spec.replace(',', ' ').split():
+        name, sep, value = item.partition('=')
+        if name not in PHASES or not sep:
+            raise ValueError("unknown phase: %s" % name)
+        try:
+            phases[name] = float(value)
+        except ValueError:
+            raise ValueError("not a number: %s" % item)
+        if phases[name] <= 0:
+            raise ValueError("must be > 0: %s" % item)
+    return Deadlines(run, timeout, **phases)
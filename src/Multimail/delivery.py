@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (delivery.py module)
+
+# Copyright (C) 2009,2010,2011  Marco Chieppa (aka crap0101)
+
+# delivery.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Delivery backends. SendMails talks SMTP to a remote host, the other
+classes hand the messages to the local MTA (pickup directory or
+a sendmail-compatible executable) sharing the same interface and
+the same return codes of SendMails.send:
+    0   -> all messages delivered
+    255 -> some message not delivered
+    3   -> job aborted (disconnected from the server or MTA unusable)
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import socket
+import itertools
+import os.path as osp
+
+from Multimail.settings import DELIVERY_TYPES
+from Multimail.recipients import SENT, FAILED
+
+
+SENDMAIL_CMD = '/usr/sbin/sendmail -t -i'
+
+
+class DeliveryError(Exception):
+    pass
+
+
+def _size(message):
+    """Return the length of *message*, as given to _deliver."""
+    if isinstance(message, tuple):
+        headers, body = message
+        return len(headers) + body.size
+    return len(message)
+
+
+class SendMails(object):
+    __slots__ = ('host', 'port', 'secure_conn', 'starttls', 'debug_level',
+                 'timeout', 'delay_time', 'connection', 'step', 'errors',
+                 'total', 'retval', 'pipelining', 'verbose', 'controller',
+                 'deadlines', 'run_report', '_mark', '_eightbit', '_login',
+                 '_recycled')
+
+    # smtplib (and ssl) are imported only when really used,
+    # the other backends don't need them.
+    @property
+    def delivery_errors(self):
+        import smtplib
+        return (smtplib.SMTPDataError,
+                smtplib.SMTPRecipientsRefused,
+                smtplib.SMTPHeloError,
+                smtplib.SMTPSenderRefused,)
+
+    @property
+    def fatal_errors(self):
+        import smtplib
+        # a phase out of time (see deadlines) may end with a bare timeout.
+        return (smtplib.SMTPServerDisconnected, socket.timeout)
+
+    fatal_msg = 'Error: disconnected from the server: %s'
+
+    def __init__(self, host, port, secure_conn=True, timeout=50,
+                 starttls=False):
+        self.host = host
+        self.port = port
+        self.secure_conn = secure_conn
+        self.starttls = starttls
+        self.debug_level = 0
+        self.timeout = timeout
+        self.delay_time = 0
+        self.connection = None
+        self.step = 0
+        self.errors = 0
+        self.total = 0
+        self.retval = 0
+        self.pipelining = True
+        self.verbose = True
+        self.controller = None
+        self.deadlines = None
+        self.run_report = None
+        self._mark = None
+        self._eightbit = False
+        self._login = None
+        self._recycled = 0
+
+    def _connect(self):
+        # TODO: timeout not available in python < 2.6
+        import smtplib
+        from Multimail import esmtp
+        if self.secure_conn:
+            self.connection = esmtp.ESMTP_SSL(timeout=self.timeout)
+        else:
+            self.connection = esmtp.ESMTP(timeout=self.timeout)
+        self.connection.deadlines = self.deadlines
+        code, msg = self.connection.connect(self.host, self.port)
+        if code != 220:
+            raise smtplib.SMTPConnectError(code, msg)
+        if not self.secure_conn and self.starttls:
+            self.connection.starttls()
+            self.connection.ehlo()
+        self.connection.pipelining = self.pipelining
+        return self.connection
+
+    def connect(self):
+        import smtplib
+        try:
+            self._connect()
+        except (smtplib.SMTPException, socket.error) as e:
+            print("ERROR during connection: %s" % str(e))
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+            return False
+        return True
+
+    def delay(self):
+        time.sleep(self.delay_time)
+
+    def login(self, login_name, pwd=None):
+        """
+        Login as *login_name* with *pwd*, a password or a provider
+        (see the credentials module) which is asked again once if
+        refused; the password is prompted for if None.
+        """
+        import smtplib
+        from Multimail.credentials import CredentialError
+        if pwd is None:
+            import getpass
+            pwd = getpass.getpass()
+        self._login = (login_name, pwd)  # to login again, see _recycle
+        if self.connection is None:
+            if not self.connect():
+                return False
+        self.connection.set_debuglevel(self.debug_level)
+        try:
+            try:
+                self._authenticate(login_name, pwd)
+            except smtplib.SMTPAuthenticationError:
+                if not hasattr(pwd, 'invalidate'):
+                    raise
+                pwd.invalidate()  # may be expired, get a fresh one
+                self._authenticate(login_name, pwd)
+        except CredentialError as e:
+            print("Credentials Error: %s" % e)
+            return False
+        except smtplib.SMTPAuthenticationError as e:
+            print("Authentication Error: invalid userID or password")
+            return False
+        except smtplib.SMTPHeloError as e:
+            print("SMTPHelo Error: no response from %s" % self.host)
+            return False
+        except smtplib.SMTPException as e:
+            print("No suitable authentication method was found.")
+            return False
+        return True
+
+    def _authenticate(self, login_name, pwd):
+        import smtplib
+        self.connection.ehlo_or_helo_if_needed()
+        self.connection.set_phase('auth')
+        if getattr(pwd, 'mechanism', None) == 'XOAUTH2':
+            from Multimail.credentials import xoauth2
+            conn = self.connection
+            conn.ehlo_or_helo_if_needed()
+            code, resp = conn.docmd(
+                'AUTH', 'XOAUTH2 ' + xoauth2(login_name, pwd.get()))
+            if code == 334:  # the error details, cancel the exchange
+                code, resp = conn.docmd('')
+            if code != 235:
+                raise smtplib.SMTPAuthenticationError(code, resp)
+        else:
+            self.connection.login(
+                login_name, pwd.get() if hasattr(pwd, 'get') else pwd)
+
+    def accepts_8bit(self):
+        """True if the server takes 8bit message bodies (8BITMIME)."""
+        return (self.connection is not None
+                and bool(self.connection.has_extn('8bitmime')))
+
+    def _render(self, msg, receiver):
+        """
+        Return the message *msg* for *receiver*: its (headers, body)
+        parts if the connection can send them as they are (see
+        esmtp.PipeliningMixin.send_prepared), else the whole text.
+        """
+        if (hasattr(msg, 'get_parts')
+                and hasattr(self.connection, 'send_prepared')):
+            return msg.get_parts(receiver, self._eightbit)
+        return msg.get_message(receiver)
+
+    def _deliver(self, sender, receiver, message, index=None):
+        """Deliver a single *message* to *receiver* (the *index*-th)."""
+        options = ()
+        if self._eightbit:
+            options = ('BODY=8BITMIME',)
+        if isinstance(message, tuple):
+            headers, body = message
+            self.connection.send_prepared(sender, receiver, headers, body,
+                                          options)
+            return
+        if self._eightbit:
+            if not isinstance(message, bytes):
+                from Multimail import esmtp
+                message = esmtp.fix_eols(message.encode('utf-8'))
+        self.connection.sendmail(sender, receiver, message, options)
+
+    def _account(self, receiver, started, size, error=None):
+        """Record in the run_report (if any) the delivery to *receiver*
+        started at *started*, of *size* bytes or failed with *error*."""
+        if self.run_report is not None:
+            self.run_report.record(receiver, time.time() - started, size,
+                                   error)
+
+    def _sent(self, index):
+        """Account the delivery to the *index*-th receiver."""
+        if self._mark is not None:
+            self._mark(index, SENT)
+
+    def _failed(self, receiver, error, index=None):
+        """Account a failed delivery to *receiver* (the *index*-th)."""
+        self.errors += 1
+        if not self.retval:
+            self.retval = 255
+        if self._mark is not None and index is not None:
+            self._mark(index, FAILED, error)
+        print("%s [when sending to %s]" % (str(error), receiver))
+
+    def noop(self):
+        """Return True if the connection is still alive."""
+        import smtplib
+        try:
+            return self.connection.noop()[0] == 250
+        except (smtplib.SMTPException, socket.error):
+            return False
+
+    def reset(self):
+        """Abort the current transaction (if any), return True on success."""
+        import smtplib
+        try:
+            return self.connection.rset()[0] == 250
+        except (smtplib.SMTPException, socket.error):
+            return False
+
+    def send(self, msg, receivers, keep_open=False):
+        """
+        Send *msg* to each of *receivers*, then close the connection
+        unless *keep_open* is true. Return 0 on success, 255 if some
+        mail has not been sent or 3 if the job has been aborted.
+        If *receivers* is a recipients.RecipientTable (or a slice of
+        it) the outcome of each delivery is recorded in it. If the
+        controller attribute is set (see the adaptive module) the
+        deliveries are paced by it and their outcome reported to it.
+        With deadlines (see the deadlines module) the job is aborted
+        when the run deadline expires, and a stalled connection is
+        replaced by a new one (see _recycle). With a run_report (see
+        the report module) the outcome of each delivery is recorded.
+        """
+        self.retval = 0
+        self.step = self.errors = 0
+        self._recycled = 0
+        self._mark = getattr(receivers, 'mark', None)
+        self._eightbit = self.accepts_8bit()
+        if hasattr(msg, 'set_8bit'):
+            msg.set_8bit(self._eightbit)
+        self.total = len(receivers)
+        if self.run_report is not None:
+            self.run_report.expected += self.total
+        for n, rec in enumerate(receivers):
+            self.print_progress()
+            if self.deadlines is not None and self.deadlines.expired():
+                print("Error: run deadline expired")
+                aborted = True
+            else:
+                aborted = not self._send_one(msg, rec, n)
+            if aborted:
+                self.errors += self.total - self.step
+                self.retval = 3
+                break
+        if not keep_open:
+            self.quit()
+        self.print_progress()
+        if self.verbose:
+            print()
+        return self.retval
+
+    def _send_one(self, msg, rec, n):
+        """Send *msg* to *rec* (the *n*-th receiver), return False if
+        the job must be aborted."""
+        control = self.controller
+        while True:
+            if control is not None:
+                control.wait()
+            started = time.time()
+            try:
+                message = self._render(msg, rec)
+                self._deliver(msg.sender, rec, message, n)
+                self.step += 1
+                self._sent(n)
+                if control is not None:
+                    control.record(time.time() - started)
+                self._account(rec, started, _size(message))
+                self.delay()
+            except self.delivery_errors as e:
+                if control is not None:
+                    control.record(time.time() - started, e)
+                self._failed(rec, e, n)
+                self._account(rec, started, 0, e)
+            except self.fatal_errors as e:
+                if control is not None:
+                    control.record(time.time() - started, e)
+                if self.run_report is not None:
+                    self.run_report.error(e)
+                if self._recycle():
+                    continue  # again, with the new connection
+                print(self.fatal_msg % e)
+                return False
+            return True
+
+    def _recycle(self):
+        """
+        Replace the connection stalled in some phase (see deadlines)
+        with a new one, logged in again; at most MAX_RECYCLE times for
+        each send. Return True on success.
+        """
+        from Multimail.deadlines import MAX_RECYCLE
+        if (self.deadlines is None or self._recycled >= MAX_RECYCLE
+                or not getattr(self.connection, 'stalled', False)
+                or self.deadlines.expired()):
+            return False
+        self._recycled += 1
+        print("Warning: stalled in the %s phase, reconnecting"
+              % self.connection.phase)
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+        if self._login is None:
+            return self.connect()
+        return self.login(*self._login)
+
+    def print_progress(self, out=sys.stdout):
+        """Print the status of the job."""
+        if not self.verbose:
+            return
+        out.write("\r%d%% job completed... (%d errors)"
+            % (self.step*100/(self.total or 1), self.errors))
+        out.flush()
+
+    def quit(self):
+        import smtplib
+        if self.connection is None:  # a failed _recycle
+            return
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPServerDisconnected, socket.error):
+            self.connection.close()  # already lost (e.g. stalled)
+
+
+class PickupDirSender(SendMails):
+    """
+    Write each message in *pickup_dir*, from where the local MTA
+    picks it up. Messages are written in a temporary (dot) file and
+    then renamed, so the MTA never sees a partial message.
+    """
+    __slots__ = ('pickup_dir',)
+    delivery_errors = (IOError, OSError)
+    # shared by the senders of the process (daemon, shard node threads).
+    _counter = itertools.count(1)
+    fatal_errors = ()
+
+    def __init__(self, pickup_dir):
+        super(PickupDirSender, self).__init__(None, None, False, None)
+        self.pickup_dir = pickup_dir
+
+    def connect(self):
+        if not osp.isdir(self.pickup_dir):
+            print("ERROR: no such pickup directory: %s" % self.pickup_dir)
+            return False
+        if not os.access(self.pickup_dir, os.W_OK | os.X_OK):
+            print("ERROR: can't write into %s" % self.pickup_dir)
+            return False
+        self.connection = self.pickup_dir
+        return True
+
+    def login(self, login_name=None, pwd=None):
+        return self.connect()
+
+    def noop(self):
+        return self.connect()
+
+    def reset(self):
+        return True
+
+    def accepts_8bit(self):
+        return False  # nothing to negotiate with, stay 7bit safe
+
+    def _unique_name(self):
+        return "%d.%d_%d.%s" % (time.time(), os.getpid(),
+                                next(self._counter), socket.gethostname())
+
+    def _deliver(self, sender, receiver, message, index=None):
+        name = self._unique_name()
+        tmp_path = osp.join(self.pickup_dir, '.' + name)
+        if not isinstance(message, bytes):
+            message = message.encode('utf-8')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(message)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, osp.join(self.pickup_dir, name + '.eml'))
+        except (IOError, OSError):
+            if osp.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def quit(self):
+        self.connection = None
+
+
+class SendmailPipeSender(SendMails):
+    """
+    Pipe each message to a `sendmail -t` compatible command.
+    `sendmail -t` reads one message until EOF, so instead of long-lived
+    processes we keep up to *max_procs* of them in flight, reaping the
+    oldest when the pool is full; this way writing the next message
+    overlaps with the MTA queueing the previous ones.
+    """
+    __slots__ = ('command', 'max_procs', '_running')
+    delivery_errors = (DeliveryError,)
+    fatal_errors = (OSError,)
+    fatal_msg = 'Error: unable to run the sendmail command: %s'
+
+    def __init__(self, command=SENDMAIL_CMD, max_procs=4):
+        super(SendmailPipeSender, self).__init__(None, None, False, None)
+        if isinstance(command, str):
+            import shlex
+            command = shlex.split(command)
+        self.command = list(command)
+        self.max_procs = max(1, max_procs)
+        self._running = []
+
+    def connect(self):
+        exe = self.command[0] if self.command else ''
+        if not (osp.isfile(exe) and os.access(exe, os.X_OK)):
+            print("ERROR: can't execute the sendmail command: %s" % exe)
+            return False
+        self.connection = self._running
+        return True
+
+    def login(self, login_name=None, pwd=None):
+        return self.connect()
+
+    def noop(self):
+        return self.connect()
+
+    def reset(self):
+        return True
+
+    def accepts_8bit(self):
+        return False  # nothing to negotiate with, stay 7bit safe
+
+    def _sent(self, index):
+        pass  # known only when the command exits, see _reap
+
+    def _account(self, receiver, started, size, error=None):
+        if error is not None:  # else when the command exits, see _reap
+            SendMails._account(self, receiver, started, size, error)
+
+    def _reap(self, proc, receiver, index, started, size):
+        proc.wait()
+        if proc.returncode != 0:
+            self.step -= 1
+            error = DeliveryError("%s exited with status %d"
+                                  % (self.command[0], proc.returncode))
+            self._failed(receiver, error, index)
+            SendMails._account(self, receiver, started, 0, error)
+        else:
+            SendMails._sent(self, index)
+            SendMails._account(self, receiver, started, size)
+
+    def _deliver(self, sender, receiver, message, index=None):
+        if not isinstance(message, bytes):
+            message = message.encode('utf-8')
+        while len(self._running) >= self.max_procs:
+            self._reap(*self._running.pop(0))
+        import subprocess
+        started = time.time()
+        proc = subprocess.Popen(self.command, stdin=subprocess.PIPE)
+        try:
+            proc.stdin.write(message)
+            proc.stdin.close()
+        except IOError as e:
+            # the command exited early, its status tells why.
+            proc.wait()
+            raise DeliveryError("%s exited with status %d (%s)"
+                                % (self.command[0], proc.returncode, e))
+        self._running.append((proc, receiver, index, started, len(message)))
+
+    def _flush(self):
+        while self._running:
+            self._reap(*self._running.pop(0))
+
+    def send(self, msg, receivers, keep_open=False):
+        super(SendmailPipeSender, self).send(msg, receivers, keep_open)
+        if keep_open:
+            # collect the exit status of the running commands anyway.
+            self._flush()
+        return self.retval
+
+    def quit(self):
+        self._flush()
+        self.connection = None
+
+
+def get_sender(delivery, host=None, port=None, secure_conn=True,
+               timeout=50, pickup_dir=None, sendmail_cmd=SENDMAIL_CMD,
+               sendmail_procs=4, starttls=False, daemon_socket=None,
+               spool_dir=None):
+    """Return the sender object for the *delivery* type."""
+    if delivery == 'smtp':
+        return SendMails(host, port, secure_conn, timeout, starttls)
+    elif delivery == 'pickup':
+        return PickupDirSender(pickup_dir)
+    elif delivery == 'sendmail':
+        return SendmailPipeSender(sendmail_cmd, sendmail_procs)
+    elif delivery == 'daemon':
+        from Multimail import daemon
+        return daemon.DaemonClient(daemon_socket or daemon.SOCKET_PATH)
+    elif delivery == 'queue':
+        from Multimail import spool
+        return spool.QueueSubmitter(spool_dir or spool.SPOOL_DIR)
+    raise DeliveryError("Unknown delivery type: %s" % delivery)
@@ -25,8 +25,11 @@ This module implements a primitive text editor using curses.
 
 from __future__ import print_function
 
+import re
 import sys
+import codecs
 import tempfile
+import collections
 import subprocess
 try:
     import curses
@@ -37,6 +40,12 @@ except ImportError:
 import platform
 PYVERSION = int(platform.python_version_tuple()[0])
 
+# bracketed paste: the terminal sends the pasted text between these
+PASTE_ON, PASTE_OFF = '\x1b[?2004h', '\x1b[?2004l'
+PASTE_END = bytearray(b'\x1b[201~')
+_PASTE_START = -2
+_CONTROL_CHARS = re.compile('[\x00-\x08\x0b-\x1f\x7f]')
+
 class EditorError(Exception):
     pass
 
@@ -79,9 +88,80 @@ def _write_chr_test(func):
     return inner
 
 
+class GapBuffer(object):
+    """
+    A line of text stored as a gap buffer: inserting and deleting
+    at (or near) the last edited position is O(1) amortized.
+    """
+    GAP = 64
+
+    def __init__(self, text=''):
+        self._buf = list(text) + [None] * self.GAP
+        self._start = len(text)
+        self._end = len(self._buf)
+        self._rows = None
+
+    def __len__(self):
+        return len(self._buf) - (self._end - self._start)
+
+    def _move_gap(self, pos):
+        if pos < self._start:
+            n = self._start - pos
+            self._buf[self._end - n:self._end] = self._buf[pos:self._start]
+            self._start, self._end = pos, self._end - n
+        elif pos > self._start:
+            n = pos - self._start
+            self._buf[self._start:pos] = self._buf[self._end:self._end + n]
+            self._start, self._end = pos, self._end + n
+
+    def insert(self, pos, text):
+        """Insert *text* at *pos*."""
+        self._move_gap(pos)
+        if len(text) > self._end - self._start:
+            grow = max(len(text), len(self._buf)) + self.GAP
+            self._buf[self._end:self._end] = [None] * grow
+            self._end += grow
+        self._buf[self._start:self._start + len(text)] = text
+        self._start += len(text)
+        self._rows = None
+
+    def delete(self, pos, count=1):
+        """Delete *count* chars from *pos*."""
+        count = min(count, len(self) - pos)
+        if count > 0:
+            self._move_gap(pos)
+            self._end += count
+            self._rows = None
+
+    def text(self, start=0, end=None):
+        return ''.join(self._buf[:self._start]
+                       + self._buf[self._end:])[start:end]
+
+    def split(self, pos):
+        """Cut the text after *pos*, return it as a new GapBuffer."""
+        tail = GapBuffer(self.text(pos))
+        self.delete(pos, len(self) - pos)
+        return tail
+
+    def rows(self, width):
+        """Return the text wrapped in rows of *width* chars.
+        A full last row is followed by an empty one (the cursor's place).
+        """
+        if self._rows is None or self._rows[0] != width:
+            text = self.text()
+            self._rows = (width, [text[i:i + width]
+                                  for i in range(0, len(text) + 1, width)])
+        return self._rows[1]
+
+
 class Editor(object):
     """
-    Primitive text editor using the curses library
+    Primitive text editor using the curses library.
+    The text is a list of GapBuffer lines of unlimited length, soft
+    wrapped at the window width; the window scrolls to follow the
+    cursor and only the changed rows are redrawn. Pasted text (and
+    any burst of typed chars already queued) is inserted at once,
+    with a single redraw.
     KEYS:
         C-h  > shifted delete, delete the previous character
         C-d  > delete the char at the current position
@@ -94,29 +174,38 @@ class Editor(object):
         PAG↓ > move down by self.changePage lines
         ARROW(↑ ↓ → ←) > move up/down/right/left by one.
         C-g  > exit
+    *win* is the curses window to use, if None initialize curses
+    and use the whole screen.
     """
-    def __init__(self, encoding='UTF-8'):
+    def __init__(self, encoding='UTF-8', win=None):
         self.CODE = encoding
-        self.buffer = []
-        curses.setupterm()
-        self.win = curses.initscr()
+        self.buffer = ''
+        self._own_term = win is None
+        if self._own_term:
+            curses.setupterm()
+            win = curses.initscr()
+            curses.nl()
+            curses.noecho()
+            self._term_write(PASTE_ON)
+        self.win = win
         self.win.idlok(1)
         self.win.scrollok(True)
-        curses.nl()
-        curses.echo()
-        curses.newwin(0, 0)
-        self._start_point = (0, 0)
+        self.win.keypad(1)
         y, x = self.win.getmaxyx()
-        self.maxY, self.maxX = y - 1, x - 1
+        self.screenY, self.maxX = y - 1, x - 1
+        self.width = x
         del y, x
-        self.yMaxPoint, self.xMaxPoint = 0, 0
         self.changePage = 10
-        self._new_line = [''] *(self.maxX + 1)
-        self.table = [self._new_line[:] for i in range(self.maxY + 1)]
+        self.lines = [GapBuffer()]
         self._actualY, self._actualX = (0, 0)
+        self._top = (0, 0)  # (line, row) shown first
+        self._frame = [None] * (self.screenY + 1)  # the rows on the screen
+        self._keys = collections.deque()  # input read but not yet used
+        self._decoder = codecs.getincrementaldecoder(encoding)('replace')
 
     def edit(self):
         """ start editing. Exit with C-g. """
+        self._update_win()
         while True:
             try:
                 if not self._get_chr():
@@ -125,228 +214,281 @@ class Editor(object):
                 pass
         self.quit_curses()
 
+    def _term_write(self, seq):
+        sys.stdout.write(seq)
+        sys.stdout.flush()
+
     #@_write_chr_test
     def _scan(self):
-        """Get the next input """
-        return self.win.getch()
-
-    def _insert_line(self, line):
-        """Insert a line at the given position """
-        self.table.insert(self._actualY, line)
-        self.table.pop()
-
-    def _fill(self, line):
-        """Fill ``line'' with the missing positions """
-        toFill = len([_f for _f in self.table[line] if _f])
-        self.table[line].extend([''] *(self.maxX - toFill))
-        del self.table[line][self.maxX:]
+        """Get the next input, waiting for it if none is queued """
+        if not self._keys:
+            self._keys.append(self.win.getch())
+            self._read_pending()
+        return self._keys.popleft()
+
+    def _read_pending(self):
+        """Queue all the input available without waiting"""
+        self.win.nodelay(1)
+        try:
+            c = self.win.getch()
+            while c != -1:
+                self._keys.append(c)
+                c = self.win.getch()
+        finally:
+            self.win.nodelay(0)
+
+    @staticmethod
+    def _is_text(c):
+        return 32 <= c < 127 or 128 <= c < 256 or c in (10, ascii.CR)
+
+    def _read_text(self, c):
+        """Return the text starting with the byte *c* and continuing
+        with the text bytes already queued."""
+        data = bytearray([c])
+        while self._keys and self._is_text(self._keys[0]):
+            data.append(self._keys.popleft())
+        return self._decoder.decode(bytes(data))
+
+    def _read_paste(self):
+        """Return the pasted text, until the end of paste sequence."""
+        data = bytearray()
+        while not data.endswith(PASTE_END):
+            data.append(self._scan())
+        return self._decoder.decode(bytes(data[:-len(PASTE_END)]))
+
+    def _escape(self):
+        """Translate the escape sequences not handled by keypad."""
+        keys = {(79, 72): curses.KEY_HOME, (79, 70): curses.KEY_END,
+                (91, 65): curses.KEY_UP, (91, 66): curses.KEY_DOWN,
+                (91, 67): curses.KEY_RIGHT, (91, 68): curses.KEY_LEFT,
+                (91, 51): curses.KEY_DC, (91, 53): curses.KEY_PPAGE,
+                (91, 54): curses.KEY_NPAGE}
+        seq = (self._scan(), self._scan())
+        if seq in ((91, 51), (91, 53), (91, 54)):
+            self._scan()  # the final '~'
+        elif seq == (91, 50):  # ESC[200~ and ESC[201~, paste start/end
+            if (self._scan(), self._scan(), self._scan()) == (48, 48, 126):
+                return _PASTE_START
+        return keys.get(seq, -1)
+
+    def _nrows(self, line):
+        return len(self.lines[line]) // self.width + 1
+
+    def _distance(self, a, b, limit=None):
+        """Return the number of rows from the position *a* to *b*
+        (a <= b), stop counting after *limit*."""
+        (line, row), dist = a, -a[1]
+        while line < b[0] and (limit is None or dist <= limit):
+            dist += self._nrows(line)
+            line += 1
+        return dist + b[1]
+
+    def _move_rows(self, pos, count):
+        """Return the position *count* rows after (before if negative)
+        the (line, row) position *pos*."""
+        line, row = pos[0], pos[1] + count
+        while row < 0 and line > 0:
+            line -= 1
+            row += self._nrows(line)
+        while row >= self._nrows(line) and line < len(self.lines) - 1:
+            row -= self._nrows(line)
+            line += 1
+        return line, max(0, min(row, self._nrows(line) - 1))
+
+    def _vertical(self, count):
+        """Move the cursor by *count* rows."""
+        x = self._actualX
+        line, row = self._move_rows((self._actualY, x // self.width), count)
+        self._actualY = line
+        self._actualX = min(row * self.width + x % self.width,
+                            len(self.lines[line]))
 
     def _insert_chr(self, string):
-        """Insert the given char or string at the current position, moving
-        right the line by the length's input """
-        self.table[self._actualY].insert(self._actualX, string)
-        self.table[self._actualY].pop()
-
-    def _cancel_back(self, y, x):
-        """Delete the char at the current position, moving left the
-        current line or up to 1 the next line """
-        self._delete_chr()
-        if y < self.maxY:
-            chrs = [_f for _f in self.table[y][x:] if _f]
-            nextl = [_f for _f in self.table[y + 1] if _f]
-            if not chrs and len(nextl) < self.maxX - x + 1:
-                del self.table[y][x:]
-                self.table[y].extend(self.table[y + 1])
-                self._fill(y)
-                del self.table[y + 1]
-                self.table.append(self._new_line[:])
-
-    def _delete_chr(self):
-        """Delete the char at the current position, moving
-        right the line by the input length """
-        self.table[self._actualY].pop(self._actualX)
-        self.table[self._actualY].append('')
-
-    def _delete_line(self):
-        """Delete the line at the actual position """
-        del self.table[self._actualY]
-        self.table.append(self._new_line[:])
+        """Insert the given char or string at the current position"""
+        self.lines[self._actualY].insert(self._actualX, string)
+        self._actualX += len(string)
+
+    def _insert_text(self, text):
+        """Insert *text*, which may be many lines long, at the
+        current position"""
+        text = text.replace('\r\n', '\n').replace('\r', '\n').expandtabs(8)
+        parts = _CONTROL_CHARS.sub('', text).split('\n')
+        if len(parts) == 1:
+            return self._insert_chr(parts[0])
+        tail = self.lines[self._actualY].split(self._actualX)
+        self._insert_chr(parts[0])
+        new = [GapBuffer(part) for part in parts[1:]]
+        self._actualX = len(new[-1])
+        new[-1].insert(self._actualX, tail.text())
+        self.lines[self._actualY + 1:self._actualY + 1] = new
+        self._actualY += len(new)
+
+    def _new_line(self):
+        """Break the line at the current position"""
+        tail = self.lines[self._actualY].split(self._actualX)
+        self._actualY += 1
+        self._actualX = 0
+        self.lines.insert(self._actualY, tail)
+
+    def _join(self, y):
+        """Join the line *y* with the next one"""
+        self.lines[y].insert(len(self.lines[y]), self.lines[y + 1].text())
+        del self.lines[y + 1]
+
+    def _cancel_back(self):
+        """Delete the char at the current position, or join the next
+        line if at the end of the line"""
+        line = self.lines[self._actualY]
+        if self._actualX < len(line):
+            line.delete(self._actualX)
+        elif self._actualY < len(self.lines) - 1:
+            self._join(self._actualY)
+
+    def _delete_back(self):
+        """Delete the previous char, or join with the previous line"""
+        if self._actualX > 0:
+            self._actualX -= 1
+            self.lines[self._actualY].delete(self._actualX)
+        elif self._actualY > 0:
+            self._actualY -= 1
+            self._actualX = len(self.lines[self._actualY])
+            self._join(self._actualY)
 
     def _cut_until_eol(self):
         """Cut the line from the actual position until the EOL
-        and save that in the buffer """
-        self.buffer = self.table[self._actualY][self._actualX:self.maxX + 1]
-        del self.table[self._actualY][self._actualX:]
-        self.table[self._actualY].extend([''] * len(self.buffer))
-        self._fill(self._actualY)
-
-    def _paste(self):
-        """Paste the buffer's content at the current position, moving
-        right the line by the buffer length """
-        for char in [_f for _f in self.buffer if _f]:
-            self.table[self._actualY].insert(self._actualX, char)
-            self._actualX += 1
-        self._fill(self._actualY)
-        if self._actualX > self.maxX:
-            self._actualX = self.maxX
-
-    def _goto_max(self, line):
-        """ go to the position of the last chr of line 'line' """
-        self._actualY = line
-        newX = len([_f for _f in self.table[self._actualY] if _f])
-        if self._actualX > newX:
-            self._actualX = newX
+        and save that in the buffer; remove the line if cutted whole."""
+        line = self.lines[self._actualY]
+        self.buffer = line.text(self._actualX)
+        line.delete(self._actualX, len(self.buffer))
+        if self._actualX == 0 and len(self.lines) > 1:
+            del self.lines[self._actualY]
+            self._actualY = min(self._actualY, len(self.lines) - 1)
 
     def _get_chr(self):
         """ get the user input and perform the right job... I suppose. """
-        y, x = self._actualY, self._actualX
-        self.win.move(y, x)
-        curses.noecho()
-        self.win.refresh()
         c = self._scan()
-        if (c >= 32) and(c < 127):
-            self._insert_chr(chr(c))
-            if x < self.maxX:
-                self._actualX += 1
-            elif y < self.maxY:
-                self._actualY += 1
-                self._actualX = 0
-        elif(c >= 194) and(c < 224):
-            self._insert_chr(''.join(
-                    chr(c) + chr(self._scan())).decode(self.CODE))
-            if x < self.maxX:
+        if c == 27:
+            c = self._escape()
+        if c == _PASTE_START:
+            self._insert_text(self._read_paste())
+        elif self._is_text(c):
+            self._insert_text(self._read_text(c))
+        elif c == curses.KEY_ENTER:
+            self._new_line()
+        elif c in (8, ascii.DEL, curses.KEY_BACKSPACE, curses.KEY_SDC):
+            self._delete_back()  # C-h, shifted delete( <- )
+        elif c in (4, curses.KEY_DC, curses.KEY_CANCEL): # C-d - delete
+            self._cancel_back()
+        elif c in (ascii.VT, curses.KEY_EOL): # C-k |delete from cursor to EOL
+            self._cut_until_eol()
+        elif c == ascii.NAK: # C-u(past text from self.buffer)
+            self._insert_chr(self.buffer)
+        elif c in (15, ascii.SI): # C-o(insert blank line)
+            self._actualY += 1
+            self._actualX = 0
+            self.lines.insert(self._actualY, GapBuffer())
+        elif c == curses.KEY_HOME:
+            self._actualY, self._actualX = 0, 0
+        elif c == curses.KEY_END:
+            self._actualY = len(self.lines) - 1
+            self._actualX = len(self.lines[-1])
+        elif c == curses.KEY_PPAGE:
+            self._vertical(-self.changePage)
+        elif c == curses.KEY_NPAGE:
+            self._vertical(self.changePage)
+        elif c == curses.KEY_UP:
+            self._vertical(-1)
+        elif c == curses.KEY_DOWN:
+            self._vertical(1)
+        elif c == curses.KEY_RIGHT:
+            if self._actualX < len(self.lines[self._actualY]):
                 self._actualX += 1
-            elif y < self.maxY:
+            elif self._actualY < len(self.lines) - 1:
                 self._actualY += 1
                 self._actualX = 0
-        elif c in(curses.KEY_ENTER, 10, ascii.CR):  # carriage return
-            if y < self.maxY:
-                if any([_f for _f in self.table[y][x:] if _f]):
-                    self._cut_until_eol()
-                    self._actualY += 1
-                    self._actualX = 0
-                    self._insert_line(self._new_line[:])
-                    self._paste()
-                    self._actualX = 0
-                else:
-                    self._actualY += 1
-                    self._actualX = 0
-                    self._insert_line([''] *(self.maxX + 1))
-        elif c in(8, ascii.DEL, curses.KEY_SDC): # C-h, shifted delete( <- )
-            if x > 0:
+        elif c == curses.KEY_LEFT:
+            if self._actualX > 0:
                 self._actualX -= 1
-                self._delete_chr()
-            elif x == 0 and(0 < y <= self.maxY):  # -%%%?<+
-                _buffer = self.table[self._actualY][:]
-                self._actualX = self.maxX # trick for _goto_max
-                self._goto_max(self._actualY - 1)
-                _delta = self.maxX - self._actualX + 1
-                chrs = [_f for _f in _buffer if _f]
-                del self.table[self._actualY + 1]
-                if len(chrs) < _delta:
-                    self.table.append(self._new_line[:])
-                    del self.table[self._actualY][self._actualX:]
-                    self.table[self._actualY].extend(chrs)
-                    self._fill(self._actualY)
-                else:
-                    del self.table[self._actualY][self._actualX:]
-                    self.table[self._actualY].extend(chrs[:_delta])
-                    self.table.insert(self._actualY + 1, chrs[_delta:])
-                    self._fill(self._actualY + 1)
-            else:
-                self._delete_line()
-        elif c in(4, curses.KEY_CANCEL): # C-d - delete
-            self._cancel_back(y, x)
-        elif c == 27:
-            _c = self._scan()
-            _cc = self._scan()
-            if _c == 79:
-                if _cc == 72 or c == curses.KEY_HOME:   # start
-                    self._actualY, self._actualX = self._start_point
-                elif _cc == 70 or c == curses.KEY_END:    # end
-                    self._goto_max(self.maxY)
-            elif _c == 91:
-                if _cc == 51 or c == curses.KEY_CANCEL:
-                    self._scan()
-                    self._cancel_back(y, x)
-                elif _cc == 53 or c == curses.KEY_PPAGE:
-                    if(y - self.changePage) > 0:
-                        self._scan()
-                        self._goto_max(self._actualY - self.changePage)
-                    else:
-                        self._scan()
-                        self._goto_max(0)
-                elif _cc == 54 or c == curses.KEY_NPAGE:
-                    if self.maxY >(y + self.changePage):
-                        self._scan()
-                        self._goto_max(self._actualY + self.changePage)
-                    else:
-                        self._scan()
-                        self._goto_max(self.maxY)
-                elif _cc == 65 or c == curses.KEY_UP:
-                    if y > 0:
-                        self._goto_max(self._actualY - 1)
-                elif _cc == 66 or c == curses.KEY_DOWN:
-                    if y < self.maxY:
-                        self._goto_max(self._actualY + 1)
-                elif _cc == 67 or c == curses.KEY_RIGHT:
-                    if x < self.maxX:
-                        if x < len([_f for _f in self.table[y] if _f]):
-                            self._actualX += 1
-                        elif y < self.maxY:
-                            self._actualY += 1
-                            self._actualX = 0
-                    elif y < self.maxY:
-                        self._actualY += 1
-                        self._actualX = 0
-                elif _cc == 68 or c == curses.KEY_LEFT:
-                    if x > 0:
-                        self._actualX -= 1
-                    elif x <= 0 and y > 0:
-                        self._actualX = self.maxX # trick for _goto_max
-                        self._goto_max(self._actualY - 1)
-                else:
-                    curses.beep()
-            else:
-                curses.beep()
-        elif c in(ascii.VT, curses.KEY_EOL): # C-k |delete from cursor to EOL
-            self._cut_until_eol()
-            if self._actualX == 0:
-                del self.table[self._actualY]
-                self.table.append(self._new_line[:])
-        elif c == ascii.NAK: # C-u(past text from self.buffer)
-            self._paste()
-        elif c in(15, ascii.SI): # C-o(insert blank line)
-            if y < self.maxY:
-                self._actualY += 1
-                self._insert_line([''] *(self.maxX + 1))
-        elif c in(ascii.BEL, curses.KEY_END, curses.KEY_EXIT): # C-g(exit)
+            elif self._actualY > 0:
+                self._actualY -= 1
+                self._actualX = len(self.lines[self._actualY])
+        elif c in (ascii.BEL, curses.KEY_EXIT): # C-g(exit)
             return False
         else:
             curses.beep()
-        self._update_win()
+        if not self._keys:
+            self._update_win()
         return True
 
+    def _scroll(self):
+        """Scroll the window to show the current position."""
+        top = (min(self._top[0], len(self.lines) - 1), self._top[1])
+        top = (top[0], min(top[1], self._nrows(top[0]) - 1))
+        cur = (self._actualY, self._actualX // self.width)
+        if cur < top:
+            new = cur
+        elif self._distance(top, cur, self.screenY) > self.screenY:
+            new = self._move_rows(cur, -self.screenY)
+        else:
+            self._top = top
+            return
+        if new > top:
+            delta = self._distance(top, new, self.screenY)
+        else:
+            delta = -self._distance(new, top, self.screenY)
+        self._top = new
+        if abs(delta) > self.screenY:
+            self._frame = [None] * (self.screenY + 1)
+        else:
+            self.win.scrl(delta)
+            fill = [None] * abs(delta)
+            if delta > 0:
+                self._frame = self._frame[delta:] + fill
+            else:
+                self._frame = fill + self._frame[:delta]
+
+    def _screen_rows(self):
+        """Return the text rows to be shown."""
+        rows, size = [], self.screenY + 1
+        line, row = self._top
+        while len(rows) < size and line < len(self.lines):
+            wrapped = self.lines[line].rows(self.width)
+            rows.extend(wrapped[row:row + size - len(rows)])
+            line, row = line + 1, 0
+        return rows + [''] * (size - len(rows))
+
     def _update_win(self):
-        """ update the window with the content of the table """
-        self.win.move(*self._start_point)
-        self.win.clrtobot()
-        y = self._start_point[0]
-        for n, line in enumerate(self.table):
-            lineNum = y + n
-            self.win.move(lineNum, 0)
-            for pos, x in enumerate(line):
-                self.win.insstr(lineNum, pos, x.encode(self.CODE))
+        """ update the window, redrawing only the changed rows """
+        self._scroll()
+        for n, text in enumerate(self._screen_rows()):
+            if self._frame[n] != text:
+                self.win.move(n, 0)
+                self.win.clrtoeol()
+                if text:
+                    self.win.insstr(n, 0, self._encode(text))
+                self._frame[n] = text
+        cur = (self._actualY, self._actualX // self.width)
+        self.win.move(self._distance(self._top, cur),
+                      self._actualX % self.width)
+        self.win.noutrefresh()
+        curses.doupdate()
+
+    def _encode(self, text):
+        if PYVERSION < 3:
+            return text.encode(self.CODE, 'replace')
+        return text
 
     def save_text(self):
-        """ return a string, the content of the table """
-        return '\n'.join(''.join(line).encode(self.CODE)
-                          for line in self.table).rstrip()
+        """ return a string, the content of the editor """
+        return self._encode('\n'.join(line.text()
+                                      for line in self.lines).rstrip())
 
     def quit_curses(self):
         """Do the proper things before exiting such as de-initialize the
         curses library and return the terminal to normal status.
         """
+        if self._own_term:
+            self._term_write(PASTE_OFF)
         curses.endwin()
         curses.nocbreak()
         self.win.keypad(0)
@@ -376,7 +518,7 @@ def use_curses_editor():
     return text
 
 if __name__ == '__main__':
-    if YOU_HAVE_CURSES and PYVERSION < 3:
+    if YOU_HAVE_CURSES:
         print(use_curses_editor())
     else:
         print(no_curses())
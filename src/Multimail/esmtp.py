@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (esmtp.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# esmtp.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+smtplib.SMTP subclasses using the PIPELINING (RFC 2920) and
+CHUNKING (RFC 3030) extensions when advertised by the server.
+The envelope commands are sent at once and their replies read
+afterwards, so a transaction costs one round trip (plus one for
+the end of data when the server doesn't know BDAT) instead of one
+per command. With CHUNKING the body is sent as is in BDAT chunks,
+without the dot-stuffed copy made by smtplib.SMTP.data.
+Same exceptions and return value of smtplib.SMTP.sendmail.
+
+The classes also share a single SSLContext (see get_tls_context)
+remembering the TLS session of every host, so reconnecting (both
+with STARTTLS and with implicit TLS) resumes the previous session
+instead of paying a full handshake.
+
+A message sent to many recipients can be given as its headers and
+a PreparedBody (see send_prepared): the body is converted (line
+endings, quoted periods) once and sent as is to every recipient,
+from a temporary file with socket.sendfile if big.
+
+With deadlines (see the deadlines module) every phase of the session
+sets its own socket timeout (see set_phase).
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import time
+import smtplib
+import tempfile
+import threading
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+CRLF = b'\r\n'
+CHUNK_SIZE = 1 << 20
+SPOOL_SIZE = 4 << 20  # bigger bodies are kept in a temporary file
+
+_eols = re.compile(br'\r\n|\r|\n')
+_periods = re.compile(br'(?m)^\.')
+
+
+def fix_eols(data):
+    """Return *data* (bytes) with all the line endings as CRLF."""
+    return _eols.sub(CRLF, data)
+
+def quote_periods(data):
+    return _periods.sub(b'..', data)
+
+
+class PreparedBody(object):
+    """
+    The body of a message (what follows the headers) made once for
+    all its recipients: the line endings converted to CRLF and, the
+    first time it's sent with DATA, the periods quoted. Bodies bigger
+    than *spool_size* bytes (None for no limit) are kept in temporary
+    files, sent with socket.sendfile (without copies in python, on the
+    plain connections).
+    """
+    def __init__(self, data, spool_size=SPOOL_SIZE):
+        data = fix_eols(data)
+        self.spool_size = spool_size
+        self.size = len(data)
+        self._parts = {False: self._keep(data)}
+        self._sizes = {False: self.size}
+        self._lock = threading.RLock()
+
+    def _keep(self, data):
+        if self.spool_size is None or len(data) <= self.spool_size:
+            return data
+        f = tempfile.TemporaryFile()
+        f.write(data)
+        f.flush()
+        return f
+
+    def get(self, stuffed=False):
+        """Return the body, or its DATA version if *stuffed*, as
+        bytes or as a temporary file."""
+        with self._lock:
+            if stuffed not in self._parts:
+                data = quote_periods(self.getvalue())
+                if data[-2:] != CRLF:
+                    data += CRLF
+                self._sizes[True] = len(data)
+                self._parts[True] = self._keep(data)
+            return self._parts[stuffed]
+
+    def length(self, stuffed=False):
+        self.get(stuffed)
+        return self._sizes[stuffed]
+
+    def getvalue(self, stuffed=False):
+        """Return the body (see get) as bytes."""
+        part = self.get(stuffed)
+        if isinstance(part, bytes):
+            return part
+        with self._lock:
+            part.seek(0)
+            return part.read()
+
+    def sendfile(self, sock, stuffed, start, end):
+        """Send the *start*:*end* bytes of the spooled body on *sock*."""
+        part = self.get(stuffed)
+        if (hasattr(os, 'sendfile') and hasattr(sock, 'sendfile')
+                and not (ssl is not None and isinstance(sock, ssl.SSLSocket))):
+            # uses the given offset, not the file position.
+            sock.sendfile(part, start, end - start)
+            return
+        with self._lock:
+            part.seek(start)
+            while start < end:
+                data = part.read(min(CHUNK_SIZE, end - start))
+                if not data:
+                    raise IOError("truncated message body")
+                sock.sendall(data)
+                start += len(data)
+
+    def close(self):
+        """Remove the temporary files."""
+        with self._lock:
+            for part in self._parts.values():
+                if not isinstance(part, bytes):
+                    part.close()
+            self._parts.clear()
+
+
+_tls_context = None
+_tls_sessions = {}
+
+def get_tls_context():
+    """
+    Return the SSLContext shared by all the connections (a TLS
+    session can be resumed only by the context which created it).
+    Like smtplib's default context, the server certificate isn't
+    verified; use set_tls_context for a stricter one.
+    Return None if SSLContext isn't available (python < 2.7.9).
+    """
+    global _tls_context
+    if _tls_context is None and hasattr(ssl, 'SSLContext'):
+        context = ssl.SSLContext(getattr(ssl, 'PROTOCOL_TLS_CLIENT',
+                                         ssl.PROTOCOL_SSLv23))
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        _tls_context = context
+    return _tls_context
+
+def set_tls_context(context):
+    """Use *context* for the next connections."""
+    global _tls_context
+    _tls_context = context
+    _tls_sessions.clear()
+
+def wrap_socket(sock, host, key):
+    """Wrap *sock* resuming the TLS session saved for *key*, if any."""
+    context = get_tls_context()
+    if context is None:
+        return ssl.wrap_socket(sock)
+    session = _tls_sessions.get(key)
+    if session is not None:
+        return context.wrap_socket(sock, server_hostname=host,
+                                   session=session)
+    return context.wrap_socket(sock, server_hostname=host)
+
+
+# not derived from object: smtplib.SMTP is an old-style class in python2
+class PipeliningMixin:
+    """Mixin for smtplib.SMTP classes, see the module docstring."""
+    pipelining = True
+    chunk_size = CHUNK_SIZE
+    deadlines = None
+    phase = None
+    _phase_end = None
+    sock = None  # py2 smtplib sets it only on connect
+    _tls_key = None
+
+    def _get_socket(self, host, port, timeout):
+        self._tls_key = (host, port)
+        if not getattr(self, '_host', None):
+            self._host = host  # set by __init__ only, used by starttls
+        if self.deadlines is not None:
+            timeout = self.deadlines.timeout('connect')
+        sock = smtplib.SMTP._get_socket(self, host, port, timeout)
+        self.set_phase('greeting', sock=sock)
+        return sock
+
+    def set_phase(self, phase, size=0, sock=None):
+        """Start the *phase* of the session (see the deadlines module),
+        *size* bytes to send: the socket timeout is set to its time."""
+        if self.deadlines is None:
+            return
+        timeout = self.deadlines.timeout(phase, size)
+        self.phase = phase
+        self._phase_end = time.time() + timeout
+        sock = sock or self.sock
+        if sock is not None:
+            sock.settimeout(timeout)
+
+    @property
+    def stalled(self):
+        """True if the last phase ran out of its time."""
+        return self._phase_end is not None and time.time() >= self._phase_end
+
+    def _save_tls_session(self):
+        session = getattr(self.sock, 'session', None)
+        if session is not None and self._tls_key is not None:
+            _tls_sessions[self._tls_key] = session
+
+    @property
+    def tls_resumed(self):
+        """True if the TLS session has been resumed."""
+        return getattr(self.sock, 'session_reused', False)
+
+    def starttls(self, *args, **kwargs):
+        """Like smtplib.SMTP.starttls, but using the shared context."""
+        self.ehlo_or_helo_if_needed()
+        self.set_phase('greeting')
+        if not self.has_extn('starttls'):
+            raise getattr(smtplib, 'SMTPNotSupportedError',
+                          smtplib.SMTPException)(
+                "STARTTLS extension not supported by server.")
+        code, resp = self.docmd('STARTTLS')
+        if code != 220:
+            raise smtplib.SMTPResponseException(code, resp)
+        self.sock = wrap_socket(self.sock, getattr(self, '_host', None),
+                                self._tls_key)
+        self.file = None
+        # RFC 3207: forget what the server said before the TLS negotiation.
+        self.helo_resp = None
+        self.ehlo_resp = None
+        self.esmtp_features = {}
+        self.does_esmtp = False
+        return code, resp
+
+    def ehlo(self, name=''):
+        self.set_phase('greeting')
+        reply = smtplib.SMTP.ehlo(self, name)
+        self._save_tls_session()
+        return reply
+
+    def rset(self):
+        self.set_phase('envelope')
+        return smtplib.SMTP.rset(self)
+
+    def noop(self):
+        self.set_phase('envelope')
+        return smtplib.SMTP.noop(self)
+
+    def quit(self):
+        self.set_phase('envelope')
+        return smtplib.SMTP.quit(self)
+
+    def close(self):
+        self._save_tls_session()
+        smtplib.SMTP.close(self)
+
+    def _reset(self):
+        try:
+            self.rset()
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    def _sendv(self, buffers):
+        """Send *buffers* (a list of bytes objects or memoryviews)."""
+        if self.debuglevel > 0:
+            for buf in buffers:
+                if isinstance(buf, memoryview):
+                    buf = buf.tobytes()
+                print('send:', repr(buf[:200]))
+        if self.sock is None:
+            raise smtplib.SMTPServerDisconnected('please run connect() first')
+        try:
+            try:
+                total = sum(len(b) for b in buffers)
+                sent = self.sock.sendmsg(buffers)
+            except (AttributeError, NotImplementedError):
+                # no scatter/gather I/O (python2, ssl sockets)
+                total = sent = 0
+                for buf in buffers:
+                    self.sock.sendall(buf)
+            if sent < total:
+                self.sock.sendall(b''.join(bytes(b) for b in buffers)[sent:])
+        except (OSError, IOError):
+            self.close()
+            raise smtplib.SMTPServerDisconnected('Server not connected')
+
+    def _envelope(self, from_addr, to_addrs, mail_options, rcpt_options):
+        mopts = ''.join(' ' + o for o in mail_options)
+        ropts = ''.join(' ' + o for o in rcpt_options)
+        lines = ['MAIL FROM:%s%s' % (smtplib.quoteaddr(from_addr), mopts)]
+        lines.extend('RCPT TO:%s%s' % (smtplib.quoteaddr(r), ropts)
+                     for r in to_addrs)
+        return lines
+
+    def _replies(self, from_addr, to_addrs):
+        """Read the replies to the pipelined envelope commands.
+        Return the MAIL reply and the dict of refused recipients.
+        """
+        mail_reply = self.getreply()
+        refused = {}
+        for rec in to_addrs:
+            code, resp = self.getreply()
+            if code not in (250, 251):
+                refused[rec] = (code, resp)
+        return mail_reply, refused
+
+    def _check(self, from_addr, to_addrs, mail_reply, refused, data_reply):
+        """Raise the same exceptions of smtplib.SMTP.sendmail."""
+        code, resp = mail_reply
+        if code != 250:
+            if code == 421:
+                self.close()
+            else:
+                self._reset()
+            raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+        if len(refused) == len(to_addrs):
+            self._reset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, resp = data_reply
+        if code != 250:
+            if code == 421:
+                self.close()
+            else:
+                self._reset()
+            raise smtplib.SMTPDataError(code, resp)
+
+    def _send_body(self, body, stuffed, start=0, end=None,
+                   before=(), after=()):
+        """Send the *start*:*end* bytes of *body* (a PreparedBody)
+        between the *before* and *after* buffers."""
+        part = body.get(stuffed)
+        if end is None:
+            end = body.length(stuffed)
+        if isinstance(part, bytes):
+            return self._sendv(list(before) + [memoryview(part)[start:end]]
+                               + list(after))
+        if before:
+            self._sendv(list(before))
+        if self.debuglevel > 0:
+            print('send: <%d bytes of the spooled body>' % (end - start))
+        try:
+            body.sendfile(self.sock, stuffed, start, end)
+        except (OSError, IOError):
+            self.close()
+            raise smtplib.SMTPServerDisconnected('Server not connected')
+        if after:
+            self._sendv(list(after))
+
+    def sendmail(self, from_addr, to_addrs, msg,
+                 mail_options=(), rcpt_options=()):
+        self.ehlo_or_helo_if_needed()
+        if not (self.pipelining and self.does_esmtp
+                and self.has_extn('pipelining')):
+            self.set_phase('data', len(msg))
+            return smtplib.SMTP.sendmail(self, from_addr, to_addrs, msg,
+                                         list(mail_options),
+                                         list(rcpt_options))
+        if not isinstance(msg, bytes):
+            msg = msg.encode('ascii')
+        return self.send_prepared(from_addr, to_addrs, b'',
+                                  PreparedBody(msg, None),
+                                  mail_options, rcpt_options)
+
+    def send_prepared(self, from_addr, to_addrs, headers, body,
+                      mail_options=(), rcpt_options=()):
+        """
+        Like sendmail, the message being *headers* (bytes, ending with
+        the empty line) followed by *body* (a PreparedBody), which are
+        sent without joining them or copying the body.
+        """
+        self.ehlo_or_helo_if_needed()
+        headers = fix_eols(headers)
+        if not (self.pipelining and self.does_esmtp
+                and self.has_extn('pipelining')):
+            self.set_phase('data', len(headers) + body.size)
+            return smtplib.SMTP.sendmail(self, from_addr, to_addrs,
+                                         headers + body.getvalue(),
+                                         list(mail_options),
+                                         list(rcpt_options))
+        if isinstance(to_addrs, (type(''), type(u''))):
+            to_addrs = [to_addrs]
+        mail_options = list(mail_options)
+        if self.has_extn('size'):
+            mail_options.append('SIZE=%d' % (len(headers) + body.size))
+        lines = self._envelope(from_addr, to_addrs, mail_options, rcpt_options)
+        self.set_phase('envelope')
+        if self.has_extn('chunking'):
+            return self._send_bdat(from_addr, to_addrs, lines, headers, body)
+        return self._send_data(from_addr, to_addrs, lines, headers, body)
+
+    def _send_data(self, from_addr, to_addrs, lines, headers, body):
+        lines.append('DATA')
+        self._sendv([('\r\n'.join(lines) + '\r\n').encode('ascii')])
+        mail_reply, refused = self._replies(from_addr, to_addrs)
+        data_reply = self.getreply()
+        if data_reply[0] == 354:
+            if mail_reply[0] == 250 and len(refused) < len(to_addrs):
+                self.set_phase('data', len(headers) + body.size)
+                self._send_body(body, True,
+                                before=[quote_periods(headers)],
+                                after=[b'.' + CRLF])
+            else:
+                # nothing to deliver, but the server is waiting for data.
+                self._sendv([b'.' + CRLF])
+            data_reply = self.getreply()
+        self._check(from_addr, to_addrs, mail_reply, refused, data_reply)
+        return refused
+
+    def _send_bdat(self, from_addr, to_addrs, lines, headers, body):
+        size = body.size
+        # the envelope goes with the data, and so its replies.
+        self.set_phase('data', len(headers) + size)
+        buffers = [('\r\n'.join(lines) + '\r\n').encode('ascii')]
+        n_chunks = 0
+        if headers and size:
+            buffers.append(('BDAT %d\r\n' % len(headers)).encode('ascii'))
+            buffers.append(headers)
+            n_chunks += 1
+        elif headers:
+            body = PreparedBody(headers, None)
+            size = body.size
+        start = 0
+        while True:
+            end = min(start + self.chunk_size, size)
+            last = ' LAST' if end == size else ''
+            buffers.append(('BDAT %d%s\r\n' % (end - start, last)).encode('ascii'))
+            self._send_body(body, False, start, end, before=buffers)
+            buffers = []
+            n_chunks += 1
+            start = end
+            if last:
+                break
+        mail_reply, refused = self._replies(from_addr, to_addrs)
+        data_reply = (250, b'')
+        for i in range(n_chunks):
+            reply = self.getreply()
+            if data_reply[0] == 250:
+                data_reply = reply
+        self._check(from_addr, to_addrs, mail_reply, refused, data_reply)
+        return refused
+
+
+class ESMTP(PipeliningMixin, smtplib.SMTP):
+    pass
+
+
+class ESMTP_SSL(PipeliningMixin, smtplib.SMTP_SSL):
+    def _get_socket(self, host, port, timeout):
+        sock = PipeliningMixin._get_socket(self, host, port, timeout)
+        return wrap_socket(sock, getattr(self, '_host', host), self._tls_key)
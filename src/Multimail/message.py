@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (message.py module)
+
+# Copyright (C) 2009,2010,2011  Marco Chieppa (aka crap0101)
+
+# message.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+
+import os.path as osp
+try:                                               # __
+    from email.mime.text import MIMEText           #   |--  email formatting
+except ImportError:                                #   |
+    from email.MIMEText import MIMEText            #   | some email's module
+try:                                               #   | subpackages has been
+    from email.mime.base import MIMEBase           #   | renamed nor moved, so
+except ImportError:                                #   | we can try to import
+    from email.MIMEBase import MIMEBase            #   | the right module
+try:                                               #   | for running Python's
+    from email.mime.multipart import MIMEMultipart #   | version above 2.1
+except ImportError:                                #   |
+    from email.MIMEMultipart import MIMEMultipart  #   |______
+try:                                                      #   |
+    from email.mime.nonmultipart import MIMENonMultipart  #   |
+except ImportError:                                       #   |
+    from email.MIMENonMultipart import MIMENonMultipart   # __|
+
+import os
+import re
+import atexit
+import base64
+import shutil
+import binascii
+import tempfile
+try:
+    from collections import OrderedDict
+except ImportError:  # python2.6
+    OrderedDict = None
+
+from Multimail import mmutils
+from Multimail.parsopts import VERSION
+
+
+MAX_LINE = 998  # RFC 5322, without the CRLF
+MAX_CACHE = 32 * 1024 * 1024  # encoded attachments kept in memory
+SPOOL_SIZE = 4 * 1024 * 1024  # bigger parts go straight to a spool file
+SIGNED_DELIMITER = "=========multimail_signed========="
+RECEIVER_FIELDS = ('To', 'Date')  # the headers changing for each receiver
+_NON_ASCII = re.compile(br'[^\x00-\x7f]')
+_TRAILING_SPACE = re.compile(br'[ \t]\r?$', re.M)
+_EOL = re.compile(br'\r?\n')
+_LONG_LINE = re.compile((r'[^\r\n]{%d}' % (MAX_LINE + 1)).encode('ascii'))
+try:
+    _b64encode = base64.encodebytes
+except AttributeError:
+    _b64encode = base64.encodestring
+
+
+def choose_encoding(data, eightbit=False):
+    """
+    Return the Content-Transfer-Encoding for the text *data* (bytes):
+    7bit for ascii text, 8bit if *eightbit* (the server advertises
+    8BITMIME), otherwise the smaller of quoted-printable and base64.
+    The lines longer than MAX_LINE need an encoding anyway.
+    """
+    if not _LONG_LINE.search(data):
+        if not _NON_ASCII.search(data):
+            return '7bit'
+        if eightbit and b'\0' not in data:
+            return '8bit'
+    qp_size = len(binascii.b2a_qp(data, False, True))
+    b64_size = (len(data) + 2) // 3 * 4
+    b64_size += b64_size // 76 + 1  # the line breaks
+    return 'quoted-printable' if qp_size <= b64_size else 'base64'
+
+
+def encode_body(data, encoding):
+    """Return the text *data* (bytes) encoded with *encoding*,
+    as a (native) string to use as payload."""
+    if encoding == 'quoted-printable':
+        data = binascii.b2a_qp(data, False, True)
+    elif encoding == 'base64':
+        data = _b64encode(data)
+    if str is bytes:
+        return data
+    return data.decode('ascii' if encoding in ('quoted-printable', 'base64')
+                       else 'utf-8')
+
+
+class AttachmentCache(object):
+    """
+    The base64 encoded attachments, keyed by (path, size, mtime) so a
+    file is read and encoded once however many times the messages are
+    built, and again only if it changes. At most *max_bytes* of encoded
+    data are kept in memory: the least recently used parts, and those
+    bigger than *spool_size*, are moved in temporary spool files.
+    """
+    def __init__(self, max_bytes=MAX_CACHE, spool_size=SPOOL_SIZE):
+        self.max_bytes = max_bytes
+        self.spool_size = spool_size
+        self.size = 0
+        self.hits = self.misses = 0
+        self._parts = OrderedDict() if OrderedDict is not None else {}
+        self._spooled = {}
+        self._keys = {}
+        self._dir = None
+        self._owner = None
+
+    def _key(self, path):
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            raise IOError(e.errno, e.strerror, path)
+        return (path, st.st_size, st.st_mtime)
+
+    def get(self, path):
+        """Return the base64 payload of the file *path*."""
+        path = osp.abspath(path)
+        key = self._key(path)
+        if self._keys.get(path, key) != key:
+            self._discard(self._keys[path])
+        if key in self._parts:
+            self.hits += 1
+            payload = self._parts.pop(key)
+            self._parts[key] = payload  # the most recently used now
+            return payload
+        if key in self._spooled:
+            self.hits += 1
+            with open(self._spooled[key]) as f:
+                return f.read()
+        self.misses += 1
+        with open(path, 'rb') as f:
+            payload = encode_body(f.read(), 'base64')
+        self._keys[path] = key
+        if len(payload) > self.spool_size:
+            self._spool(key, payload)
+        else:
+            self._parts[key] = payload
+            self.size += len(payload)
+            self._evict()
+        return payload
+
+    def _evict(self):
+        while self.size > self.max_bytes and len(self._parts) > 1:
+            if OrderedDict is not None:
+                key, payload = self._parts.popitem(last=False)
+            else:
+                key = next(iter(self._parts))
+                payload = self._parts.pop(key)
+            self.size -= len(payload)
+            self._spool(key, payload)
+
+    def _spool(self, key, payload):
+        if self._dir is None:
+            self._dir = tempfile.mkdtemp(prefix='multimail-parts-')
+            self._owner = os.getpid()
+        fd, path = tempfile.mkstemp(dir=self._dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(payload)
+        self._spooled[key] = path
+
+    def _discard(self, key):
+        payload = self._parts.pop(key, None)
+        if payload is not None:
+            self.size -= len(payload)
+        path = self._spooled.pop(key, None)
+        if path is not None:
+            os.remove(path)
+
+    def __len__(self):
+        return len(self._parts) + len(self._spooled)
+
+    def clear(self):
+        """Drop all the parts, removing the spool files."""
+        self._parts.clear()
+        self._spooled.clear()
+        self._keys.clear()
+        self.size = 0
+        if self._dir is not None and self._owner == os.getpid():
+            shutil.rmtree(self._dir, ignore_errors=True)
+        self._dir = None
+
+
+# shared by all the messages built by the process
+ATTACHMENTS = AttachmentCache()
+atexit.register(ATTACHMENTS.clear)
+
+
+class MailMessage(object):
+    """ Bare Mail object."""
+    __slots__ = ('sender', 'receiver', 'subject', 'text', 'attachments',
+                 'xmailer', 'delimiter', 'msg', '_prepared')
+
+    def __init__(self, sender, receiver, subject, text, attachments):
+        self.sender = sender
+        self.receiver = receiver
+        self.subject = subject
+        self.text = text
+        self.attachments = attachments
+        self.xmailer = VERSION
+        self.delimiter = "=========multimail_delimiter========="
+        self.msg = None
+        self._prepared = None
+
+    def sign(self, file, *args):
+        with open(file) as f:
+            self.text = f.read()
+
+
+def _encode(text, codec):
+    return text if isinstance(text, bytes) else text.encode(codec)
+
+
+class PlainMsg(MailMessage):
+    """Plain text mail object."""
+    __slots__ = ()
+
+    def __init__(self, sender, receiver, subject, text):
+        super(PlainMsg, self).__init__(
+            sender, receiver, subject, text, None);
+
+    def get_message(self, receiver=None):
+        receiver = receiver if receiver is not None else self.receiver
+        _time = mmutils.mail_format_time()
+        return ("From: %s\r\nTo: %s\r\nSubject: %s\r\n"
+                "Date: %s\r\nX-Mailer: %s\r\n\r\n%s"
+                % (self.sender, receiver, self.subject,
+                   _time, self.xmailer, self.text))
+
+    def get_parts(self, receiver=None, eightbit=False):
+        """
+        Return the message for *receiver* as its headers (bytes,
+        with the empty line ending them) and its body, an
+        esmtp.PreparedBody made once and shared by all the receivers
+        (see esmtp.PipeliningMixin.send_prepared). The message is
+        encoded in utf-8 if *eightbit*, else must be ascii.
+        """
+        from Multimail.esmtp import PreparedBody
+        receiver = receiver if receiver is not None else self.receiver
+        codec = 'utf-8' if eightbit else 'ascii'
+        prepared = self._prepared
+        if (prepared is None or prepared[0] is not self.text
+                or prepared[1] != codec):
+            prepared = self._prepared = (
+                self.text, codec, PreparedBody(_encode(self.text, codec)))
+        headers = ("From: %s\r\nTo: %s\r\nSubject: %s\r\n"
+                   "Date: %s\r\nX-Mailer: %s\r\n\r\n"
+                   % (self.sender, receiver, self.subject,
+                      mmutils.mail_format_time(), self.xmailer))
+        return _encode(headers, codec), prepared[2]
+
+
+class MimeMsg(MailMessage):
+    """
+    MIME mail object. The text is sent 7bit if ascii, 8bit if the
+    server accepts it (see set_8bit), otherwise quoted-printable or
+    base64, whichever is smaller (see choose_encoding).
+    """
+    __slots__ = ('text_type', 'eightbit', 'signer', '_text_part',
+                 '_signature', '_sig_part')
+
+    def __init__(self, sender, receiver, subject, text, ttype, attachments):
+        super(MimeMsg, self).__init__(
+            sender, receiver, subject, text, attachments)
+        self.text_type = ttype
+        self.eightbit = False
+        self.signer = self._signature = self._sig_part = None
+        self.build()
+
+    def _encode_text(self):
+        data = self.text
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        encoding = choose_encoding(data, self.eightbit)
+        if (encoding == '7bit' and self.signer is not None
+                and _TRAILING_SPACE.search(data)):
+            encoding = 'quoted-printable'  # may be stripped in transit
+        self._text_part.set_payload(encode_body(data, encoding))
+        del self._text_part['Content-Transfer-Encoding']
+        self._text_part['Content-Transfer-Encoding'] = encoding
+        self._prepared = None
+
+    def set_8bit(self, eightbit):
+        """Allow (or not) a 8bit text, re-encoding it if needed."""
+        if self.signer is not None:
+            return
+        if bool(eightbit) != self.eightbit:
+            self.eightbit = bool(eightbit)
+            self._encode_text()
+
+    def build(self):
+        self._prepared = None
+        subtype = 'html' if self.text_type == 'html' else 'plain'
+        self._text_part = MIMENonMultipart('text', subtype, charset='utf-8')
+        self._encode_text()
+        if not self.attachments:
+            content = self._text_part
+        else:
+            content = MIMEMultipart(boundary=self.delimiter)
+            del self._text_part['MIME-Version']
+            content.attach(self._text_part)
+            for attachment, _name in self.attachments:
+                to_attach = MIMEBase('application', "octet-stream")
+                to_attach.set_payload(ATTACHMENTS.get(attachment))
+                to_attach['Content-Transfer-Encoding'] = 'base64'
+                _name = osp.basename(attachment) if not _name else _name
+                to_attach.add_header(
+                    'Content-Disposition',
+                    'attachment; filename="%s"' % _name)
+                content.attach(to_attach)
+        if self.signer is not None:
+            self.msg = self._pgp_mime(content)
+        else:
+            self.msg = content
+            if not self.attachments:
+                self.msg['boundary'] = self.delimiter
+        self.msg['From'] = self.sender
+        self.msg['To'] = self.receiver
+        self.msg['Subject'] = self.subject
+        self.msg['Date'] = "NULL"
+        self.msg['X-Mailer'] = self.xmailer
+
+    def _pgp_mime(self, content):
+        """Return the multipart/signed message of *content*, whose
+        signature is submitted to the signer and added when ready."""
+        from Multimail import signing
+        del content['MIME-Version']
+        data = content.as_string()
+        if not isinstance(data, bytes):
+            data = data.encode('ascii')
+        self._signature = self.signer.submit(_EOL.sub(b'\r\n', data))
+        self._sig_part = MIMEBase('application', 'pgp-signature',
+                                  name='signature.asc')
+        self._sig_part.add_header('Content-Description',
+                                  'OpenPGP digital signature')
+        self._sig_part.add_header('Content-Disposition',
+                                  'attachment; filename="signature.asc"')
+        signed = MIMEMultipart('signed', boundary=SIGNED_DELIMITER,
+                               micalg=signing.MICALG,
+                               protocol=signing.PROTOCOL)
+        signed.attach(content)
+        signed.attach(self._sig_part)
+        return signed
+
+    def _add_signature(self):
+        """Wait for the PGP/MIME signature, if any, and add it."""
+        if self._signature is not None:
+            signature = self._signature.get()
+            if not isinstance(signature, str):
+                signature = signature.decode('ascii')
+            self._sig_part.set_payload(signature)
+            self._signature = None
+            self._prepared = None
+
+    def get_message(self, receiver=None, as_string=True):
+        receiver = receiver if receiver is not None else self.receiver
+        _time = mmutils.mail_format_time()
+        self._add_signature()
+        self.msg.replace_header('To', receiver)
+        self.msg.replace_header('Date', _time)
+        if as_string:
+            return self.msg.as_string()
+        return self.msg
+
+    def get_parts(self, receiver=None, eightbit=False):
+        """See PlainMsg.get_parts."""
+        from Multimail.esmtp import PreparedBody
+        receiver = receiver if receiver is not None else self.receiver
+        self._add_signature()
+        codec = 'utf-8' if eightbit else 'ascii'
+        if self._prepared is None or self._prepared[0] != codec:
+            # rendered once: only the RECEIVER_FIELDS change later.
+            head, sep, body = self.msg.as_string().partition('\n\n')
+            lines, skip = [], False
+            for line in head.split('\n'):
+                if skip and line[:1] in (' ', '\t'):
+                    continue  # folded
+                name = line.partition(':')[0]
+                skip = name in RECEIVER_FIELDS
+                lines.append((name, None if skip else line))
+            self._prepared = (codec, lines, PreparedBody(_encode(body, codec)))
+        codec, lines, body = self._prepared
+        values = {'To': receiver, 'Date': mmutils.mail_format_time()}
+        headers = ''.join('%s\r\n' % (line if line is not None else
+                                       '%s: %s' % (name, values[name]))
+                          for name, line in lines)
+        return _encode(headers + '\r\n', codec), body
+
+    def sign(self, file, detached):
+        if detached:
+            self.attachments.append((file, 'signature.sig'))
+        else:
+            super(MimeMsg, self).sign(file)
+        self.build()
+
+    def pgp_sign(self, signer):
+        """
+        Make a PGP/MIME (RFC 3156) signed message, the signature made
+        by *signer* (see signing.SignerPool). The text is never sent
+        8bit then, since the signed part must be 7bit.
+        """
+        self.signer = signer
+        self.eightbit = False
+        self.build()
@@ -22,18 +22,7 @@
 
 import os
 import time
-import datetime
-import shlex
-import subprocess as subp
 import os.path as osp
-import zipfile
-import tarfile
-import tempfile
-import platform
-try:
-    import ConfigParser as configparser
-except ImportError:
-    import configparser
 try:
     from itertools import izip_longest
 except ImportError:
@@ -52,6 +41,7 @@ class ArchiveClosing(object):
     def __enter__(self):
         return self.target
     def __exit__(self, exc_type, exc_value, traceback):
+        import tarfile, zipfile
         self.target.close()
         if exc_type is not None:
             if isinstance(self.target, tarfile.TarFile):
@@ -78,6 +68,7 @@ def create_archive(paths, arch_type, arch_path=None):
     provided) or raise ArchiveError if the archive type is not
     a supported one or the archive can't be created.
     """
+    import tarfile, tempfile, zipfile
     atype = arch_type.lower()
     if not arch_path:
         with tempfile.NamedTemporaryFile() as f:
@@ -119,12 +110,14 @@ def create_archive(paths, arch_type, arch_path=None):
 
 
 def build_gpg_cmd(exe, key, infile, outfile, detached):
+    import shlex
     s_type = '--clearsign' if not detached else '--detach-sig'
     cmdline = "%s --default-key %s --output %s %s %s" % (
         exe, key, outfile, s_type, infile)
     return shlex.split(cmdline)  #ValueError: (no closing quotation)
 
 def do_sign(cmdline, stdout=None, stderr=None):
+    import subprocess as subp
     try:
         return subp.check_call(cmdline, stdout=stdout, stderr=stderr), None
     except subp.CalledProcessError as e:
@@ -133,6 +126,7 @@ def do_sign(cmdline, stdout=None, stderr=None):
         return 1, str(e)
 
 def gpg_sign(gpg_exe, gpg_key_id, text, detach):
+    import tempfile
     with tempfile.NamedTemporaryFile() as fin:
         to_sign = fin.name
     with tempfile.NamedTemporaryFile() as fout:
@@ -152,27 +146,10 @@ def mail_format_time():
     Return the actual time and date as a string in a
     format compliant with the RFC2822 specification.
     """
+    import datetime
     du = datetime.datetime.utcnow()
     dl = datetime.datetime.now()
     diff = int(round((dl - du).seconds / 3600.0))
     _s = '-' if diff < 0 else '+' 
     return "%s %s%02d00" % (time.strftime(
         "%a, %d %b %Y %H:%M:%S", time.localtime()), _s, abs(diff))
-
-
-def read_config(file):
-    """Return a configparser object from *file*."""
-    config = configparser.ConfigParser()
-    config.readfp(open(file))
-    return config
-
-def fake_config(section):
-    opts = ["host", "port", "ssl_port", "secure_conn",
-            "timeout", "debug_mode", "delay", "editor",
-            "sender", "login", "password", "text_type",]
-    config = configparser.ConfigParser()
-    if section != 'DEFAULT':
-        config.add_section(section)
-    for opt in opts:
-        config.set(section, opt, '')
-    return config
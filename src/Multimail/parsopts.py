@@ -22,6 +22,8 @@
 import sys
 import argparse
 
+from Multimail.settings import DELIVERY_TYPES
+
 
 VERSION = 'multimail 2.2.2'
 
@@ -47,8 +49,11 @@ EXAMPLES:
 # compress the attachments:
 ~$ {prog} -f you@mail.foo -l login_name -r addr@1.bar addr@2.baz -a attach1 \
     attach2 -c bz2 -A arch_name -s subject -m mail_text -S -H host -P 465 -n
+# send in 4 shards, to the nodes started with `{prog} --shard-node host:8025`:
+~$ {prog} -f you@mail.foo --from-file list.txt -s subject -m mail_text \
+    --shards 4 --nodes node1:8025 node2:8025
 
-INTERNAL TEXT EDITOR KEYSTROKES (actually works only with Python < 3):
+INTERNAL TEXT EDITOR KEYSTROKES:
 ------------------------------------------------
   [CRTL + G]  >> save and quit
   [RETURN]    >> CR :)
@@ -61,30 +66,80 @@ INTERNAL TEXT EDITOR KEYSTROKES (actually works only with Python < 3):
   [CRTL + K]  >> delete from the cursor to the EOL
 ------------------------------------------------
 
+BATCH MANIFEST (--batch):
+---------------------------------
+[campaign_name]     ;; one section for each campaign
+profile = work      ;; config file section to use (default DEFAULT)
+subject = Hello
+text = text.txt     ;; the mail text, or the file to read it from
+recipients = a@b.org c@d.org
+recipients_file = list.txt ;; files with one recipient per line
+attachments = f1 d1 ;; optional, as -a|--attachments
+compression = gz    ;; optional, as -c|--compress
+archive_name = name ;; optional, as -A|--archive-name
+sign = clear        ;; optional, clear, detach or pgp-mime
+sender =            ;; optional, instead of the profile one
+text_type =         ;; optional, instead of the profile one
+---------------------------------
+
+PASSWORD SOURCES (--password-source):
+---------------------------------
+env:NAME            ;; the environment variable NAME
+fd:NUM              ;; the first line read from the file descriptor NUM
+cmd:COMMAND         ;; the first line printed by COMMAND (password_ttl)
+oauth2:FILE         ;; XOAUTH2 login, the access token got with the
+                    ;; token_url, client_id, client_secret and
+                    ;; refresh_token in the JSON FILE
+---------------------------------
+
 VALUE NAMES RECOGNIZED (IN THE CONFIG FILE):
 ---------------------------------
 sender =			;; email address
 login =				;; login name
 password =			;; login password
+password_source =   ;; where to get the password (see PASSWORD SOURCES)
+password_ttl = 300  ;; seconds a cmd: password is reused
 editor =			;; external text editor
 text_type = text		;; one of plain|text|html
 host = 	    			;; host to connect to
 secure_conn = true  ;; use ssl encryption
 port = 25           ;; used when secure_conn is false.
+starttls = false    ;; use STARTTLS (when secure_conn is false)
 ssl_port = 465      ;; used when secure_conn is true (ssl encryption)
 timeout = 50	    ;; timeout in seconds for blocking operations like the connection attempt
+phase_timeouts =    ;; seconds for each SMTP phase (see --phase-timeouts)
+run_deadline = 0    ;; seconds the whole sending can last (0 for no limit)
 debug_mode = 	    ;; no value for disable
 delay = 0           ;; delay between mail sending
+adaptive = false    ;; adapt the rate (and connections) to the server
+max_rate = 20       ;; max messages per second with adaptive
+sort_domains = false ;; send the mails sorted by the recipient domain
 gpg_key_id =        ;; gpg key ID for sign mails
 gpg_exe =           ;; path to the gpg executable
+sign_workers = 2    ;; gpg processes running at once (--pgp-mime)
+delivery = smtp     ;; one of smtp|pickup|sendmail|daemon|queue
+pickup_dir =        ;; the MTA pickup directory (delivery = pickup)
+sendmail_cmd = /usr/sbin/sendmail -t -i ;; (delivery = sendmail)
+sendmail_procs = 4  ;; max sendmail processes running at once
+pipelining = true   ;; use PIPELINING/CHUNKING if the server supports them
+daemon_socket =     ;; the daemon socket path (default ~/.multimail.sock)
+daemon_connections = 2 ;; max connections kept by the daemon
+keepalive = 60      ;; seconds between NOOPs on the idle connections
+spool_dir =         ;; the queue spool directory (default ~/.multimail-spool)
+queue_workers = 2   ;; worker processes used by --queue-run
+suppression_list =  ;; the bounced addresses (default ~/.multimail-suppressed)
+allow_domains =     ;; if set, send only to these domains (and subdomains)
+deny_domains =      ;; never send to these domains (and subdomains)
+reject_file =       ;; where to write the invalid recipients
+inherit =           ;; sections to take the empty values from
 ---------------------------------
-""".format(prog=sys.argv[0])
+"""
 
 
 def get_parser():
     parser = argparse.ArgumentParser(
         description=DESCRIPTION,
-        epilog=EPILOG,
+        epilog=EPILOG.format(prog=sys.argv[0]),
         formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('-a', '--attachments', dest='attachments', nargs='+',
                         metavar='FILE', default=[],
@@ -101,6 +156,16 @@ def get_parser():
                         help='make a (potentially) compressed archive'
                         ' of the attachment before attach them to the mail.'
                         ' "gz" and "bz2" creates a tar.(gz|bz2) archive.')
+    parser.add_argument('--batch', dest='batch', metavar='MANIFEST',
+                        help='send all the campaigns listed in the MANIFEST'
+                        ' file in one run, sharing the connections and the'
+                        ' attachment archives (see the BATCH MANIFEST'
+                        ' section below). The other message options are'
+                        ' ignored.')
+    parser.add_argument('--chunk', dest='chunk', type=int, default=50,
+                        metavar='NUM', help='with --batch, the number of'
+                        ' recipients of a campaign sent before moving to'
+                        ' the next one (default: 50).')
     parser.add_argument('-C', '--config-file', dest='custom_config_file',
                         help="Path to the config file from to read program's"
                         " configuration infos instead of the default one"
@@ -111,6 +176,34 @@ def get_parser():
                         metavar='NUM', help='number of seconds to wait'
                         ' for sending between each mail (can be a'
                         ' floating point number and must be >= 0.')
+    parser.add_argument('--deadline', type=float, dest='run_deadline',
+                        metavar='NUM', help='seconds the whole sending can'
+                        ' last: when expired, the mails left are not sent'
+                        ' (0 for no limit). If omitted, read from config'
+                        ' file.')
+    parser.add_argument('--adaptive', dest='adaptive', action='store_true',
+                        help='adapt the sending rate (and, in daemon mode,'
+                        ' the connections used) to the server replies,'
+                        ' slowing down when it defers the mails.')
+    parser.add_argument('--daemon', dest='daemon', action='store_true',
+                        help='run as a daemon: keep logged connections to'
+                        ' the server and send the mails submitted by other'
+                        ' multimail processes (see --delivery daemon) through'
+                        ' the unix socket --daemon-socket.')
+    parser.add_argument('--daemon-socket', dest='daemon_socket',
+                        metavar='PATH', help='path of the daemon socket'
+                        ' (default: ~/.multimail.sock).')
+    parser.add_argument('--delivery', dest='delivery',
+                        choices=DELIVERY_TYPES,
+                        help="how to deliver the mails: 'smtp' connects to"
+                        " the mail server, 'pickup' writes them in the local"
+                        " MTA pickup directory (see --pickup-dir), 'sendmail'"
+                        " pipes them to a `sendmail -t` compatible command"
+                        " (see --sendmail-cmd), 'daemon' hands them to a"
+                        " running multimail daemon (see --daemon), 'queue'"
+                        " puts them in the spool directory (see --spool-dir"
+                        " and --queue-run). If omitted, read from config file,"
+                        " default to 'smtp'.")
     parser.add_argument('-e', '--editor', dest='editor', metavar='PROG',
                         help='external text editor for writing email.'
                         'This option conflict with the -m|--text-msg option.')
@@ -142,30 +235,121 @@ def get_parser():
                         " needed by the program will be taked from the default"
                         " config file or from the one provided by the user"
                         " (see the -C|--config-file option).")
+    parser.add_argument('--no-pipelining', dest='pipelining',
+                        action='store_false', default=None,
+                        help="don't use the SMTP PIPELINING and CHUNKING"
+                        " extensions, even if the server supports them.")
     parser.add_argument('-p', '--password', dest='password', metavar='PASSWORD',
                         help='password for login to the mail server. If not'
                         ' provided will be asked to prompt it from stdin.')
+    parser.add_argument('--password-source', dest='password_source',
+                        metavar='SOURCE', help='get the password from'
+                        ' SOURCE (see PASSWORD SOURCES), instead of'
+                        ' prompting for it.')
     parser.add_argument('-P','--port', dest='port', metavar='NUM', type=int,
                         help='Port number for the connection. If omitted,'
                         ' tries to read the value in the config file.')
+    parser.add_argument('--pickup-dir', dest='pickup_dir', metavar='DIR',
+                        help='MTA pickup directory, used with'
+                        ' --delivery pickup.')
+    parser.add_argument('--plan', dest='plan', action='store_true',
+                        help='print how many recipients there are for each'
+                        ' domain (see --sort-domains), then exit without'
+                        ' sending.')
+    parser.add_argument('--priority', dest='priority', type=int, default=5,
+                        metavar='NUM', help='with --delivery queue, the'
+                        ' job priority from 0 to 9, jobs with lower values'
+                        ' are sent first (default: 5).')
+    parser.add_argument('--process-bounces', dest='process_bounces',
+                        nargs='+', metavar='MAILBOX', help='read the'
+                        ' delivery status notifications in the MAILBOX(es)'
+                        ' (mbox files or Maildirs) and record the bounced'
+                        ' addresses in the suppression list, then exit.')
+    parser.add_argument('--queue-run', dest='queue_run', action='store_true',
+                        help='process the jobs in the spool directory'
+                        ' (see --spool-dir and --workers) until interrupted.')
+    parser.add_argument('--queue-status', dest='queue_status',
+                        action='store_true', help='print the queue depth and'
+                        ' throughput of the spool directory and exit.')
+    parser.add_argument('--reject-file', dest='reject_file', metavar='FILE',
+                        help='append the invalid recipients, which are not'
+                        ' sent the mail, to FILE with the reason of the'
+                        ' rejection.')
+    parser.add_argument('--report', dest='report_file', metavar='FILE',
+                        help='at the end, print a summary of the sending'
+                        ' and write to FILE a JSON report of it: failures'
+                        ' by SMTP reply code and by error, outcome by'
+                        ' recipient domain, delivery time percentiles,'
+                        ' bytes and messages sent over time.')
     parser.add_argument('-r', '--recipients', dest='recipients', nargs='+',
                         metavar='EMAIL_ADDR', help='recipients of the mail.')
     parser.add_argument('--from-file', dest='from_file', nargs='+', default=[],
                         metavar='FILE', help='read recipients from FILE(s).'
                         ' FILE must have one recipient per line.')
+    parser.add_argument('--shards', dest='shards', type=int, default=0,
+                        metavar='NUM', help='split the recipients in NUM'
+                        ' shards (by a hash of the address), each one sent'
+                        ' by a worker process, or by a node (see --nodes).')
+    parser.add_argument('--nodes', dest='nodes', nargs='+', default=[],
+                        metavar='HOST:PORT', help='hand the shards out to'
+                        ' these nodes (see --shard-node), in turn. Without'
+                        ' --shards, one shard for each node.')
+    parser.add_argument('--shard-node', dest='shard_node',
+                        metavar='[HOST:]PORT', help='run as a node: send the'
+                        ' shards handed by the coordinators (see --nodes)'
+                        ' connecting to HOST:PORT (default host 127.0.0.1).'
+                        ' There is no authentication, listen on a trusted'
+                        ' network only.')
+    parser.add_argument('--sendmail-cmd', dest='sendmail_cmd',
+                        metavar='CMD', help='sendmail compatible command'
+                        ' reading the mail from stdin, used with --delivery'
+                        ' sendmail (default: "/usr/sbin/sendmail -t -i").')
     parser.add_argument('-S', '--SSL', dest='secure_conn', action='store_true',
                         help='Should be used for situations where SSL is'
                         ' required from the beginning of the connection. If'
                         ' omitted, read from config file. This option cause'
                         ' the program to use the smtplib.SMTP_SSL class,'
                         ' instead of the default smtplib.SMTP .')
+    parser.add_argument('--send-at', dest='send_at', metavar='"DATE TIME"',
+                        help='with --delivery queue, don\'t send the mails'
+                        ' before this local date and time, given as'
+                        ' "YYYY-MM-DD HH:MM".')
+    parser.add_argument('--spool-dir', dest='spool_dir', metavar='DIR',
+                        help='the queue spool directory'
+                        ' (default: ~/.multimail-spool).')
     parser.add_argument('-s', '--subject', dest='subject', metavar='TEXT',
                         help="email's subject. Without this option the"
                         " user will be asked to prompt the subject"
                         " (one line, read using raw_input())")
+    parser.add_argument('--suppression-list', dest='suppression_list',
+                        metavar='PATH', help='the suppression list updated'
+                        ' by --process-bounces: the addresses which bounced'
+                        ' too many times are not sent the mails (default:'
+                        ' ~/.multimail-suppressed).')
+    parser.add_argument('--sort-domains', dest='sort_domains',
+                        action='store_true', help='send the mails sorted'
+                        ' by the recipient domain (dropping the duplicated'
+                        ' addresses), so the server relaying them can reuse'
+                        ' the connections to each destination. Huge lists'
+                        ' are sorted in temporary files. If omitted, read'
+                        ' from config file, default to false.')
+    parser.add_argument('--starttls', dest='starttls', action='store_true',
+                        help='connect in plain text (to the -P|--port port,'
+                        ' usually 587) and then switch to TLS using the'
+                        ' STARTTLS command. Conflicts with -S|--SSL. If'
+                        ' omitted, read from config file.')
     parser.add_argument('-t', '--timeout', dest='timeout', type=int,
                         metavar='NUM', help='specifies a timeout in seconds'
                         ' for blocking operations like the connection attempt')
+    parser.add_argument('--phase-timeouts', dest='phase_timeouts',
+                        metavar='SPEC', help='seconds allowed for each phase'
+                        ' of the SMTP sessions in place of --timeout, as'
+                        ' phase=seconds items (of connect, greeting, auth,'
+                        ' envelope, data and data_per_mb, the seconds added'
+                        ' to data for each MiB), e.g. "connect=10 data=120";'
+                        ' the phases left out take the --timeout.'
+                        ' A connection stalled in a phase is replaced by a'
+                        ' new one. If omitted, read from config file.')
     parser.add_argument('-T', '--text-type', dest='text_type',
                         choices=('html', 'text', 'plain'),
                         help="The mail's text type. Default behavior is to"
@@ -178,6 +362,10 @@ def get_parser():
                          default='DEFAULT', help='Section name in the config'
                         ' file from which read settings. This make possible'
                         ' to have various configuration templates.')
+    parser.add_argument('--workers', dest='workers', type=int, metavar='NUM',
+                        help='number of worker processes (and so of'
+                        ' connections to the server) used by --queue-run.'
+                        ' If omitted, read from config file, default to 2.')
     parser.add_argument('-v', '--version', action='version',
                         version=VERSION)
     sig = parser.add_argument_group('signing mails', '(require GnuPG)')
@@ -187,6 +375,8 @@ def get_parser():
                      help='make a clear signature.')
     sig.add_argument('--detach-sign', dest='detach', action='store_true',
                      help='make a detached signature.')
+    sig.add_argument('--pgp-mime', dest='pgp_mime', action='store_true',
+                     help='make a PGP/MIME (RFC 3156) signed mail.')
     sig.add_argument('--gpg-exe', dest='gpg_exe', metavar='PATH',
                      help='Path to the gnuPG executable.')
     return parser
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (planner.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# planner.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Sending plan: the recipients sorted by domain, so the mails to the
+same domain go out one after another (and in the same chunks, see
+--batch) and the server relaying them reuses its connections to the
+destination. The (streamed) addresses are sorted in runs of run_size
+addresses, written to temporary files and then merged, so a list of
+any size is sorted in bounded memory. The duplicated addresses are
+dropped (the domains compared in any case, the local parts exactly)
+and the addresses of each domain counted for the report.
+"""
+
+import io
+import os
+import heapq
+import shutil
+import tempfile
+
+
+RUN_SIZE = 100000  # addresses sorted in memory at once
+
+
+def _key(address):
+    """Return the sort line of *address*: domain<TAB>address."""
+    local, at, domain = address.rpartition('@')
+    return u'%s\t%s@%s' % (domain.lower(), local, domain.lower())
+
+
+class Planner(object):
+    """
+    Sort the recipients by domain with runs of *run_size* addresses,
+    the temporary files made in *tmpdir* (default the system one).
+    """
+    def __init__(self, run_size=RUN_SIZE, tmpdir=None):
+        self.run_size = max(1, run_size)
+        self.tmpdir = tmpdir
+        self.domains = {}
+        self.total = self.duplicates = 0
+        self.runs = 0
+
+    def _write_run(self, lines, dirname):
+        lines.sort()
+        path = os.path.join(dirname, 'run%d' % self.runs)
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.writelines(line + u'\n' for line in lines)
+        self.runs += 1
+        return path
+
+    def _lines(self, addresses):
+        """Yield the sorted lines of *addresses*."""
+        lines = []
+        paths = []
+        dirname = None
+        try:
+            for address in addresses:
+                if not isinstance(address, type(u'')):
+                    address = address.decode('utf-8')
+                address = address.strip()
+                if not address:
+                    continue
+                lines.append(_key(address))
+                if len(lines) >= self.run_size:
+                    if dirname is None:
+                        dirname = tempfile.mkdtemp(dir=self.tmpdir)
+                    paths.append(self._write_run(lines, dirname))
+                    lines = []
+            if not paths:
+                lines.sort()
+                for line in lines:
+                    yield line
+                return
+            if lines:
+                paths.append(self._write_run(lines, dirname))
+                del lines
+            files = [io.open(p, encoding='utf-8') for p in paths]
+            try:
+                for line in heapq.merge(*files):
+                    yield line.rstrip(u'\n')
+            finally:
+                for f in files:
+                    f.close()
+        finally:
+            if dirname is not None:
+                shutil.rmtree(dirname, ignore_errors=True)
+
+    def sort(self, addresses):
+        """Yield the (streamed) *addresses* sorted by domain, without
+        the blank and the duplicated ones."""
+        last = None
+        for line in self._lines(addresses):
+            self.total += 1
+            if line == last:
+                self.duplicates += 1
+                continue
+            last = line
+            domain, tab, address = line.partition(u'\t')
+            self.domains[domain] = self.domains.get(domain, 0) + 1
+            yield address
+
+    def report(self, top=10):
+        """
+        Return the lines of the domain distribution: the *top* domains
+        by number of addresses (all if None), then the others summed.
+        """
+        sent = self.total - self.duplicates
+        lines = ["%d addresses, %d domains, %d duplicates dropped"
+                 % (sent, len(self.domains), self.duplicates)]
+        ranked = sorted(self.domains.items(), key=lambda i: (-i[1], i[0]))
+        shown = ranked if top is None else ranked[:top]
+        for domain, count in shown:
+            lines.append("  %-30s %8d %6.2f%%"
+                         % (domain, count, count * 100.0 / (sent or 1)))
+        others = ranked[len(shown):]
+        if others:
+            count = sum(c for d, c in others)
+            lines.append("  %-30s %8d %6.2f%%"
+                         % ('(%d others)' % len(others), count,
+                            count * 100.0 / (sent or 1)))
+        return lines
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (rcptreader.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# rcptreader.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Reading of big recipient files (one address per line). The file is
+mapped in memory and split in ranges of about range_size bytes ending
+with a newline; the ranges are parsed and checked (see addrcheck) by
+a pool of worker processes, each one making the RecipientTable of
+its range, which are merged in the file order (or as they come, if
+the order doesn't matter). A file of a single range is read by the
+calling process, with no pool.
+"""
+
+import io
+import os
+import mmap
+import multiprocessing as _mp
+
+from Multimail.recipients import RecipientTable
+
+
+RANGE_SIZE = 8 << 20  # bytes parsed by a worker at once
+try:
+    WORKERS = _mp.cpu_count()
+except NotImplementedError:
+    WORKERS = 2
+
+
+def split_ranges(path, size=RANGE_SIZE):
+    """Return the (start, end) byte ranges of the file *path*, of
+    about *size* bytes each and ending after a newline."""
+    with open(path, 'rb') as f:
+        length = os.fstat(f.fileno()).st_size
+        if not length:
+            return []  # can't map an empty file
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            ranges = []
+            start = 0
+            while start < length:
+                end = min(start + max(1, size), length)
+                if end < length:
+                    newline = mm.find(b'\n', end - 1)
+                    end = length if newline < 0 else newline + 1
+                ranges.append((start, end))
+                start = end
+        finally:
+            mm.close()
+    return ranges
+
+
+_checkers = {}
+
+def parse_range(path, start, end, allow=(), deny=()):
+    """
+    Return (table, rejected): the RecipientTable of the valid addresses
+    in the *start*:*end* bytes of *path* and the "address<TAB>reason"
+    lines of the invalid ones, checked with the *allow* and *deny*
+    domains (see addrcheck.Checker).
+    """
+    from Multimail.addrcheck import Checker
+    key = (tuple(allow), tuple(deny))
+    if key not in _checkers:
+        _checkers[key] = Checker(allow, deny)
+    checker = _checkers[key]
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = mm[start:end]
+        finally:
+            mm.close()
+    table = RecipientTable()
+    rejected = []
+    for line in data.decode('utf-8', 'replace').split(u'\n'):
+        if not line.strip():
+            continue
+        address, reason = checker.check(line)
+        if reason is None:
+            table.add(address)
+        else:
+            rejected.append(u'%s\t%s\n' % (address, reason))
+    return table, u''.join(rejected)
+
+
+def _parse(task):
+    return parse_range(*task)
+
+
+def read(path, allow=(), deny=(), workers=WORKERS, ordered=True,
+         range_size=RANGE_SIZE):
+    """
+    Yield the (table, rejected) of each range of *path* (see
+    parse_range), in the file order if *ordered*, parsed by *workers*
+    processes.
+    """
+    tasks = [(path, start, end, allow, deny)
+             for start, end in split_ranges(path, range_size)]
+    if workers < 2 or len(tasks) < 2:
+        for task in tasks:
+            yield _parse(task)
+        return
+    pool = _mp.Pool(min(workers, len(tasks)))
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(_parse, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parts(path, allow=(), deny=(), reject_file=None, workers=WORKERS,
+          ordered=True, range_size=RANGE_SIZE):
+    """
+    Yield (table, rejected) for each range of *path* as it is parsed
+    (see read): the RecipientTable of the valid addresses and the
+    number of the invalid ones, appended to *reject_file* (if given)
+    as in addrcheck.Checker.filter.
+    """
+    out = io.open(reject_file, 'a', encoding='utf-8') if reject_file else None
+    try:
+        for part, rejected in read(path, allow, deny, workers, ordered,
+                                   range_size):
+            if rejected and out is not None:
+                out.write(rejected)
+            yield part, rejected.count(u'\n')
+    finally:
+        if out is not None:
+            out.close()
+
+
+def load(path, table, allow=(), deny=(), reject_file=None, workers=WORKERS,
+         ordered=True, range_size=RANGE_SIZE):
+    """
+    Append the valid addresses in *path* to *table* (a RecipientTable),
+    and the invalid ones to *reject_file* (see parts). Return the
+    number of the invalid ones.
+    """
+    count = 0
+    for part, rejected in parts(path, allow, deny, reject_file, workers,
+                                ordered, range_size):
+        table.merge(part)
+        count += rejected
+    return count
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (recipients.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# recipients.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Compact recipient lists. A RecipientTable holds the addresses and
+their delivery state in a few flat arrays instead of a string object
+(plus its list slot) per address: the local parts are stored one
+after another in a single buffer, the domains are interned and
+referred by number, the status, attempts and last update time of
+each recipient are one array item each. The last error message is
+kept only for the failed recipients.
+
+A table (or a slice of it) can be given to the sender objects in
+place of a list of addresses: the outcome of each delivery is then
+recorded with mark().
+"""
+
+import time
+from array import array
+
+
+PENDING, SENT, FAILED = 0, 1, 2
+
+_NATIVE_BYTES = str is bytes
+try:
+    _OFFSET = array('Q').typecode  # the buffer can outgrow 4 GiB
+except ValueError:
+    _OFFSET = 'L'  # python 2: 64 bit, but on 32 bit systems and Windows
+
+
+class RecipientTable(object):
+    """Sequence of recipient addresses, built from *addresses*."""
+    __slots__ = ('_buffer', '_offsets', '_domain_ids', '_domains',
+                 '_domain_index', 'status', 'attempts', 'updated', 'errors')
+
+    def __init__(self, addresses=()):
+        self._buffer = bytearray()
+        self._offsets = array(_OFFSET, [0])
+        self._domain_ids = array('I')
+        self._domains = []
+        self._domain_index = {}
+        self.status = array('B')
+        self.attempts = array('B')
+        self.updated = array('I')
+        self.errors = {}
+        self.extend(addresses)
+
+    @classmethod
+    def from_file(cls, path):
+        """Return the table of the addresses in *path*, one per line."""
+        table = cls()
+        with open(path) as f:
+            table.extend(f)
+        return table
+
+    def add(self, address):
+        if _NATIVE_BYTES and not isinstance(address, bytes):
+            address = address.encode('utf-8')
+        local, at, domain = address.rpartition('@')
+        if not at:
+            local, domain = domain, ''
+        if not _NATIVE_BYTES:
+            local = local.encode('utf-8')
+        self._buffer.extend(local)
+        self._offsets.append(len(self._buffer))
+        self._domain_ids.append(self._domain_id(domain))
+        self.status.append(PENDING)
+        self.attempts.append(0)
+        self.updated.append(0)
+
+    def _domain_id(self, domain):
+        domain_id = self._domain_index.get(domain)
+        if domain_id is None:
+            domain_id = self._domain_index[domain] = len(self._domains)
+            self._domains.append(domain)
+        return domain_id
+
+    def extend(self, addresses):
+        """Add *addresses*, skipping the blank ones."""
+        for address in addresses:
+            address = address.strip()
+            if address:
+                self.add(address)
+
+    def merge(self, other):
+        """Append the recipients (and their state) of the table *other*."""
+        count = len(self)
+        base = self._offsets[-1]
+        self._buffer.extend(other._buffer)
+        self._offsets.extend(array(_OFFSET, [o + base for o in
+                                             other._offsets[1:]]))
+        ids = [self._domain_id(d) for d in other._domains]
+        if ids == list(range(len(ids))):
+            self._domain_ids.extend(other._domain_ids)
+        else:
+            self._domain_ids.extend(array('I', [ids[i] for i in
+                                                other._domain_ids]))
+        self.status.extend(other.status)
+        self.attempts.extend(other.attempts)
+        self.updated.extend(other.updated)
+        self.errors.update((n + count, e) for n, e in other.errors.items())
+
+    # __slots__ objects need these with the pickle protocols 0 and 1.
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def __len__(self):
+        return len(self.status)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("slice step not supported")
+            return RecipientView(self, start, max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("recipient index out of range")
+        local = bytes(self._buffer[self._offsets[index]:
+                                   self._offsets[index+1]])
+        if not _NATIVE_BYTES:
+            local = local.decode('utf-8')
+        domain = self._domains[self._domain_ids[index]]
+        return local + '@' + domain if domain else local
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def domain(self, index):
+        """Return the domain of the recipient at *index*."""
+        return self._domains[self._domain_ids[index]]
+
+    def domains(self):
+        """Return the (distinct) domains of the recipients."""
+        return list(self._domains)
+
+    def mark(self, index, status, error=None, when=None):
+        """Record a delivery attempt to the recipient at *index*."""
+        self.status[index] = status
+        self.attempts[index] = min(self.attempts[index] + 1, 255)
+        self.updated[index] = int(time.time() if when is None else when)
+        if error is not None:
+            self.errors[index] = str(error)
+        else:
+            self.errors.pop(index, None)
+
+    def count(self, status):
+        return self.status.count(status)
+
+    def indexes(self, status):
+        """Return the indexes of the recipients with *status*."""
+        return [n for n, s in enumerate(self.status) if s == status]
+
+    def failures(self):
+        """Return the (address, last error) of the failed recipients."""
+        return [(self[n], self.errors.get(n)) for n in self.indexes(FAILED)]
+
+
+class RecipientView(object):
+    """The recipients of *table* from *start* to *stop*."""
+    __slots__ = ('table', 'start', 'stop')
+
+    def __init__(self, table, start, stop):
+        self.table = table
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("recipient index out of range")
+        return self.table[self.start + index]
+
+    def __iter__(self):
+        for index in range(self.start, self.stop):
+            yield self.table[index]
+
+    def mark(self, index, status, error=None, when=None):
+        self.table.mark(self.start + index, status, error, when)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (report.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# report.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+End of run report (see --report): the outcome of each delivery is
+recorded by the sender object (see SendMails.run_report) and summed
+in counters, the failures by SMTP reply code and by exception class,
+the outcomes by recipient domain. The delivery times go in a
+histogram of logarithmic buckets (so the percentiles are exact to
+GROWTH), the messages and bytes sent in a timeline of fixed slots
+which are merged two by two when too many: the memory used doesn't
+grow with the recipients (only with the domains).
+"""
+
+import math
+import time
+
+
+GROWTH = 1.05        # ratio between two buckets of the histogram
+MIN_VALUE = 1e-4     # values below go in the first bucket
+MAX_SLOTS = 120      # of the timeline, see Timeline
+INTERVAL = 1.0       # starting seconds for each slot of the timeline
+
+
+class Histogram(object):
+    """Streaming histogram of positive values (seconds)."""
+    def __init__(self, growth=GROWTH, minimum=MIN_VALUE):
+        self.growth = growth
+        self.minimum = minimum
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = self.max = None
+
+    def add(self, value):
+        if value < self.minimum:
+            index = 0
+        else:
+            index = 1 + int(math.log(value / self.minimum)
+                            / math.log(self.growth))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """Return the *p* percentile (0-100) of the values, or None."""
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * p / 100.0)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                break
+        upper = self.minimum * self.growth ** index
+        return min(max(upper, self.min), self.max)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def as_dict(self):
+        return {'count': self.count, 'mean': self.mean(),
+                'min': self.min, 'max': self.max,
+                'p50': self.percentile(50), 'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
+class Timeline(object):
+    """
+    Messages and bytes sent in slots of *interval* seconds from
+    *start*; past *max_slots* the interval is doubled and the slots
+    merged two by two.
+    """
+    def __init__(self, start=None, interval=INTERVAL, max_slots=MAX_SLOTS):
+        self.start = time.time() if start is None else start
+        self.interval = interval
+        self.max_slots = max(2, max_slots)
+        self.messages = []
+        self.bytes = []
+
+    def add(self, size, when=None):
+        when = time.time() if when is None else when
+        slot = int(max(0, when - self.start) / self.interval)
+        while slot >= self.max_slots:
+            self._shrink()
+            slot = int(max(0, when - self.start) / self.interval)
+        if slot >= len(self.messages):
+            grow = slot + 1 - len(self.messages)
+            self.messages.extend([0] * grow)
+            self.bytes.extend([0] * grow)
+        self.messages[slot] += 1
+        self.bytes[slot] += size
+
+    def _shrink(self):
+        self.interval *= 2
+        for name in ('messages', 'bytes'):
+            slots = getattr(self, name)
+            setattr(self, name, [sum(slots[i:i+2])
+                                 for i in range(0, len(slots), 2)])
+
+    def as_dict(self):
+        return {'interval': self.interval, 'messages': list(self.messages),
+                'bytes': list(self.bytes)}
+
+
+def reply_code(error):
+    """Return the SMTP reply code of *error*, or None."""
+    code = getattr(error, 'smtp_code', None)
+    if code is None:
+        refused = getattr(error, 'recipients', None)  # SMTPRecipientsRefused
+        if isinstance(refused, dict) and refused:
+            code = list(refused.values())[0][0]
+    return code
+
+
+class RunReport(object):
+    """The outcome of the deliveries of a run."""
+    def __init__(self):
+        self.started = time.time()
+        self.ended = None
+        self.expected = 0
+        self.sent = self.failed = 0
+        self.bytes = 0
+        self.codes = {}
+        self.errors = {}
+        self.domains = {}
+        self.latency = Histogram()
+        self.timeline = Timeline(self.started)
+
+    def record(self, receiver, elapsed, size=0, error=None):
+        """
+        Record the delivery to *receiver* which lasted *elapsed* seconds,
+        of *size* bytes if done, else failed with *error*.
+        """
+        domain = receiver.rpartition('@')[2].lower()
+        counts = self.domains.setdefault(domain, [0, 0])
+        self.latency.add(elapsed)
+        if error is None:
+            self.sent += 1
+            self.bytes += size
+            counts[0] += 1
+            self.timeline.add(size)
+        else:
+            self.failed += 1
+            counts[1] += 1
+            self.error(error)
+
+    def error(self, error):
+        """Count *error* by reply code (if any) and class."""
+        code = reply_code(error)
+        if code is not None:
+            self.codes[code] = self.codes.get(code, 0) + 1
+        name = type(error).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def finish(self):
+        self.ended = time.time()
+
+    def elapsed(self):
+        return (self.ended or time.time()) - self.started
+
+    def as_dict(self):
+        elapsed = self.elapsed()
+        return {
+            'started': self.started, 'elapsed': elapsed,
+            'expected': self.expected, 'sent': self.sent,
+            'failed': self.failed,
+            'not_sent': max(0, self.expected - self.sent - self.failed),
+            'bytes': self.bytes,
+            'rate': self.sent / elapsed if elapsed > 0 else None,
+            'codes': dict((str(c), n) for c, n in self.codes.items()),
+            'errors': dict(self.errors),
+            'domains': dict((d, {'sent': s, 'failed': f,
+                                 'success': s / float(s + f)})
+                            for d, (s, f) in self.domains.items()),
+            'latency': self.latency.as_dict(),
+            'throughput': self.timeline.as_dict()}
+
+    def write(self, path):
+        """Write the report in *path* as JSON."""
+        import json
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1, sort_keys=True)
+            f.write('\n')
+
+    def summary(self, top=5):
+        """Return the lines of a short summary, with the *top* domains
+        by number of failures."""
+        elapsed = self.elapsed()
+        lines = ["%d sent, %d failed, %d not sent, %d bytes in %.1fs"
+                 " (%.1f mails/s)"
+                 % (self.sent, self.failed,
+                    max(0, self.expected - self.sent - self.failed),
+                    self.bytes, elapsed,
+                    self.sent / elapsed if elapsed > 0 else 0)]
+        if self.latency.count:
+            lines.append("latency: p50 %.3fs, p95 %.3fs, p99 %.3fs,"
+                         " max %.3fs" % (self.latency.percentile(50),
+                                         self.latency.percentile(95),
+                                         self.latency.percentile(99),
+                                         self.latency.max))
+        if self.codes:
+            lines.append("reply codes: " + ', '.join(
+                '%s x%d' % i for i in sorted(self.codes.items())))
+        if self.errors:
+            lines.append("errors: " + ', '.join(
+                '%s x%d' % i for i in sorted(self.errors.items())))
+        failing = sorted(((f, d, s) for d, (s, f) in self.domains.items()
+                          if f), reverse=True)[:top]
+        for failed, domain, sent in failing:
+            lines.append("  %-30s %6.2f%% sent (%d failed)"
+                         % (domain, sent * 100.0 / (sent + failed), failed))
+        return lines
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (settings.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# settings.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Typed settings. A config file section is parsed and validated once
+into a Settings object; the results are cached by file path and
+mtime, so asking again for the same (or another) section of an
+unchanged file doesn't read it again.
+
+A section can inherit from other sections:
+    [work]
+    inherit = common smtp-relay
+the options left empty in *work* take the value of the first of
+the inherited sections (recursively) which sets them, then of the
+DEFAULT section. Without *inherit*, a section behaves as usual.
+"""
+
+import os
+import os.path as osp
+try:
+    import ConfigParser as configparser
+except ImportError:
+    import configparser
+
+
+DELIVERY_TYPES = ('smtp', 'pickup', 'sendmail', 'daemon', 'queue')
+TEXT_TYPES = ('plain', 'text', 'html')
+
+_BOOLEANS = {'1': True, 'yes': True, 'true': True, 'on': True,
+             '0': False, 'no': False, 'false': False, 'off': False}
+
+
+class SettingsError(Exception):
+    pass
+
+
+def _string(value):
+    return value
+
+def _boolean(value):
+    try:
+        return _BOOLEANS[value.lower()]
+    except KeyError:
+        raise ValueError("not a boolean")
+
+def _number(conv, minimum):
+    def convert(value):
+        value = conv(value)
+        if value < minimum:
+            raise ValueError("must be >= %s" % minimum)
+        return value
+    return convert
+
+def _choice(choices):
+    def convert(value):
+        if value not in choices:
+            raise ValueError("must be one of %s" % list(choices))
+        return value
+    return convert
+
+def _names(value):
+    return tuple(value.replace(',', ' ').split())
+
+def _phases(value):
+    from Multimail import deadlines
+    deadlines.parse(value)
+    return value
+
+
+# (name, converter, value if missing or empty)
+OPTIONS = (
+    ('sender', _string, ''),
+    ('login', _string, ''),
+    ('password', _string, None),
+    ('password_source', _string, ''),
+    ('password_ttl', _number(int, 0), 300),
+    ('editor', _string, ''),
+    ('text_type', _choice(TEXT_TYPES), 'text'),
+    ('host', _string, ''),
+    ('secure_conn', _boolean, False),
+    ('port', _number(int, 1), None),
+    ('starttls', _boolean, False),
+    ('ssl_port', _number(int, 1), None),
+    ('timeout', _number(int, 0), 40),
+    ('phase_timeouts', _phases, ''),
+    ('run_deadline', _number(float, 0), 0.0),
+    ('debug_mode', _boolean, False),
+    ('delay', _number(float, 0), 0.0),
+    ('adaptive', _boolean, False),
+    ('max_rate', _number(float, 0.1), 20.0),
+    ('sort_domains', _boolean, False),
+    ('gpg_key_id', _string, ''),
+    ('gpg_exe', _string, ''),
+    ('sign_workers', _number(int, 1), 2),
+    ('delivery', _choice(DELIVERY_TYPES), 'smtp'),
+    ('pickup_dir', _string, ''),
+    ('sendmail_cmd', _string, ''),
+    ('sendmail_procs', _number(int, 1), 4),
+    ('pipelining', _boolean, True),
+    ('daemon_socket', _string, ''),
+    ('daemon_connections', _number(int, 1), 2),
+    ('keepalive', _number(int, 1), 60),
+    ('spool_dir', _string, ''),
+    ('queue_workers', _number(int, 1), 2),
+    ('suppression_list', _string, ''),
+    ('allow_domains', _names, ()),
+    ('deny_domains', _names, ()),
+    ('reject_file', _string, ''),
+    ('inherit', _names, ()),
+)
+
+
+class Settings(object):
+    """The validated options of a config file *section*."""
+    __slots__ = ('section',) + tuple(opt[0] for opt in OPTIONS)
+
+    def __init__(self, section='DEFAULT', **values):
+        self.section = section
+        for name, conv, default in OPTIONS:
+            setattr(self, name, values.get(name, default))
+
+    def __repr__(self):
+        return '<Settings [%s]>' % self.section
+
+
+def _parse(path):
+    config = configparser.ConfigParser()
+    try:
+        with open(path) as f:
+            if hasattr(config, 'read_file'):
+                config.read_file(f)
+            else:
+                config.readfp(f)
+    except (IOError, OSError, configparser.Error) as e:
+        raise SettingsError("Error reading %s: no file or not valid one: %s"
+                            % (path, e))
+    return config
+
+
+def _own_values(config, section):
+    """Return the values written in *section* (not in DEFAULT)."""
+    if section == 'DEFAULT':
+        return dict(config.defaults())
+    # ConfigParser has no public way to tell them apart.
+    return dict((key, config.get(section, key))
+                for key in config._sections[section] if key != '__name__')
+
+
+def _inherited_values(config, section, seen=()):
+    """Return the non empty values set in *section* or in the
+    sections it inherits from (DEFAULT excluded)."""
+    if not config.has_section(section):
+        raise SettingsError("No section: '%s'" % section)
+    if section in seen:
+        raise SettingsError("inheritance loop: %s"
+                            % ' -> '.join(seen + (section,)))
+    values = dict((k, v) for k, v in _own_values(config, section).items()
+                  if v.strip())
+    for parent in _names(values.get('inherit', '')):
+        inherited = _inherited_values(config, parent, seen + (section,))
+        for key, value in inherited.items():
+            values.setdefault(key, value)
+    return values
+
+
+def _raw_values(config, section):
+    """Return the (string) values of *section*, following *inherit*."""
+    if section != 'DEFAULT' and not config.has_section(section):
+        raise SettingsError("No section: '%s'" % section)
+    values = dict(config.items(section))
+    if section == 'DEFAULT' or not _names(values.get('inherit', '')):
+        return values
+    values = _inherited_values(config, section)
+    for key in config.defaults():
+        if key not in values:
+            values[key] = config.get('DEFAULT', key)
+    return values
+
+
+def validate(values, section='DEFAULT'):
+    """Return the Settings from the dict of strings *values*."""
+    typed = {}
+    for name, conv, default in OPTIONS:
+        value = values.get(name, '').strip()
+        if value:
+            try:
+                typed[name] = conv(value)
+            except ValueError as e:
+                raise SettingsError("invalid value for %s in section [%s]:"
+                                    " '%s' (%s)" % (name, section, value, e))
+    return Settings(section, **typed)
+
+
+_cache = {}
+
+def load(path, section='DEFAULT'):
+    """
+    Return the Settings of *section* of the config file *path*.
+    Raise SettingsError if the file can't be read or the section
+    is missing or has invalid values.
+    """
+    path = osp.abspath(path)
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        raise SettingsError("Error reading %s: no file or not valid one: %s"
+                            % (path, e))
+    stamp = (st.st_mtime, st.st_size)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = _cache[path] = (stamp, _parse(path), {})
+    sections = cached[2]
+    if section not in sections:
+        try:
+            values = _raw_values(cached[1], section)
+        except configparser.Error as e:
+            raise SettingsError("Error reading %s: %s" % (path, e))
+        sections[section] = validate(values, section)
+    return sections[section]
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (shard.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# shard.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Sharded sending. The recipients are split in shards by a hash (crc32)
+of the lowercased address, so an address always lands in the same
+shard whatever the order of the list. Each shard is sent by a worker:
+a local process, or a node (a multimail process started with
+--shard-node, likely on another host) which sends it with its own
+configuration. The Coordinator hands the shards out and aggregates
+the progress, the failures and the exit values of the workers.
+
+Node protocol (TCP, one JSON object per line). The coordinator sends
+    {"command": "shard", "shard": K, "message": {...}, "count": N}
+followed by the N recipients, one per line; the node answers with
+    {"shard": K, "processed": N, "sent": N, "errors": N}
+after each batch sent and finally with
+    {"shard": K, "done": true, "ok": true, "retval": R,
+     "failures": [[addr, error]]}
+or {"shard": K, "done": true, "ok": false, "retval": 3, "error": "..."}
+if the shard couldn't be sent. The message is sent as described, so
+its attachments must be readable by the node with the same paths.
+The nodes don't authenticate the coordinator: bind them to a trusted
+network only.
+"""
+
+import sys
+import json
+import zlib
+import signal
+import socket
+import threading
+import multiprocessing
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+from Multimail.recipients import RecipientTable
+from Multimail.daemon import job_to_message
+
+try:
+    # the workers get the (maybe unpicklable) sender factory by fork.
+    _mp = multiprocessing.get_context('fork')
+except (AttributeError, ValueError):
+    _mp = multiprocessing
+
+BATCH_SIZE = 100
+NODE_PORT = 8025
+TIMEOUT = 60
+
+
+class ShardError(Exception):
+    pass
+
+
+def shard_of(address, shards):
+    """Return the shard (0 to *shards* - 1) of *address*."""
+    data = address.strip().lower()
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return (zlib.crc32(data) & 0xffffffff) % shards
+
+
+def split(addresses, shards):
+    """Return the RecipientTables of the *shards* of the (streamed)
+    *addresses*, the blank ones skipped."""
+    tables = [RecipientTable() for _ in range(shards)]
+    for address in addresses:
+        address = address.strip()
+        if address:
+            tables[shard_of(address, shards)].add(address)
+    return tables
+
+
+def parse_node(spec, host='127.0.0.1'):
+    """Return the (host, port) of a [HOST:]PORT *spec*."""
+    name, sep, port = spec.rpartition(':')
+    try:
+        return (name or host), int(port)
+    except ValueError:
+        raise ShardError("invalid node address: %s" % spec)
+
+
+def send_shard(sender, msg, table, report, batch_size=BATCH_SIZE):
+    """
+    Send *msg* to the recipients of *table* with the logged in *sender*,
+    calling report(processed, sent, errors) after each batch. Return
+    the exit value (see SendMails.send).
+    """
+    processed = sent = errors = retval = 0
+    while processed < len(table):
+        batch = table[processed:processed+batch_size]
+        result = sender.send(msg, batch, True)
+        processed += len(batch)
+        sent += sender.step
+        errors += sender.errors
+        if result == 3:
+            errors += len(table) - processed
+            processed = len(table)
+        report(processed, sent, errors)
+        if result == 3:
+            return 3
+        retval = retval or result
+    return retval
+
+
+def _local_worker(shard, job, table, factory, login_name, password, results):
+    """Local worker process: send the *shard* recipients in *table*."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    done = dict(shard=shard, done=True, retval=3, failures=[])
+    try:
+        sender = factory()
+        sender.verbose = False
+        if not sender.login(login_name, password):
+            done['error'] = "can't login"
+            return
+        try:
+            done['retval'] = send_shard(
+                sender, job_to_message(job), table,
+                lambda p, s, e: results.put(dict(
+                    shard=shard, processed=p, sent=s, errors=e)))
+        finally:
+            sender.quit()
+        done['failures'] = table.failures()
+    except Exception as e:
+        done['error'] = str(e)
+    finally:
+        results.put(done)
+
+
+def _remote_worker(shard, node, job, table, results, timeout=TIMEOUT):
+    """Thread handing the *shard* to the *node* (host, port)."""
+    done = dict(shard=shard, done=True, retval=3, failures=[])
+    try:
+        sock = socket.create_connection(node, timeout)
+        try:
+            header = dict(command='shard', shard=shard, message=job,
+                          count=len(table))
+            out = sock.makefile('wb')
+            out.write((json.dumps(header) + '\n').encode('utf-8'))
+            for address in table:
+                out.write((address + '\n').encode('utf-8'))
+            out.flush()
+            for line in sock.makefile('rb'):
+                reply = json.loads(line.decode('utf-8'))
+                if reply.get('done'):
+                    done = reply
+                    break
+                results.put(reply)
+            else:
+                done['error'] = "connection closed by the node"
+        finally:
+            sock.close()
+    except (socket.error, ValueError) as e:
+        done['error'] = "node %s:%d: %s" % (node[0], node[1], e)
+    finally:
+        done['node'] = '%s:%d' % node
+        results.put(done)
+
+
+class Coordinator(object):
+    """
+    Send the message described by *job* (see daemon.message_to_job)
+    to the recipients *tables* (one per shard, see split). The shards
+    go to the *nodes* ((host, port) pairs) in turn or, without nodes,
+    to local processes sending with the senders made by *factory* and
+    logged with *login_name* and *password*.
+    """
+    poll = 0.5
+
+    def __init__(self, job, tables, factory=None, login_name=None,
+                 password=None, nodes=()):
+        self.job = job
+        self.tables = tables
+        self.factory = factory
+        self.login_name = login_name
+        self.password = password
+        self.nodes = list(nodes)
+        self.status = [dict(total=len(t), processed=0, sent=0, errors=0,
+                            retval=None, error=None, worker='local')
+                       for t in tables]
+        self.failures = []
+
+    def _start(self, results):
+        workers = {}
+        for shard, table in enumerate(self.tables):
+            if self.nodes:
+                node = self.nodes[shard % len(self.nodes)]
+                self.status[shard]['worker'] = '%s:%d' % node
+            if not table:
+                self.status[shard]['retval'] = 0
+                continue
+            if self.nodes:
+                w = threading.Thread(target=_remote_worker, args=(
+                    shard, node, self.job, table, results))
+            else:
+                w = _mp.Process(target=_local_worker, args=(
+                    shard, self.job, table, self.factory, self.login_name,
+                    self.password, results))
+            w.daemon = True
+            w.start()
+            workers[shard] = w
+        return workers
+
+    def _update(self, reply):
+        status = self.status[reply['shard']]
+        for key in ('processed', 'sent', 'errors'):
+            if key in reply:
+                status[key] = reply[key]
+        if reply.get('done'):
+            status['retval'] = reply['retval']
+            status['error'] = reply.get('error')
+            if status['retval'] == 3:
+                status['errors'] = status['total'] - status['sent']
+                status['processed'] = status['total']
+            self.failures.extend(tuple(f) for f in reply.get('failures', ()))
+
+    def totals(self):
+        """Return (processed, sent, errors, total) of all the shards."""
+        return tuple(sum(s[k] for s in self.status)
+                     for k in ('processed', 'sent', 'errors', 'total'))
+
+    def run(self, progress=None):
+        """
+        Send all the shards, calling progress(coordinator) at every
+        update. Return 0 if all the mails have been sent, 3 if some
+        shard has been aborted, 255 otherwise.
+        """
+        results = _mp.Queue()
+        workers = self._start(results)
+        pending = set(workers)
+        while pending:
+            try:
+                reply = results.get(True, self.poll)
+            except Empty:
+                for shard in list(pending):
+                    w = workers[shard]
+                    if not w.is_alive() and results.empty():
+                        # died without a word
+                        self._update(dict(shard=shard, done=True, retval=3,
+                                          error="worker died"))
+                        pending.discard(shard)
+                continue
+            self._update(reply)
+            if reply.get('done'):
+                pending.discard(reply['shard'])
+            if progress is not None:
+                progress(self)
+        for w in workers.values():
+            w.join()
+        retvals = set(s['retval'] for s in self.status)
+        for retval in (3, 255):
+            if retval in retvals:
+                return retval
+        return 0
+
+    def print_progress(self, out=sys.stdout):
+        """Print the status of all the shards."""
+        processed, sent, errors, total = self.totals()
+        out.write("\r%d%% job completed... (%d errors)"
+                  % (processed*100/(total or 1), errors))
+        out.flush()
+
+    def report(self):
+        """Return a line of summary for each shard."""
+        return ["shard %d (%s): %d sent, %d errors%s"
+                % (n, s['worker'], s['sent'], s['errors'],
+                   ' (%s)' % s['error'] if s['error'] else '')
+                for n, s in enumerate(self.status)]
+
+
+class _NodeHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        def reply(obj):
+            self.wfile.write((json.dumps(obj) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        shard = None
+        try:
+            header = json.loads(self.rfile.readline().decode('utf-8'))
+            shard = header['shard']
+            if header.get('command') != 'shard':
+                raise ShardError("unknown command: %s" % header.get('command'))
+            table = RecipientTable()
+            for n in range(header['count']):
+                line = self.rfile.readline()
+                if not line:
+                    raise ShardError("%d of %d recipients"
+                                     % (n, header['count']))
+                table.add(line.decode('utf-8').strip())
+            msg = job_to_message(header['message'])
+        except (ValueError, KeyError, TypeError, ShardError) as e:
+            return reply(dict(shard=shard, done=True, ok=False, retval=3,
+                              error="bad request: %s" % e))
+        except EnvironmentError as e:  # e.g. an attachment missing here
+            return reply(dict(shard=shard, done=True, ok=False, retval=3,
+                              error="can't make the message: %s" % e))
+        try:
+            result = self.server.send(shard, msg, table, lambda p, s, e:
+                                      reply(dict(shard=shard, processed=p,
+                                                 sent=s, errors=e)))
+        except Exception as e:
+            # rendering (e.g. a missing attachment) or sending failed.
+            result = dict(retval=3, error=str(e), failures=[])
+        try:
+            reply(dict(shard=shard, done=True, ok='error' not in result,
+                       **result))
+        except socket.error:
+            pass  # the coordinator has gone
+
+
+class NodeServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Node sending the shards received on *address* (host, port) with
+    the senders made by *factory*, logged with *login_name* and
+    *password*.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, factory, login_name, password):
+        self.factory = factory
+        self.login_name = login_name
+        self.password = password
+        socketserver.TCPServer.__init__(self, address, _NodeHandler)
+
+    def send(self, shard, msg, table, report):
+        """Send a shard, return the final reply fields."""
+        sender = self.factory()
+        sender.verbose = False
+        if not sender.login(self.login_name, self.password):
+            return dict(retval=3, error="can't login", failures=[])
+        try:
+            retval = send_shard(sender, msg, table, report)
+        finally:
+            sender.quit()
+        return dict(retval=retval, failures=table.failures())
+
+    def run(self):
+        """Serve until interrupted (SIGINT or SIGTERM)."""
+        def _terminate(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, _terminate)
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
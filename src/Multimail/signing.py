@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (signing.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# signing.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+PGP/MIME signatures (RFC 3156). A signer is a callable taking the
+canonical (CRLF) bytes of the MIME entity to sign and returning its
+ascii armored detached signature; GpgSigner is the GnuPG one.
+A SignerPool makes the signatures in a few worker threads, each one
+with its own signer, so the messages of many campaigns are signed
+at once while being built; the signatures are cached by the digest
+of the signed data, so equal bodies (e.g. the same message sent to
+many recipients, which differ only in the outer headers) are signed
+once.
+"""
+
+import hashlib
+import threading
+import subprocess as subp
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from Multimail.mmutils import SignError
+
+
+WORKERS = 2
+MICALG = 'pgp-sha256'
+PROTOCOL = 'application/pgp-signature'
+
+
+class GpgSigner(object):
+    """
+    Make detached armored signatures with the gpg executable *exe*
+    and the key *key*. gpg runs in batch mode, reading the data from
+    the standard input: the passphrase must be cached by gpg-agent.
+    """
+    __slots__ = ('exe', 'key')
+
+    def __init__(self, exe, key):
+        self.exe = exe
+        self.key = key
+
+    def command(self):
+        return [self.exe, '--batch', '--yes', '--armor', '--detach-sign',
+                '--digest-algo', 'SHA256', '--local-user', self.key]
+
+    def __call__(self, data):
+        try:
+            proc = subp.Popen(self.command(), stdin=subp.PIPE,
+                              stdout=subp.PIPE, stderr=subp.PIPE)
+        except OSError as e:
+            raise SignError('Unable to sign: %s' % e)
+        out, err = proc.communicate(data)
+        if proc.returncode != 0:
+            raise SignError('Unable to sign: %s'
+                            % err.decode('utf-8', 'replace').strip())
+        return out
+
+
+class Signature(object):
+    """A signature being made by a SignerPool."""
+    __slots__ = ('_done', '_value', '_error')
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._value = self._error = None
+
+    def set(self, value=None, error=None):
+        self._value, self._error = value, error
+        self._done.set()
+
+    def get(self):
+        """Wait for the signature and return it, raise SignError
+        if it can't be made."""
+        self._done.wait()
+        if self._error is not None:
+            raise SignError(str(self._error))
+        return self._value
+
+
+class SignerPool(object):
+    """
+    *workers* threads making signatures with the signers returned
+    by *factory* (called once by each thread).
+    """
+    def __init__(self, factory, workers=WORKERS):
+        self._queue = queue.Queue()
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.signed = 0
+        self._threads = []
+        for _ in range(max(1, workers)):
+            thread = threading.Thread(target=self._work, args=(factory,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self, factory):
+        try:
+            signer = factory()
+        except Exception as e:
+            signer = None
+            error = e
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            data, signature = item
+            if signer is None:
+                signature.set(error=error)
+                continue
+            try:
+                signature.set(signer(data))
+            except Exception as e:
+                signature.set(error=e)
+        close = getattr(signer, 'close', None)
+        if close is not None:
+            close()
+
+    def submit(self, data):
+        """Return the Signature of *data* (bytes), to be made by
+        the workers unless already made or submitted."""
+        digest = hashlib.sha256(data).digest()
+        with self._lock:
+            signature = self._cache.get(digest)
+            if signature is None:
+                signature = self._cache[digest] = Signature()
+                self.signed += 1
+                self._queue.put((data, signature))
+        return signature
+
+    def sign(self, data):
+        """Return the signature of *data*."""
+        return self.submit(data).get()
+
+    def close(self):
+        """Stop the workers, after the signatures pending."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+def gpg_pool(exe, key, workers=WORKERS):
+    """Return a SignerPool of GpgSigner."""
+    return SignerPool(lambda: GpgSigner(exe, key), workers)
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive email sender (spool.py module)
+
+# Copyright (C) 2011  Marco Chieppa (aka crap0101)
+
+# spool.py is part of multimail.
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not see <http://www.gnu.org/licenses/>
+
+"""
+Persistent job queue. Jobs (a message and its recipients) are
+submitted to a spool directory and processed by a pool of worker
+processes, each one keeping a single logged in connection, so the
+number of workers is also the max number of connections to the
+relay. The spool layout is:
+    tmp/      jobs being submitted
+    new/      jobs waiting, named PRIORITY-SENDAT-ID.job so that
+              sorting the names gives the processing order
+              (lower priority values first, then older send times)
+    cur/      jobs being processed
+    done/     jobs completed
+    failed/   jobs given up
+    data/ID/  the recipients list and the attachments of a job
+    journal/  per job progress (recipients already processed, and
+              ID.status with their status codes, one byte each),
+              so an interrupted job restarts where it stopped
+    stats     queue depth and throughput, updated by the runner
+    lock      locked by the runner (and its workers) while running,
+              so a second one can't requeue the jobs being processed
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import json
+import shutil
+import signal
+import random
+import collections
+from array import array
+import multiprocessing
+import os.path as osp
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+try:
+    import fcntl
+except ImportError:  # not on posix, no lock
+    fcntl = None
+
+from Multimail.delivery import SendMails
+from Multimail.recipients import RecipientTable, PENDING, SENT, FAILED
+from Multimail.daemon import SessionPool, DaemonError
+from Multimail.daemon import message_to_job, job_to_message
+
+try:
+    # the workers get the (maybe unpicklable) sender factory by fork.
+    _mp = multiprocessing.get_context('fork')
+except (AttributeError, ValueError):
+    _mp = multiprocessing
+
+SPOOL_DIR = osp.expanduser('~/.multimail-spool')
+DIRS = ('tmp', 'new', 'cur', 'done', 'failed', 'data', 'journal')
+DEFAULT_PRIORITY = 5
+BATCH_SIZE = 100
+RETRY_DELAY = 60
+MAX_ATTEMPTS = 5
+
+
+class SpoolError(Exception):
+    pass
+
+
+def job_name(priority, send_at, job_id):
+    return "%d-%010d-%s.job" % (priority, send_at, job_id)
+
+def parse_job_name(name):
+    """Return (priority, send_at, job_id) from the job file *name*."""
+    priority, send_at, job_id = name[:-len('.job')].split('-', 2)
+    return int(priority), int(send_at), job_id
+
+
+class Spool(object):
+    """The spool directory *path*, created if missing."""
+    def __init__(self, path):
+        self.path = path
+        for d in DIRS:
+            try:
+                os.makedirs(self._dir(d))
+            except OSError:
+                if not osp.isdir(self._dir(d)):
+                    raise SpoolError("can't create the spool dir %s" % path)
+
+    def _dir(self, *names):
+        return osp.join(self.path, *names)
+
+    def _write(self, path, job):
+        tmp = self._dir('tmp', osp.basename(path))
+        with open(tmp, 'w') as f:
+            json.dump(job, f)
+        os.rename(tmp, path)
+
+    def _read(self, path):
+        with open(path) as f:
+            return json.load(f)
+
+    def submit(self, job, recipients, priority=DEFAULT_PRIORITY, send_at=None):
+        """
+        Queue *job* (see daemon.message_to_job) for *recipients* (any
+        iterable of addresses), not to be sent before the *send_at*
+        timestamp. Return the job id. The attachments are copied into
+        the spool, so the original files can be removed.
+        """
+        if not 0 <= priority <= 9:
+            raise SpoolError("priority must be between 0 and 9")
+        send_at = int(send_at if send_at is not None else time.time())
+        job_id = "%d.%d.%06x" % (time.time() * 1000, os.getpid(),
+                                 random.getrandbits(24))
+        data_dir = self._dir('data', job_id)
+        os.mkdir(data_dir)
+        attachments = []
+        for n, (path, name) in enumerate(job['attachments']):
+            copy = osp.join(data_dir, 'attachment%d' % n)
+            shutil.copyfile(path, copy)
+            attachments.append((copy, name or osp.basename(path)))
+        job = dict(job, attachments=attachments, id=job_id,
+                   priority=priority, send_at=send_at,
+                   submitted=time.time(), attempts=0)
+        total = 0
+        with open(osp.join(data_dir, 'recipients'), 'w') as f:
+            for rec in recipients:
+                f.write(rec.strip() + '\n')
+                total += 1
+        job['total'] = total
+        self._write(self._dir('new', job_name(priority, send_at, job_id)), job)
+        return job_id
+
+    def waiting(self, now=None):
+        """Return the names of the jobs waiting, in processing order,
+        and the number of those not yet to be sent.
+        """
+        now = time.time() if now is None else now
+        due, scheduled = [], 0
+        for name in sorted(os.listdir(self._dir('new'))):
+            if parse_job_name(name)[1] <= now:
+                due.append(name)
+            else:
+                scheduled += 1
+        return due, scheduled
+
+    def claim(self, now=None):
+        """Take the next job to process, return (name, job) or None."""
+        for name in self.waiting(now)[0]:
+            try:
+                os.rename(self._dir('new', name), self._dir('cur', name))
+            except OSError:
+                continue  # taken by another worker
+            return name, self._read(self._dir('cur', name))
+        return None
+
+    def retry(self, name, job, delay=RETRY_DELAY):
+        """Put back a claimed job, to be tried again after *delay* secs."""
+        job['attempts'] += 1
+        if job['attempts'] >= MAX_ATTEMPTS:
+            return self.finish(name, job, failed=True)
+        new = job_name(job['priority'], time.time() + delay, job['id'])
+        self._write(self._dir('new', new), job)
+        os.remove(self._dir('cur', name))
+
+    def finish(self, name, job, failed=False):
+        """Move the job *name* in done (or failed)."""
+        self._write(self._dir('failed' if failed else 'done', name), job)
+        os.remove(self._dir('cur', name))
+        if not failed:
+            shutil.rmtree(self._dir('data', job['id']), True)
+        for journal in (job['id'], job['id'] + '.status'):
+            try:
+                os.remove(self._dir('journal', journal))
+            except OSError:
+                pass
+
+    def lock(self):
+        """
+        Lock the spool for a runner, return the lock file (closing it
+        releases the lock, which the forked workers hold too). Raise
+        SpoolError if another runner has it.
+        """
+        f = open(self._dir('lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                f.close()
+                raise SpoolError("the spool %s is used by another runner"
+                                 % self.path)
+        return f
+
+    def recover(self):
+        """Requeue the jobs left in cur by a stopped runner (call it
+        with the lock only, see lock)."""
+        for name in os.listdir(self._dir('cur')):
+            os.rename(self._dir('cur', name), self._dir('new', name))
+
+    def recipients(self, job_id, start=0):
+        """Yield (index, address) of the job recipients from *start*."""
+        with open(self._dir('data', job_id, 'recipients')) as f:
+            for n, line in enumerate(f):
+                if n >= start:
+                    yield n, line.strip()
+
+    def recipient_table(self, job_id):
+        """Return the job recipients as a RecipientTable, with the
+        status of those already processed."""
+        table = RecipientTable.from_file(
+            self._dir('data', job_id, 'recipients'))
+        try:
+            with open(self._dir('journal', job_id + '.status'), 'rb') as f:
+                status = array('B', f.read(len(table)))
+        except IOError:
+            pass
+        else:
+            table.status[:len(status)] = status
+        return table
+
+    def progress(self, job_id):
+        """Return (processed, sent, errors) from the job journal."""
+        last = (0, 0, 0)
+        try:
+            with open(self._dir('journal', job_id)) as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        last = tuple(int(v) for v in line.split())
+        except IOError:
+            pass
+        return last
+
+    def record(self, job_id, processed, sent, errors, status=None):
+        """Journal the job progress. *status* is the array of the
+        status codes of the recipients processed since the last call."""
+        if status is not None:
+            with open(self._dir('journal', job_id + '.status'), 'ab') as f:
+                status.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        with open(self._dir('journal', job_id), 'a') as f:
+            f.write("%d %d %d\n" % (processed, sent, errors))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def status(self):
+        """Return a dict with the queue status and the runner stats."""
+        due, scheduled = self.waiting()
+        stats = {}
+        try:
+            stats = self._read(self._dir('stats'))
+        except (IOError, ValueError):
+            pass
+        stats.update(queued=len(due), scheduled=scheduled,
+                     running=len(os.listdir(self._dir('cur'))),
+                     done=len(os.listdir(self._dir('done'))),
+                     failed=len(os.listdir(self._dir('failed'))))
+        return stats
+
+    def write_stats(self, stats):
+        self._write(self._dir('stats'), stats)
+
+
+def run_job(spool, pool, name, job, results=None, batch_size=BATCH_SIZE):
+    """Send the claimed job *name* using the sender objects of *pool*."""
+    msg = job_to_message(job)
+    processed, sent, errors = spool.progress(job['id'])
+    table = spool.recipient_table(job['id'])
+    while processed < len(table):
+        batch = table[processed:processed+batch_size]
+        try:
+            sender = pool.acquire()
+        except DaemonError:
+            return spool.retry(name, job)
+        try:
+            retval = sender.send(msg, batch, True)
+        except Exception:
+            pool.release(sender, False)
+            raise
+        pool.release(sender, retval != 3)
+        if retval == 3:
+            # connection lost: journal the recipients already processed
+            # (the first ones of the batch), the others are sent again.
+            status = table.status[batch.start:batch.stop]
+            done = 0
+            while done < len(status) and status[done] != PENDING:
+                done += 1
+            status = status[:done]
+            if done:
+                processed += done
+                sent += status.count(SENT)
+                errors += status.count(FAILED)
+                spool.record(job['id'], processed, sent, errors, status)
+                if results is not None:
+                    results.put((time.time(), status.count(SENT),
+                                 status.count(FAILED)))
+            return spool.retry(name, job)
+        processed += len(batch)
+        sent += sender.step
+        errors += sender.errors
+        spool.record(job['id'], processed, sent, errors,
+                     table.status[batch.start:batch.stop])
+        if results is not None:
+            results.put((time.time(), sender.step, sender.errors))
+    job.update(sent=sent, errors=errors, finished=time.time(),
+               failures=[list(f) for f in table.failures()])
+    spool.finish(name, job)
+
+
+def try_job(spool, pool, name, job, results=None):
+    """
+    run_job, but an unexpected error (e.g. a message which can't be
+    made) counts as a failed attempt instead of killing the worker,
+    which would claim the job again after the restart.
+    """
+    try:
+        run_job(spool, pool, name, job, results)
+    except Exception as e:
+        print("job %s: %s: %s" % (job['id'], type(e).__name__, e))
+        job['error'] = str(e)
+        try:
+            spool.retry(name, job)
+        except (IOError, OSError):
+            pass
+
+
+def worker(path, factory, login_name, password, keepalive, results, poll=1):
+    """Worker process main loop."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    spool = Spool(path)
+    pool = SessionPool(factory, login_name, password, 1, keepalive)
+    while True:
+        claimed = spool.claim()
+        if claimed is None:
+            pool.ping()
+            time.sleep(poll)
+        else:
+            try_job(spool, pool, claimed[0], claimed[1], results)
+
+
+class QueueRunner(object):
+    """
+    Run *workers* worker processes on the spool *path*, each one
+    using a sender object made by *factory* and logged in with
+    *login_name* and *password*.
+    """
+    stats_interval = 2
+
+    def __init__(self, path, factory, login_name, password,
+                 workers=2, keepalive=60):
+        self.spool = Spool(path)
+        self.args = (path, factory, login_name, password, keepalive)
+        self.n_workers = workers
+        self.workers = []
+        self.results = _mp.Queue()
+        self.sent = self.errors = 0
+        self._window = collections.deque()
+        self.started = time.time()
+
+    def _start_worker(self):
+        p = _mp.Process(target=worker, args=self.args + (self.results,))
+        p.daemon = True
+        p.start()
+        return p
+
+    def _collect(self, timeout):
+        try:
+            t, sent, errors = self.results.get(True, timeout)
+        except Empty:
+            return
+        self.sent += sent
+        self.errors += errors
+        self._window.append((t, sent))
+
+    def stats(self):
+        now = time.time()
+        while self._window and self._window[0][0] < now - 60:
+            self._window.popleft()
+        return {'workers': len(self.workers), 'sent': self.sent,
+                'errors': self.errors, 'started': self.started,
+                'rate_1m': sum(s for t, s in self._window) / 60.0,
+                'rate_avg': self.sent / max(1.0, now - self.started),
+                'updated': now}
+
+    def run(self, until=None):
+        """
+        Process the queue until interrupted (or *until* returns True).
+        Raise SpoolError if another runner is using the spool.
+        """
+        def _terminate(signum, frame):
+            raise KeyboardInterrupt
+        lock = self.spool.lock()
+        signal.signal(signal.SIGTERM, _terminate)
+        last_stats = 0
+        try:
+            self.spool.recover()
+            self.workers = [self._start_worker()
+                            for i in range(self.n_workers)]
+            while until is None or not until(self):
+                self._collect(0.5)
+                for n, p in enumerate(self.workers):
+                    if not p.is_alive():
+                        print("worker %d died (exit code %s), restarting"
+                              % (p.pid, p.exitcode))
+                        self.workers[n] = self._start_worker()
+                if time.time() - last_stats > self.stats_interval:
+                    self.spool.write_stats(self.stats())
+                    last_stats = time.time()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for p in self.workers:
+                p.terminate()
+                p.join()
+            while not self.results.empty():
+                self._collect(0.1)
+            self.spool.write_stats(self.stats())
+            self.spool.recover()
+            lock.close()
+
+
+class QueueSubmitter(SendMails):
+    """Sender object putting the jobs in the spool *path*."""
+    __slots__ = ('path', 'priority', 'send_at', 'job_id')
+
+    def __init__(self, path, priority=DEFAULT_PRIORITY, send_at=None):
+        super(QueueSubmitter, self).__init__(None, None, False, None)
+        self.path = path
+        self.priority = priority
+        self.send_at = send_at
+        self.job_id = None
+
+    def connect(self):
+        try:
+            self.connection = Spool(self.path)
+        except SpoolError as e:
+            print("ERROR: %s" % e)
+            return False
+        return True
+
+    def login(self, login_name=None, pwd=None):
+        return self.connect()
+
+    def noop(self):
+        return self.connect()
+
+    def reset(self):
+        return True
+
+    def send(self, msg, receivers, keep_open=False):
+        self.total = len(receivers)
+        try:
+            self.job_id = self.connection.submit(
+                message_to_job(msg), receivers, self.priority, self.send_at)
+        except (SpoolError, IOError, OSError) as e:
+            print("Error: can't queue the job: %s" % e)
+            self.errors, self.retval = self.total, 3
+            return self.retval
+        self.step = self.total
+        if self.verbose:
+            print("job %s queued (%d recipients)" % (self.job_id, self.total))
+        return 0
+
+    def quit(self):
+        self.connection = None
@@ -26,221 +26,365 @@ import os
 import os.path as osp
 import sys
 import time
-import smtplib
-import getpass
-import locale
 import itertools as it
-try:                                               # __
-    from email.mime.text import MIMEText           #   |--  email formatting
-except ImportError:                                #   |
-    from email.MIMEText import MIMEText            #   | some email's module
-try:                                               #   | subpackages has been
-    from email.mime.base import MIMEBase           #   | renamed nor moved, so
-except ImportError:                                #   | we can try to import
-    from email.MIMEBase import MIMEBase            #   | the right module
-try:                                               #   | for running Python's
-    from email.mime.multipart import MIMEMultipart #   | version above 2.1
-except ImportError:                                #   |
-    from email.MIMEMultipart import MIMEMultipart  #   |______
-try:                                                      #   |
-    from email.mime.nonmultipart import MIMENonMultipart  #   |
-except ImportError:                                       #   |
-    from email.MIMENonMultipart import MIMENonMultipart   #   |
-try:                                                      #   |
-    from email import Encoders                            #   |
-except ImportError:                                       #   |
-    from email import encoders as Encoders                # __|
-
-import platform
-PY_VERSION = int(platform.python_version_tuple()[0])
+PY_VERSION = sys.version_info[0]
 if PY_VERSION < 3:
     input = raw_input
 
 # LOCAL IMPORTS #
+# the modules needed only by some code paths (editor -> curses,
+# message -> email, delivery -> smtplib -> ssl, daemon, spool)
+# are imported where used, to keep the startup fast.
 from Multimail import parsopts
 from Multimail import mmutils
-from Multimail import editor
+from Multimail import settings
 
 VERSION = parsopts.VERSION
 
 
-class MailMessage(object):
-    """ Bare Mail object."""
-    def __init__(self, sender, receiver, subject, text, attachments):
-        self.sender = sender
-        self.receiver = receiver
-        self.subject = subject
-        self.text = text
-        self.attachments = attachments
-        self.xmailer = VERSION
-        self.delimiter = "=========multimail_delimiter========="
-        self.msg = None
-
-    def sign(self, file, *args):
-        with open(file) as f:
-            self.text = f.read()
-
-
-class PlainMsg(MailMessage):
-    """Plain text mail object."""
-    def __init__(self, sender, receiver, subject, text):
-        super(PlainMsg, self).__init__(
-            sender, receiver, subject, text, None);
-
-    def get_message(self, receiver=None):
-        receiver = receiver if receiver is not None else self.receiver
-        _time = mmutils.mail_format_time()
-        return ("From: %s\r\nTo: %s\r\nSubject: %s\r\n"
-                "Date: %s\r\nX-Mailer: %s\r\n\r\n%s"
-                % (self.sender, receiver, self.subject,
-                   _time, self.xmailer, self.text))
-
-
-class MimeMsg(MailMessage):
-    """Plain text mail object."""
-    def __init__(self, sender, receiver, subject, text, ttype, attachments):
-        super(MimeMsg, self).__init__(
-            sender, receiver, subject, text, attachments)
-        self.text_type = ttype
-        self.build()
-
-    def build(self):
-        if not self.attachments:
-            if self.text_type == 'html':
-                self.msg = MIMENonMultipart('text', 'html')
-            else:
-                self.msg = MIMENonMultipart('text', 'plain', charset='utf-8')
-            self.msg.set_payload(self.text)
-            self.msg['boundary'] = self.delimiter
-        else:
-            self.msg = MIMEMultipart(boundary=self.delimiter)
-            if self.text_type == 'html':
-                self.msg.attach(MIMEText(self.text, 'html'))
-            else:
-                self.msg.attach(MIMEText(self.text, _charset='utf-8'))
-        self.msg['From'] = self.sender
-        self.msg['To'] = self.receiver
-        self.msg['Subject'] = self.subject
-        self.msg['Date'] = "NULL"
-        self.msg['X-Mailer'] = self.xmailer
-        if self.attachments:
-            for attachment, _name in self.attachments:
-                to_attach = MIMEBase('application', "octet-stream")
-                with open(attachment, "rb") as att:
-                    to_attach.set_payload(att.read())
-                Encoders.encode_base64(to_attach)
-                _name = osp.basename(attachment) if not _name else _name
-                to_attach.add_header(
-                    'Content-Disposition',
-                    'attachment; filename="%s"' % _name)
-                self.msg.attach(to_attach)
-
-    def get_message(self, receiver=None, as_string=True):
-        receiver = receiver if receiver is not None else self.receiver
-        _time = mmutils.mail_format_time()
-        self.msg.replace_header('To', receiver)
-        self.msg.replace_header('Date', _time)
-        if as_string:
-            return self.msg.as_string()
-        return self.msg
-
-    def sign(self, file, detached):
-        if detached:
-            self.attachments.append((file, 'signature.sig'))
-        else:
-            super(MimeMsg, self).sign(file)
-        self.build()
-
-
-class SendMails(object):
-    def __init__(self, host, port, secure_conn=True, timeout=50):
-        self.host = host
-        self.port = port
-        self.secure_conn = secure_conn
-        self.debug_level = 0
-        self.timeout = timeout
-        self.delay_time = 0
-        self.connection = None
-        self.step = 0
-        self.errors = 0
-        self.total = 0
-
-    def _connect(self):
-        # TODO: timeout not available in python < 2.6
-        if self.secure_conn:
-            self.connection = smtplib.SMTP_SSL(
-                self.host, self.port, timeout=self.timeout)
-        else:
-            self.connection = smtplib.SMTP(
-                self.host, self.port, timeout=self.timeout)
-        return self.connection
+# command line options and the config file options used in their place
+SETTINGS_NAMES = (('sender_addr', 'sender'), ('login_name', 'login'),
+                  ('password', 'password'), ('editor', 'editor'),
+                  ('password_source', 'password_source'),
+                  ('text_type', 'text_type'), ('host', 'host'),
+                  ('timeout', 'timeout'), ('delay', 'delay'),
+                  ('phase_timeouts', 'phase_timeouts'),
+                  ('run_deadline', 'run_deadline'),
+                  ('gpg_key', 'gpg_key_id'), ('gpg_exe', 'gpg_exe'),
+                  ('delivery', 'delivery'), ('pickup_dir', 'pickup_dir'),
+                  ('sendmail_cmd', 'sendmail_cmd'),
+                  ('pipelining', 'pipelining'),
+                  ('daemon_socket', 'daemon_socket'),
+                  ('spool_dir', 'spool_dir'), ('workers', 'queue_workers'),
+                  ('suppression_list', 'suppression_list'),
+                  ('reject_file', 'reject_file'))
+SETTINGS_FLAGS = (('secure_conn', 'secure_conn'), ('starttls', 'starttls'),
+                  ('debug', 'debug_mode'), ('adaptive', 'adaptive'),
+                  ('sort_domains', 'sort_domains'))
+
+
+def apply_settings(opts, config):
+    """
+    Fill the options not given in the command line with the values
+    of *config* (a settings.Settings object).
+    """
+    for opt, name in SETTINGS_NAMES:
+        if getattr(opts, opt) in (None, ''):
+            setattr(opts, opt, getattr(config, name))
+    for opt, name in SETTINGS_FLAGS:
+        setattr(opts, opt, getattr(opts, opt) or getattr(config, name))
+    opts.login_name = opts.login_name or opts.sender_addr
+    if not opts.port:
+        opts.port = config.ssl_port if opts.secure_conn else config.port
+
+
+def make_sender(opts, config, parser, clean=lambda: None):
+    """
+    Return the sender object for the delivery choosed in *opts*
+    (already completed by apply_settings with *config*).
+    """
+    from Multimail import delivery
+    if opts.delivery == 'daemon':
+        from Multimail import daemon
+        send_obj = daemon.DaemonClient(get_daemon_socket(opts))
+    elif opts.delivery == 'queue':
+        from Multimail import spool
+        _send_at = None
+        if opts.send_at:
+            try:
+                _send_at = time.mktime(time.strptime(opts.send_at,
+                                                     '%Y-%m-%d %H:%M'))
+            except ValueError:
+                clean()
+                parser.error("invalid --send-at value: '%s'" % opts.send_at)
+        if not 0 <= opts.priority <= 9:
+            clean()
+            parser.error("priority must be between 0 and 9")
+        send_obj = spool.QueueSubmitter(get_spool_dir(opts),
+                                        opts.priority, _send_at)
+    elif opts.delivery == 'pickup':
+        if not opts.pickup_dir:
+            clean()
+            parser.error("No pickup directory specified")
+        send_obj = delivery.PickupDirSender(opts.pickup_dir)
+    elif opts.delivery == 'sendmail':
+        send_obj = delivery.SendmailPipeSender(
+            opts.sendmail_cmd or delivery.SENDMAIL_CMD, config.sendmail_procs)
+    else:
+        if not opts.host:
+            clean()
+            parser.error("No host specified")
+        if opts.starttls and opts.secure_conn:
+            clean()
+            parser.error("STARTTLS and SSL connection are mutually exclusive,"
+                         " check the -S|--SSL and --starttls options"
+                         " (or secure_conn and starttls in the config file).")
+        if not opts.port:
+            clean()
+            parser.error("No port specified")
+        if opts.timeout < 0:
+            clean()
+            parser.error("invalid timeout value: %s" % opts.timeout)
+        send_obj = delivery.SendMails(opts.host, opts.port,
+                                      opts.secure_conn, opts.timeout,
+                                      opts.starttls)
+        send_obj.pipelining = opts.pipelining
+        send_obj.deadlines = get_deadlines(opts, parser, clean)
+    if opts.delay < 0:
+        clean()
+        parser.error("delay must be >= 0, got %f instead" % opts.delay)
+    send_obj.debug_level = opts.debug
+    send_obj.delay_time = opts.delay
+    if opts.adaptive and opts.delivery == 'smtp':
+        send_obj.controller = get_controller(opts, config)
+    return send_obj
+
+
+def get_controller(opts, config):
+    """Return the adaptive.HostController of the server."""
+    from Multimail import adaptive
+    return adaptive.shared((opts.host, opts.port), max_rate=config.max_rate)
+
+
+def get_deadlines(opts, parser, clean=lambda: None):
+    """
+    Return the deadlines.Deadlines of the --phase-timeouts and the
+    --deadline (the run one starting at the first call), or None if
+    neither is set.
+    """
+    from Multimail import deadlines
+    if not (opts.phase_timeouts or opts.run_deadline):
+        return None
+    if getattr(opts, '_deadlines', None) is None:
+        if opts.run_deadline < 0:
+            clean()
+            parser.error("the deadline must be >= 0")
+        try:
+            opts._deadlines = deadlines.parse(opts.phase_timeouts or '',
+                                              opts.run_deadline, opts.timeout)
+        except ValueError as e:
+            clean()
+            parser.error("invalid --phase-timeouts value: %s" % e)
+    return opts._deadlines
+
+
+def get_daemon_socket(opts):
+    from Multimail import daemon
+    return opts.daemon_socket or daemon.SOCKET_PATH
 
-    def connect(self):
+
+def get_credentials(opts, config, parser):
+    """
+    Without a password, use the provider of the --password-source
+    (see the credentials module) in its place, if any.
+    """
+    if opts.password is None and opts.password_source:
+        from Multimail import credentials
         try:
-            self._connect()
-        except smtplib.SMTPConnectError as e:
-            print("ERROR during connection: %s" % str(e))
-            return False
-        return True
-
-    def delay(self):
-        time.sleep(self.delay_time)
-
-    def login(self, login_name, pwd=None):
-        if pwd is None:
-            pwd = getpass.getpass()
-        if self.connection is None:
-            if not self.connect():
-                return False
-        self.connection.set_debuglevel(self.debug_level)
+            opts.password = credentials.from_spec(opts.password_source,
+                                                  config.password_ttl)
+        except credentials.CredentialError as e:
+            parser.error(str(e))
+
+
+def _service_factory(opts, config, parser):
+    """
+    Common setup of the long running modes (daemon, queue runner).
+    Return a callable making new (not logged) sender objects.
+    """
+    if opts.delivery in ('daemon', 'queue'):
+        parser.error("can't deliver to a %s from here" % opts.delivery)
+    opts.run_deadline = 0  # running until stopped
+    make_sender(opts, config, parser)
+    if opts.delivery == 'smtp' and opts.password is None:
+        # ask it now, not at every new connection.
+        import getpass
+        opts.password = getpass.getpass()
+    return lambda: make_sender(opts, config, parser)
+
+
+def run_daemon(opts, config, parser):
+    """Run the multimail daemon (see the daemon module)."""
+    from Multimail import daemon
+    factory = _service_factory(opts, config, parser)
+    controller = None
+    if opts.adaptive and opts.delivery == 'smtp':
+        controller = get_controller(opts, config)
+        controller.max_limit = config.daemon_connections
+    pool = daemon.SessionPool(factory, opts.login_name, opts.password,
+                              config.daemon_connections, config.keepalive,
+                              controller)
+    try:
+        server = daemon.Daemon(get_daemon_socket(opts), pool)
+    except (daemon.DaemonError, OSError) as e:
+        parser.error(str(e))
+    server.run()
+
+
+def get_nodes(opts, parser):
+    """Return the (host, port) of the --nodes."""
+    from Multimail import shard
+    try:
+        return [shard.parse_node(node) for node in opts.nodes or ()]
+    except shard.ShardError as e:
+        parser.error(str(e))
+
+
+def run_shard_node(opts, config, parser):
+    """Send the shards handed by a coordinator (see the shard module)."""
+    from Multimail import shard
+    factory = _service_factory(opts, config, parser)
+    try:
+        server = shard.NodeServer(shard.parse_node(opts.shard_node), factory,
+                                  opts.login_name, opts.password)
+    except (shard.ShardError, EnvironmentError) as e:
+        parser.error(str(e))
+    server.run()
+
+
+def run_shards(opts, config, parser, msg_obj):
+    """
+    Send *msg_obj* splitting the recipients in shards, sent by local
+    worker processes or by the --nodes. Return the exit value.
+    """
+    from Multimail import shard
+    from Multimail.daemon import message_to_job
+    nodes = get_nodes(opts, parser)
+    tables = shard.split(opts.recipients, opts.shards or len(nodes))
+    factory = None
+    if not nodes:
+        factory = lambda: make_sender(opts, config, parser)
+    coordinator = shard.Coordinator(
+        message_to_job(msg_obj), tables, factory,
+        opts.login_name, opts.password, nodes)
+    retval = coordinator.run(lambda c: c.print_progress())
+    print()
+    for line in coordinator.report():
+        print(line)
+    return retval
+
+
+def write_report(run_report, path):
+    """Print the summary of *run_report* and write it in *path*."""
+    run_report.finish()
+    for line in run_report.summary():
+        print(line)
+    try:
+        run_report.write(path)
+    except (IOError, OSError) as e:
+        print("Error writing the report: %s" % e)
+
+
+def get_spool_dir(opts):
+    from Multimail import spool
+    return opts.spool_dir or spool.SPOOL_DIR
+
+
+def run_queue(opts, config, parser):
+    """Process the jobs in the spool directory (see the spool module)."""
+    from Multimail import spool
+    if opts.workers < 1:
+        parser.error("at least one worker is needed")
+    factory = _service_factory(opts, config, parser)
+    try:
+        runner = spool.QueueRunner(get_spool_dir(opts), factory,
+                                   opts.login_name, opts.password,
+                                   opts.workers, config.keepalive)
+        runner.run()
+    except spool.SpoolError as e:
+        parser.error(str(e))
+
+
+def queue_status(opts):
+    """Print the status of the spool directory."""
+    from Multimail import spool
+    status = spool.Spool(get_spool_dir(opts)).status()
+    for key in sorted(status):
+        print("%s: %s" % (key, status[key]))
+
+
+def check_recipients(opts, config, parser, planner=None):
+    """
+    Return (recipients, rejected, suppressed): the RecipientTable of
+    the valid recipients (-r|--recipients, then the --from-file ones,
+    read by rcptreader) not in the suppression list (see bounces), the
+    number of the invalid ones (see addrcheck) and of the suppressed
+    ones. With a *planner* (see the planner module) the recipients are
+    sorted by domain as the files are read, so the whole unsorted list
+    is never held in memory.
+    """
+    from Multimail import addrcheck
+    from Multimail import bounces
+    from Multimail import rcptreader
+    from Multimail.recipients import RecipientTable
+    checker = addrcheck.Checker(config.allow_domains, config.deny_domains)
+    suppression_list = get_suppression_list(opts)
+    counts = [0, 0]  # rejected, suppressed
+
+    def tables():
+        valid, counts[0] = checker.filter(opts.recipients or (),
+                                          opts.reject_file)
+        parts = [(valid, 0)]
+        for path in opts.from_file:
+            parts = it.chain(parts, rcptreader.parts(
+                path, config.allow_domains, config.deny_domains,
+                opts.reject_file, ordered=planner is None))
+        for part, rejected in parts:
+            counts[0] += rejected
+            part, dropped = bounces.filter_recipients(part, suppression_list)
+            counts[1] += dropped
+            yield part
+
+    try:
+        if planner is None:
+            recipients = RecipientTable()
+            for part in tables():
+                recipients.merge(part)
+        else:
+            recipients = RecipientTable(planner.sort(
+                address for part in tables() for address in part))
+    except (IOError, OSError) as e:
+        parser.error(str(e))
+    return recipients, counts[0], counts[1]
+
+
+def get_suppression_list(opts):
+    from Multimail import bounces
+    return opts.suppression_list or bounces.SUPPRESSION_LIST
+
+
+def process_bounces(opts, parser):
+    """Record the bounces found in the --process-bounces mailboxes."""
+    from Multimail import bounces
+    try:
+        suppressed = bounces.SuppressionList(get_suppression_list(opts))
         try:
-            self.connection.login(login_name, pwd)
-        except smtplib.SMTPAuthenticationError as e:
-            print("Authentication Error: invalid userID or password")
-            return False
-        except smtplib.SMTPHeloError as e:
-            print("SMTPHelo Error: no response from %s" % self.host)
-            return False
-        except smtplib.SMTPException as e:
-            print("No suitable authentication method was found.")
-            return False
-        return True
-
-    def send(self, msg, receivers):
-        _retval = 0
-        sender = msg.sender
-        self.total = len(receivers)
-        for rec in receivers:
-            self.print_progress()
-            try:
-                self.connection.sendmail(sender, rec, msg.get_message(rec))
-                self.step += 1
-                self.delay()
-            except (smtplib.SMTPDataError,
-                    smtplib.SMTPRecipientsRefused,
-                    smtplib.SMTPHeloError,
-                    smtplib.SMTPSenderRefused,) as e:
-                self.errors += 1
-                _retval = 255
-                print("%s [when sending to %s]" %s (str(e), rec))
-            except smtplib.SMTPServerDisconnected as e:
-                print('Error: disconnected from the server: %s' % e)
-                self.errors += self.total - self.step
-                _retval = 3
-                break
-        self.quit()
-        self.print_progress()
-        print()
-        return _retval
-
-    def print_progress(self, out=sys.stdout):
-        """Print the status of the job."""
-        out.write("\r%d%% job completed... (%d errors)"
-            % (self.step*100/self.total, self.errors))
-        out.flush()
-
-    def quit(self):
-        self.connection.quit()
+            for path in opts.process_bounces:
+                stats = suppressed.process(path)
+                print("%s: %d messages, %d bounces (%d hard, %d soft)"
+                      % (path, stats['messages'], stats['bounces'],
+                         stats['hard'], stats['soft']))
+        finally:
+            suppressed.close()
+    except bounces.BounceError as e:
+        parser.error(str(e))
+
+
+def run_batch(opts, cfg_path, parser):
+    """Send the campaigns of the --batch manifest (see the batch module)."""
+    from Multimail import batch
+    if opts.chunk < 1:
+        parser.error("chunk must be >= 1")
+    try:
+        runner = batch.Batch(batch.read_manifest(opts.batch, cfg_path),
+                             opts.chunk)
+        retval = runner.run()
+    except batch.BatchError as e:
+        parser.error(str(e))
+    for line in runner.report():
+        print(line)
+    return retval
+
 
 def main(args):
     def clean():
@@ -258,49 +402,94 @@ def main(args):
     if opts.editor and opts.text:
         parser.error("conflict between options -e|--editor and"
                    " -m|--text-msg")
+    if not opts.use_config_file and opts.custom_config_file:
+        parser.error("conflict between options -C|--config-file and"
+                   " -n|--no-config")
     if not opts.use_config_file:
-        if opts.custom_config_file:
-            parser.error("conflict between options -C|--config-file and"
-                       " -n|--no-config")
-        config = mmutils.fake_config(_section)
+        cfg_path = None
+    elif opts.custom_config_file:
+        cfg_path = opts.custom_config_file
+    else:
+        cfg_path = os.path.expanduser('~/.multimail.cfg')
+    if opts.batch:
+        sys.exit(run_batch(opts, cfg_path, parser))
+    if cfg_path is None:
+        config = settings.Settings(_section)
     else:
-        cfg_path = (os.path.expanduser('~/.multimail.cfg')
-                    if not opts.custom_config_file
-                    else opts.custom_config_file)
         try:
-            config = mmutils.read_config(cfg_path)
-        except (IOError, ConfigParser.ParsingError) as e:
-            parser.error("Error reading %s: no file or not valid one: %s"
-            % (cfg_path, str(e)))
-    for file in opts.from_file:
-        with open(file) as f:
-            opts.recipients.extend(list(addr.strip() for addr in f))
-    if not opts.recipients:
+            config = settings.load(cfg_path, _section)
+        except settings.SettingsError as e:
+            parser.error(str(e))
+    apply_settings(opts, config)
+    get_credentials(opts, config, parser)
+    if opts.daemon:
+        run_daemon(opts, config, parser)
+        sys.exit(0)
+    elif opts.queue_run:
+        run_queue(opts, config, parser)
+        sys.exit(0)
+    elif opts.shard_node:
+        run_shard_node(opts, config, parser)
+        sys.exit(0)
+    elif opts.queue_status:
+        queue_status(opts)
+        sys.exit(0)
+    elif opts.process_bounces:
+        process_bounces(opts, parser)
+        sys.exit(0)
+    if not (opts.recipients or opts.from_file):
         parser.error("No recipient found")
+    _planner = None
+    if opts.sort_domains or opts.plan:
+        from Multimail import planner
+        _planner = planner.Planner()
+    opts.recipients, _rejected, _dropped = check_recipients(
+        opts, config, parser, _planner)
+    if _rejected:
+        print("%d invalid recipients skipped%s" % (_rejected,
+              " (see %s)" % opts.reject_file if opts.reject_file else ''))
+    if _dropped:
+        print("%d suppressed recipients skipped" % _dropped)
+    if not opts.recipients:
+        if _dropped:
+            parser.error("all the recipients are in the suppression list")
+        parser.error("No valid recipient found")
+    if _planner is not None:
+        for line in _planner.report(None if opts.plan else 10):
+            print(line)
+        if opts.plan:
+            sys.exit(0)
     if not opts.sender_addr:
-        _sender = config.get(_section, 'sender')
-        if not _sender:
-            parser.error("sender address not found")
-        else:
-            opts.sender_addr = _sender
-    if not opts.login_name:
-        _login = config.get(_section, 'login')
-        opts.login_name = _login or opts.sender_addr
-    if not opts.text_type:
-        if not opts.use_config_file:
-            opts.text_type = 'text'
-        else:
-            opts.text_type = config.get(_section, 'text_type') or 'text'
-            if opts.text_type not in ('html', 'text', 'plain'):
-                parser.error("invalid values for text_type in the config file,"
-                           " must be one of ['html', 'text', 'plain'],"
-                           " got '%s' instead" % opts.text_type)
+        parser.error("sender address not found")
     if opts.compression and not opts.attachments:
         parser.error("Nothing to compress.")
     if (opts.detach and opts.sign):
         parser.error("sign must be clear or detached, not both.")
     if opts.text_type == 'plain' and opts.detach:
         parser.error("can't make detached signature in plain text mode")
+    if opts.pgp_mime and (opts.detach or opts.sign):
+        parser.error("PGP/MIME excludes the clear and detached signatures.")
+    if opts.text_type == 'plain' and opts.pgp_mime:
+        parser.error("can't make PGP/MIME signature in plain text mode")
+    _sharded = bool(opts.shards or opts.nodes)
+    if opts.shards < 0:
+        parser.error("the shards must be >= 1")
+    if _sharded and opts.delivery in ('daemon', 'queue'):
+        parser.error("can't send in shards with %s delivery" % opts.delivery)
+    if _sharded and (opts.sign or opts.detach or opts.pgp_mime):
+        parser.error("can't sign the mails sent in shards")
+    if _sharded:
+        get_nodes(opts, parser)
+    if opts.nodes and opts.attachments:
+        parser.error("can't send attachments to the --nodes (the paths"
+                     " are local)")
+    if opts.report_file and (_sharded or opts.delivery in ('daemon', 'queue')):
+        parser.error("can't report the sending %s"
+                     % ('in shards' if _sharded
+                        else 'with %s delivery' % opts.delivery))
+    if opts.pgp_mime and opts.delivery in ('daemon', 'queue'):
+        parser.error("can't make PGP/MIME signature with %s delivery"
+                     % opts.delivery)
     if opts.text_type == 'plain':
         if any((opts.compression, opts.attachments, opts.archive_name,)):
             parser.error("can't send attachments in plain text mode")
@@ -337,106 +526,85 @@ def main(args):
     if not opts.subject:
         opts.subject = input("email's subject [hit RETURN when done]: ")
     if not opts.text:
-        _editor = opts.editor or config.get(_section, 'editor')
-        if _editor:
+        from Multimail import editor
+        if opts.editor:
             try:
-                opts.text = editor.use_ext_editor(_editor)
+                opts.text = editor.use_ext_editor(opts.editor)
             except editor.EditorError as e:
                 print(e)
                 clean()
                 sys.exit(1)
-        elif editor.YOU_HAVE_CURSES and PY_VERSION < 3:
-            # temporary disable curses editor for python >= 3
-            # 'cause it must be fixed for work with that version
+        elif editor.YOU_HAVE_CURSES:
             opts.text = editor.use_curses_editor()
         else:
             opts.text = editor.no_curses()
     elif osp.isfile(osp.abspath(opts.text)):
         with open(opts.text) as t:
             opts.text = t.read()
+    from Multimail.message import PlainMsg, MimeMsg
     if opts.text_type == 'plain':
         msg_obj = PlainMsg(opts.sender_addr, '', opts.subject, opts.text)
     else:
         msg_obj = MimeMsg(opts.sender_addr, '', opts.subject,
                           opts.text, opts.text_type, opts.attachments)
     # ---
-    _host = config.get(_section, 'host')
-    if not opts.host:
-        if _host:
-            opts.host = _host
-        else:
-            clean()
-            parser.error("No host specified")
-    _secure_conn = False
-    if config.get(_section, 'secure_conn'):
-        _secure_conn = config.getboolean(_section, 'secure_conn')
-    opts.secure_conn = opts.secure_conn or _secure_conn
-    if not opts.port:
-        _port = (config.get(_section, 'ssl_port') if opts.secure_conn
-                    else config.get(_section, 'port'))
-        try:
-            opts.port = int(_port)
-        except ValueError:
-            clean()
-            parser.error("No port specified or not a valid one: '%s'" % _port)
-    if opts.timeout is None:
-        _timeout = config.get(_section, 'timeout')
-        if _timeout:
-            try:
-                _timeout = int(_timeout)
-            except ValueError:
-                clean()
-                parser.error("Not a valid timeout value: '%s'" % _timeout)
-        opts.timeout = _timeout or 40
-    if opts.timeout < 0:
-        parser.error("invalid timeout value: %s" % opts.timeout)
-    send_obj = SendMails(opts.host, opts.port, opts.secure_conn, opts.timeout)
-    _debug = 0
-    if config.get(_section, 'debug_mode'):
-        _debug = config.getboolean(_section, 'debug_mode')
-    opts.debug = opts.debug or _debug
-    if opts.delay is None:
-        if not opts.use_config_file:
-            opts.delay = 0
-        else:
-            _delay = config.get(_section, 'delay')
-            try:
-                opts.delay = float(_delay)
-            except ValueError:
-                clean()
-                parser.error("Not a valid delay value: '%s'" % _delay)
-    if opts.delay < 0:
+    if opts.nodes:
+        # the nodes send with their own server and credentials.
+        _ex_val = run_shards(opts, config, parser, msg_obj)
         clean()
-        parser.error("delay must be >= 0, got %f instead" % opts.delay)
-    opts.password = (opts.password or (config.get(_section, 'password') or None))
-    send_obj.debug_level = opts.debug
-    send_obj.delay_time = opts.delay
+        sys.exit(_ex_val)
+    if _sharded and opts.delivery == 'smtp' and opts.password is None:
+        # the workers can't prompt for it.
+        import getpass
+        opts.password = getpass.getpass()
+    send_obj = make_sender(opts, config, parser, clean)
     if not send_obj.login(opts.login_name, opts.password):
         clean()
         sys.exit(2)
     #signing:
-    if (opts.detach or opts.sign):
-        gpg_exe = opts.gpg_exe or config.get(_section, 'gpg_exe')
+    if (opts.detach or opts.sign or opts.pgp_mime):
+        gpg_exe = opts.gpg_exe
         if not gpg_exe or not osp.isfile(gpg_exe):
             send_obj.quit()
             clean()
             parser.error("Can't find gnuPG, surely not here: %s" % gpg_exe)
-        gpg_key = opts.gpg_key or config.get(_section, 'gpg_key_id')
+        gpg_key = opts.gpg_key
         if not gpg_key:
             send_obj.quit()
             clean()
             parser.error("can't find the gpg key for signing.")
         _detach = True if opts.detach else False
         try:
-            _text = msg_obj.text
-            _signed_file = mmutils.gpg_sign(gpg_exe, gpg_key, _text, _detach)
+            if opts.pgp_mime:
+                from Multimail import signing
+                _pool = signing.gpg_pool(gpg_exe, gpg_key,
+                                         config.sign_workers)
+                try:
+                    msg_obj.pgp_sign(_pool)
+                    msg_obj.get_message()  # wait for the signature
+                finally:
+                    _pool.close()
+            else:
+                _text = msg_obj.text
+                _signed_file = mmutils.gpg_sign(
+                    gpg_exe, gpg_key, _text, _detach)
         except mmutils.SignError as e:
             send_obj.quit()
             clean()
             raise mmutils.SignError(str(e))
-        msg_obj.sign(_signed_file, _detach)
+        if not opts.pgp_mime:
+            msg_obj.sign(_signed_file, _detach)
     # send:
-    _ex_val = send_obj.send(msg_obj, opts.recipients)
+    if _sharded:
+        send_obj.quit()
+        _ex_val = run_shards(opts, config, parser, msg_obj)
+    else:
+        if opts.report_file:
+            from Multimail import report
+            send_obj.run_report = report.RunReport()
+        _ex_val = send_obj.send(msg_obj, opts.recipients)
+        if send_obj.run_report is not None:
+            write_report(send_obj.run_report, opts.report_file)
     clean()
     sys.exit(_ex_val)
 
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | startup time benchmark
+#
+# usage: bench_startup.py [RUNS [TOP]]
+# Print the median wall time of `multimail.py --version` over RUNS
+# runs and, with python >= 3.7, the TOP modules by cumulative import
+# time (from `python -X importtime`).
+
+from __future__ import print_function
+
+import os.path as op_
+import sys
+import time
+import subprocess as sbp
+
+pwd = op_.dirname(op_.realpath(__file__))
+p_exe = sys.executable
+m_exe = op_.join(op_.split(pwd)[0], 'src', 'multimail.py')
+
+
+def wall_time(runs):
+    times = []
+    for i in range(runs):
+        start = time.time()
+        sbp.check_call([p_exe, m_exe, '--version'], stdout=sbp.PIPE)
+        times.append(time.time() - start)
+    return sorted(times)[runs // 2]
+
+
+def import_times():
+    """Return a list of (cumulative_us, self_us, module)."""
+    proc = sbp.Popen([p_exe, '-X', 'importtime', m_exe, '--version'],
+                     stdout=sbp.PIPE, stderr=sbp.PIPE)
+    err = proc.communicate()[1].decode('utf-8')
+    times = []
+    for line in err.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            self_us, cumulative, name = line[12:].split('|')
+            if self_us.strip().isdigit():
+                times.append((int(cumulative), int(self_us), name.rstrip()))
+    return times
+
+
+def main(runs=10, top=15):
+    print("multimail --version: %.1f ms (median of %d runs)"
+          % (wall_time(runs) * 1000, runs))
+    if sys.version_info < (3, 7):
+        return
+    print("%10s %10s  module" % ('cumul.(us)', 'self(us)'))
+    for cumulative, self_us, name in sorted(import_times(),
+                                            reverse=True)[:top]:
+        print("%10d %10d %s" % (cumulative, self_us, name))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | fake SMTP server used by the tests
+
+import re
+import socket
+import threading
+
+
+class FakeSMTPServer(object):
+    """
+    Minimal threaded SMTP server listening on localhost.
+    *extensions* are the EHLO keywords advertised, *refuse* a list of
+    recipients rejected with 550, *defer* a list of those deferred
+    with 450. Accepted messages are stored in
+    self.messages as (mail_from, [rcpt, ...], data) tuples, data with
+    the dot-stuffing already removed. Every received command is
+    logged in self.commands. With a server side *ssl_context*
+    STARTTLS is advertised, or if *implicit_tls* the connections
+    are encrypted from the beginning. If given, *auth* is called with
+    each AUTH command line and must return True to accept it. The
+    first RCPT to each of *stall* is never answered, as well as the
+    banner if *stall_banner*.
+    """
+    def __init__(self, extensions=('PIPELINING', 'CHUNKING', '8BITMIME',
+                                   'SIZE 10000000', 'AUTH PLAIN LOGIN'),
+                 refuse=(), ssl_context=None, implicit_tls=False,
+                 auth=None, defer=(), stall=(), stall_banner=False):
+        self.extensions = list(extensions)
+        self.defer = set(defer)
+        self.stall = set(stall)
+        self.stall_banner = stall_banner
+        self.auth = auth
+        self.ssl_context = ssl_context
+        self.implicit_tls = implicit_tls
+        if ssl_context is not None and not implicit_tls:
+            self.extensions.append('STARTTLS')
+        self.refuse = set(refuse)
+        self.messages = []
+        self.commands = []
+        self.connections = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.host, self.port = self.sock.getsockname()
+        self._lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self._running = False
+        try:
+            socket.create_connection((self.host, self.port), 1).close()
+        except socket.error:
+            pass
+        self._thread.join(5)
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _serve(self):
+        while self._running:
+            conn, addr = self.sock.accept()
+            if not self._running:
+                conn.close()
+                break
+            with self._lock:
+                self.connections += 1
+            t = threading.Thread(target=self._handle, args=(conn,))
+            t.daemon = True
+            t.start()
+
+    def wrap(self, conn, infile=None):
+        """Start TLS on *conn*, return the new (conn, infile)."""
+        if self.ssl_context is None:
+            return None
+        conn = self.ssl_context.wrap_socket(conn, server_side=True)
+        return conn, conn.makefile('rb')
+
+    def _handle(self, conn):
+        if self.implicit_tls:
+            try:
+                conn = self.wrap(conn)[0]
+            except socket.error:
+                conn.close()
+                return
+        infile = conn.makefile('rb')
+        reply = lambda s: conn.sendall((s + '\r\n').encode('ascii'))
+        mail_from, rcpts, chunks = None, [], []
+        try:
+            if self.stall_banner:
+                self._hang(infile)
+                return
+            reply('220 fake ESMTP')
+            while True:
+                line = infile.readline()
+                if not line:
+                    break
+                line = line.decode('ascii').rstrip('\r\n')
+                with self._lock:
+                    self.commands.append(line)
+                cmd = line.split(' ', 1)[0].upper()
+                if cmd == 'EHLO':
+                    lines = ['fake'] + self.extensions
+                    for ext in lines[:-1]:
+                        reply('250-' + ext)
+                    reply('250 ' + lines[-1])
+                elif cmd == 'HELO':
+                    reply('250 fake')
+                elif cmd == 'STARTTLS':
+                    reply('220 go ahead')
+                    wrapped = self.wrap(conn, infile)
+                    if wrapped is None:
+                        break
+                    conn, infile = wrapped
+                    reply = (lambda c: lambda s: c.sendall(
+                        (s + '\r\n').encode('ascii')))(conn)
+                elif cmd == 'AUTH':
+                    if line.upper().startswith('AUTH LOGIN'):
+                        for p in ('VXNlcm5hbWU6', 'UGFzc3dvcmQ6')[
+                                len(line.split()) - 2:]:
+                            reply('334 ' + p)
+                            infile.readline()
+                    if self.auth is None or self.auth(line):
+                        reply('235 ok')
+                    elif line.upper().startswith('AUTH XOAUTH2'):
+                        reply('334 eyJzdGF0dXMiOiI0MDEifQ==')
+                        infile.readline()
+                        reply('535 invalid credentials')
+                    else:
+                        reply('535 invalid credentials')
+                elif cmd == 'MAIL':
+                    mail_from = re.search('<(.*?)>', line).group(1)
+                    rcpts = []
+                    reply('250 ok')
+                elif cmd == 'RCPT':
+                    rcpt = re.search('<(.*?)>', line).group(1)
+                    with self._lock:
+                        stalled = rcpt in self.stall
+                        self.stall.discard(rcpt)
+                    if stalled:
+                        self._hang(infile)
+                        break
+                    if rcpt in self.refuse:
+                        reply('550 no such user')
+                    elif rcpt in self.defer:
+                        reply('450 too many messages, slow down')
+                    else:
+                        rcpts.append(rcpt)
+                        reply('250 ok')
+                elif cmd == 'DATA':
+                    if not rcpts:
+                        reply('554 no valid recipients')
+                        continue
+                    reply('354 go ahead')
+                    data = []
+                    while True:
+                        l = infile.readline()
+                        if l == b'.\r\n':
+                            break
+                        if l.startswith(b'.'):
+                            l = l[1:]
+                        data.append(l)
+                    self._store(mail_from, rcpts, b''.join(data))
+                    reply('250 queued')
+                elif cmd == 'BDAT':
+                    args = line.split()
+                    chunks.append(infile.read(int(args[1])))
+                    if len(args) > 2 and args[2].upper() == 'LAST':
+                        if rcpts:
+                            self._store(mail_from, rcpts, b''.join(chunks))
+                            reply('250 queued')
+                        else:
+                            reply('554 no valid recipients')
+                        chunks = []
+                    else:
+                        reply('250 chunk ok')
+                elif cmd in ('RSET', 'NOOP'):
+                    if cmd == 'RSET':
+                        mail_from, rcpts = None, []
+                    reply('250 ok')
+                elif cmd == 'QUIT':
+                    reply('221 bye')
+                    break
+                else:
+                    reply('502 unknown command')
+        except socket.error:
+            pass
+        finally:
+            conn.close()
+
+    def _hang(self, infile):
+        """Read (and ignore) until the client closes."""
+        while infile.readline():
+            pass
+
+    def _store(self, mail_from, rcpts, data):
+        with self._lock:
+            self.messages.append((mail_from, list(rcpts), data))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_adaptive file
+
+
+import os
+import os.path as op_
+import sys
+import time
+import smtplib
+import threading
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+sys.path.insert(0, pwd)
+
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+sys.path.insert(0, basepackdir)
+
+from Multimail import adaptive
+from Multimail import daemon
+from Multimail import delivery
+from Multimail import message
+from fake_smtp import FakeSMTPServer
+
+
+class TestAdaptive(unittest.TestCase):
+    def testDeferral(self):
+        for error, expected in (
+                (smtplib.SMTPServerDisconnected('closed'), True),
+                (smtplib.SMTPDataError(421, 'busy'), True),
+                (smtplib.SMTPDataError(554, 'rejected'), False),
+                (smtplib.SMTPRecipientsRefused({'a@b.c': (450, 'later')}),
+                 True),
+                (smtplib.SMTPRecipientsRefused({'a@b.c': (550, 'no')}),
+                 False),
+                (IOError('disk full'), False)):
+            self.assertEqual(adaptive.is_deferral(error), expected)
+
+    def testAIMD(self):
+        control = adaptive.HostController('host', max_rate=10, max_limit=4,
+                                          rate=2)
+        for _ in range(2):
+            control.record(0.5)
+        self.assertEqual((control.rate, control.limit), (3, 2))
+        for _ in range(45):  # a round lasts rate deliveries
+            control.record(0.5)
+        self.assertEqual((control.rate, control.limit), (10, 4))
+        # a burst of deferrals halves the rate once
+        deferred = smtplib.SMTPDataError(421, 'slow down')
+        for _ in range(5):
+            control.record(0.5, deferred)
+        self.assertEqual((control.rate, control.limit, control.deferred),
+                         (5, 2, 5))
+        control.record(0.5, smtplib.SMTPDataError(554, 'no'))
+        self.assertEqual(control.rate, 5)
+        control._decreased -= 10
+        control.record(0.5, deferred)
+        self.assertEqual((control.rate, control.limit), (2.5, 1))
+
+    def testPacing(self):
+        control = adaptive.HostController('host', rate=20)
+        started = time.time()
+        for _ in range(5):
+            control.wait()
+        self.assertTrue(0.15 < time.time() - started < 1)
+
+    def testLimit(self):
+        control = adaptive.HostController('host', max_limit=2)
+        control.acquire()
+        got = []
+        thread = threading.Thread(target=lambda: got.append(
+            control.acquire()))
+        thread.daemon = True
+        thread.start()
+        thread.join(0.2)
+        self.assertEqual(got, [])
+        control.release()
+        thread.join(5)
+        self.assertEqual(got, [None])
+        self.assertTrue(adaptive.shared('x') is adaptive.shared('x'))
+
+    def testSend(self):
+        recs = ['a%d@b.c' % n for n in range(6)] + ['busy@b.c']
+        with FakeSMTPServer(defer=('busy@b.c',)) as server:
+            control = adaptive.HostController('host', rate=50, max_limit=2)
+            factory = lambda: delivery.SendMails(server.host, server.port,
+                                                 False, 10)
+            pool = daemon.SessionPool(factory, 'me', 'pwd', 2, 60, control)
+            sender = pool.acquire()
+            self.assertTrue(sender.controller is control)
+            self.assertEqual(control.active, 1)
+            msg = message.MimeMsg('me@here.org', '', 's', 't', 'text', [])
+            self.assertEqual(sender.send(msg, recs, True), 255)
+            pool.release(sender)
+            pool.close()
+            self.assertEqual(control.active, 0)
+            self.assertEqual((control.sent, control.deferred), (6, 1))
+            self.assertTrue(control.rate < 50)
+            self.assertEqual(len(server.messages), 6)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestAdaptive,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
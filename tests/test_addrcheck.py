@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_addrcheck file
+
+
+import io
+import os
+import os.path as op_
+import sys
+import shutil
+import tempfile
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import addrcheck
+
+
+class TestAddrCheck(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testValid(self):
+        checker = addrcheck.Checker()
+        for addr in ('a@b.org', 'first.last+tag@sub.example.co.uk',
+                     "o'hara!#$%&*/=?^_`{|}~-@x.io", '"john doe"@b.org',
+                     '"a\\"b"@b.org', 'x@[192.168.0.1]', 'x@[IPv6:::1]',
+                     'a@xn--caf-dma.com', 'a@a-b.org'):
+            self.assertEqual(checker.check(addr), (addr, None))
+        self.assertEqual(checker.check(' <a@b.org> '), ('a@b.org', None))
+        self.assertEqual(checker.check(u'a@caf\xe9.com'),
+                         ('a@xn--caf-dma.com', None))
+
+    def testInvalid(self):
+        checker = addrcheck.Checker()
+        for addr, reason in (('ab.org', 'missing @'),
+                             ('@b.org', 'empty local part'),
+                             ('a..b@b.org', 'invalid local part'),
+                             ('.a@b.org', 'invalid local part'),
+                             ('a b@b.org', 'invalid local part'),
+                             (u'\xe8@b.org', 'non ascii local part'),
+                             ('x' * 65 + '@b.org', 'local part too long'),
+                             ('a@localhost', 'not a fully qualified domain'),
+                             ('a@-b.org', "invalid domain label: '-b'"),
+                             ('a@b..org', "invalid domain label: ''"),
+                             ('a@b_c.org', "invalid domain label: 'b_c'"),
+                             ('a@1.2.3.4', 'numeric top level domain'),
+                             ('a@' + 'b' * 64 + '.org',
+                              "invalid domain label: '%s'" % ('b' * 64)),
+                             ('a@' + 'b.' * 127 + 'org', 'domain too long')):
+            self.assertEqual(checker.check(addr)[1], reason)
+
+    def testLists(self):
+        checker = addrcheck.Checker(deny=['spam.org'])
+        self.assertEqual(checker.check('a@mx.SPAM.org')[1], 'domain denied')
+        self.assertEqual(checker.check('a@notspam.org')[1], None)
+        checker = addrcheck.Checker(allow=['here.org', u'caf\xe9.com'],
+                                    deny=['bad.here.org'])
+        self.assertEqual(checker.check('a@here.org')[1], None)
+        self.assertEqual(checker.check('a@x.here.org')[1], None)
+        self.assertEqual(checker.check(u'a@caf\xe9.com')[1], None)
+        self.assertEqual(checker.check('a@bad.here.org')[1], 'domain denied')
+        self.assertEqual(checker.check('a@there.org')[1],
+                         'domain not allowed')
+
+    def testFilter(self):
+        reject = op_.join(self.dir, 'rejected')
+        addrs = ['ok%d@b.org' % i for i in range(5)] + ['bad', '', 'b@c']
+        valid, rejected = addrcheck.Checker().filter(addrs, reject, 1)
+        self.assertEqual((list(valid), rejected), (addrs[:5], 2))
+        with open(reject) as f:
+            self.assertEqual(f.read(), 'bad\tmissing @\n'
+                             'b@c\tnot a fully qualified domain\n')
+        # utf-8, whatever the locale (and python 2 str too)
+        os.remove(reject)
+        address = u'\xe0@b.org'
+        native = address.encode('utf-8') if str is bytes else address
+        addrcheck.Checker().filter([address, native], reject)
+        with io.open(reject, encoding='utf-8') as f:
+            self.assertEqual(f.read(),
+                             u'\xe0@b.org\tnon ascii local part\n' * 2)
+
+    def testCommandLine(self):
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        reject = op_.join(self.dir, 'rejected')
+        with open(op_.join(self.dir, 'list'), 'w') as f:
+            f.write('one@b.org\nnot valid\n\ntwo@b.org\n')
+        proc = sbp.Popen([p_exe, m_exe, '-n', '--delivery', 'pickup',
+                          '--pickup-dir', pickup, '-f', 'me@here.org',
+                          '-s', 'x', '-m', 'text', '--reject-file', reject,
+                          '--suppression-list', op_.join(self.dir, 'sl'),
+                          '-r', 'a@@b.org', 'three@b.org',
+                          '--from-file', op_.join(self.dir, 'list')],
+                         stdout=sbp.PIPE)
+        out = proc.communicate()[0].decode('utf-8')
+        self.assertEqual(proc.returncode, 0)
+        self.assertTrue('2 invalid recipients skipped' in out)
+        self.assertEqual(len(os.listdir(pickup)), 3)
+        with open(reject) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestAddrCheck,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
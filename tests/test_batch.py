@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_batch file
+
+
+import os
+import os.path as op_
+import sys
+import shutil
+import tempfile
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import batch
+from Multimail import bounces
+from Multimail import delivery
+
+CONFIG = """
+[DEFAULT]
+sender = me@here.org
+delivery = pickup
+pickup_dir = %(here)s/pickup
+
+[other]
+sender = other@here.org
+pickup_dir = %(here)s/other
+"""
+
+MANIFEST = """
+[DEFAULT]
+subject = news
+
+[first]
+text = 100% text.txt
+recipients = a1@b.c, a2@b.c a3@b.c
+attachments = data
+compression = gz
+archive_name = data
+
+[second]
+profile = other
+text = text.txt
+recipients_file = list.txt
+
+[third]
+text = third
+sender = third@here.org
+recipients = c1@b.c
+attachments = data
+compression = gz
+"""
+
+
+class FakeSender(delivery.PickupDirSender):
+    """Pickup sender logging the messages sent in *log*."""
+    def __init__(self, log, pickup_dir):
+        super(FakeSender, self).__init__(pickup_dir)
+        self.log = log
+        self.logins = 0
+
+    def login(self, login_name=None, pwd=None):
+        self.logins += 1
+        return super(FakeSender, self).login(login_name, pwd)
+
+    def _deliver(self, sender, receiver, message, index=None):
+        self.log.append((self, sender, receiver, message))
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for name in ('pickup', 'other', 'data'):
+            os.mkdir(op_.join(self.dir, name))
+        self.config = op_.join(self.dir, 'multimail.cfg')
+        with open(self.config, 'w') as f:
+            f.write(CONFIG.replace('%(here)s', self.dir))
+        self.manifest = op_.join(self.dir, 'manifest')
+        with open(self.manifest, 'w') as f:
+            f.write(MANIFEST)
+        with open(op_.join(self.dir, 'text.txt'), 'w') as f:
+            f.write('the text')
+        with open(op_.join(self.dir, 'data', 'x'), 'w') as f:
+            f.write('x' * 100)
+        with open(op_.join(self.dir, 'list.txt'), 'w') as f:
+            f.write('b1@b.c\n\nb2@b.c\n')
+        self.log = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _factory(self, config):
+        return FakeSender(self.log, config.pickup_dir)
+
+    def testManifest(self):
+        first, second, third = batch.read_manifest(self.manifest, self.config)
+        self.assertEqual((first.name, first.sender, first.subject),
+                         ('first', 'me@here.org', 'news'))
+        self.assertEqual(first.text, '100% text.txt')
+        self.assertEqual(first.attachments, [op_.join(self.dir, 'data')])
+        self.assertEqual(second.text, 'the text')
+        self.assertEqual(list(second.recipients), ['b1@b.c', 'b2@b.c'])
+        self.assertEqual(second.sender, 'other@here.org')
+        self.assertEqual(third.sender, 'third@here.org')
+        self.assertEqual(first.server_key(), third.server_key())
+        self.assertNotEqual(first.server_key(), second.server_key())
+        with open(self.manifest, 'a') as f:
+            f.write('[bad]\nrecipients = x@y.z\ntext=t\nattachments = data\n')
+        self.assertRaises(batch.BatchError,
+                          batch.read_manifest, self.manifest, self.config)
+        with open(self.manifest, 'w') as f:
+            f.write('[bad]\nprofile = nothere\nrecipients = x@y.z\n')
+        self.assertRaises(batch.BatchError,
+                          batch.read_manifest, self.manifest, self.config)
+
+    def testRun(self):
+        campaigns = batch.read_manifest(self.manifest, self.config)
+        runner = batch.Batch(campaigns, 2, self._factory)
+        self.assertEqual(runner.run(), 0)
+        # two rounds, the campaigns in turn
+        self.assertEqual([r[2] for r in self.log],
+                         ['a1@b.c', 'a2@b.c', 'b1@b.c', 'b2@b.c', 'c1@b.c',
+                          'a3@b.c'])
+        # one connection for each pickup dir, logged once
+        senders = set(r[0] for r in self.log)
+        self.assertEqual([s.logins for s in senders], [1, 1])
+        self.assertTrue(self.log[0][0] is self.log[-2][0])
+        # one archive for both campaigns, removed at the end
+        self.assertTrue('filename="data.tar.gz"' in self.log[0][3])
+        self.assertEqual(len(runner._archives), 0)
+        self.assertEqual([c.sent for c in campaigns], [3, 2, 1])
+        self.assertEqual(runner.report()[0], '[first] 3 sent, 0 errors')
+
+    def testAbort(self):
+        campaigns = batch.read_manifest(self.manifest, self.config)
+        os.rmdir(op_.join(self.dir, 'other'))
+        runner = batch.Batch(campaigns, 2, self._factory)
+        self.assertEqual(runner.run(), 3)
+        self.assertEqual([(c.sent, c.errors) for c in campaigns],
+                         [(3, 0), (0, 2), (1, 0)])
+
+    def testFailedLogin(self):
+        campaigns = batch.read_manifest(self.manifest, self.config)
+        senders = []
+        def factory(config):
+            sender = self._factory(config)
+            sender.login = lambda *args: senders.append(sender) and False
+            return sender
+        runner = batch.Batch(campaigns, 2, factory)
+        self.assertEqual(runner.run(), 3)
+        # once for each server, not again for the third campaign
+        self.assertEqual(len(senders), 2)
+        self.assertEqual([(c.sent, c.errors) for c in campaigns],
+                         [(0, 3), (0, 2), (0, 1)])
+        self.assertEqual(self.log, [])
+
+    def testEmpty(self):
+        db = op_.join(self.dir, 'suppressed')
+        suppressed = bounces.SuppressionList(db)
+        for address in ('b1@b.c', 'b2@b.c'):
+            suppressed.add(address, bounces.HARD, '5.1.1')
+        suppressed.close()
+        with open(self.config, 'a') as f:
+            f.write('suppression_list = %s\n' % db)
+        campaigns = batch.read_manifest(self.manifest, self.config)
+        keys = []
+        def factory(config):
+            keys.append(config.pickup_dir)
+            return self._factory(config)
+        runner = batch.Batch(campaigns, 2, factory)
+        self.assertEqual(runner.run(), 0)
+        # no session for the second campaign, all suppressed
+        self.assertEqual(keys, [op_.join(self.dir, 'pickup')])
+        self.assertEqual([(c.sent, c.suppressed) for c in campaigns],
+                         [(3, 0), (0, 2), (1, 0)])
+
+    def testPgpMime(self):
+        with open(self.config, 'w') as f:
+            f.write(CONFIG.replace('%(here)s', self.dir).replace(
+                '[other]', 'gpg_exe = gpg\ngpg_key_id = me\n[other]'))
+        with open(self.manifest, 'w') as f:
+            f.write(MANIFEST.replace('subject = news',
+                                     'subject = news\nsign = pgp-mime'))
+        campaigns = batch.read_manifest(self.manifest, self.config)
+        signed = []
+        def signer(config):
+            def sign(data):
+                signed.append(data)
+                return ('signature of %d bytes' % len(data)).encode()
+            return sign
+        runner = batch.Batch(campaigns, 2, self._factory, signer)
+        self.assertEqual(runner.run(), 0)
+        self.assertEqual(len(runner._pools), 0)
+        # once for each campaign, not for each recipient
+        self.assertEqual(len(signed), 3)
+        for sender, _, receiver, text in self.log:
+            self.assertTrue('multipart/signed' in text)
+            self.assertTrue('signature of' in text)
+        with open(self.manifest, 'a') as f:
+            f.write('[plain]\ntext_type = plain\nrecipients = x@y.z\n')
+        self.assertRaises(batch.BatchError,
+                          batch.read_manifest, self.manifest, self.config)
+
+    def testCommandLine(self):
+        proc = sbp.Popen([p_exe, m_exe, '-C', self.config,
+                          '--batch', self.manifest], stdout=sbp.PIPE)
+        out = proc.communicate()[0].decode('utf-8')
+        self.assertEqual(proc.returncode, 0)
+        self.assertTrue('[second] 2 sent, 0 errors' in out)
+        self.assertEqual(len(os.listdir(op_.join(self.dir, 'pickup'))), 4)
+        self.assertEqual(len(os.listdir(op_.join(self.dir, 'other'))), 2)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestBatch,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
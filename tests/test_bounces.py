@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_bounces file
+
+
+import os
+import os.path as op_
+import sys
+import shutil
+import mailbox
+import tempfile
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import bounces
+from Multimail.recipients import RecipientTable
+
+DSN = """From: MAILER-DAEMON@mx.example.org
+To: me@here.org
+Subject: Delivery Status Notification
+Message-ID: <%(id)s@mx.example.org>
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status;
+    boundary="BOUNDARY"
+
+--BOUNDARY
+Content-Type: text/plain
+
+Some messages were not delivered.
+
+--BOUNDARY
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.example.org
+
+Final-Recipient: rfc822; %(rcpt)s
+Action: %(action)s
+Status: %(status)s
+Diagnostic-Code: smtp; %(diagnostic)s
+
+Original-Recipient: rfc822;<ok@example.org>
+Final-Recipient: rfc822; ok@example.org
+Action: delivered
+Status: 2.0.0
+
+--BOUNDARY--
+"""
+
+EXIM = """From: Mail Delivery System <Mailer-Daemon@exim.example.org>
+To: me@here.org
+Subject: Mail delivery failed
+X-Failed-Recipients: gone@exim.example.org
+
+This message was created automatically by mail delivery software.
+"""
+
+PLAIN = """From: friend@example.org
+To: me@here.org
+Subject: hello
+
+not a bounce
+"""
+
+
+def dsn(msg_id, rcpt, status='5.1.1', action='failed',
+        diagnostic='550 5.1.1 user unknown'):
+    return DSN % dict(id=msg_id, rcpt=rcpt, status=status,
+                      action=action, diagnostic=diagnostic)
+
+
+class TestBounces(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = op_.join(self.dir, 'suppressed')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _mbox(self, name, messages):
+        path = op_.join(self.dir, name)
+        box = mailbox.mbox(path)
+        for text in messages:
+            box.add(text)
+        box.close()
+        return path
+
+    def testClassify(self):
+        self.assertEqual(bounces.classify('5.1.1', 'failed'), bounces.HARD)
+        self.assertEqual(bounces.classify('5.2.2', 'failed'), bounces.SOFT)
+        self.assertEqual(bounces.classify('4.4.1', 'failed'), bounces.SOFT)
+        self.assertEqual(bounces.classify('5.0.0', 'Delayed'), bounces.SOFT)
+        self.assertEqual(bounces.classify('2.0.0', 'delivered'), None)
+        self.assertEqual(bounces.classify('', 'failed'), bounces.HARD)
+
+    def testParse(self):
+        import email
+        msg = email.message_from_string(dsn('1', '<Dead@Example.org>'))
+        self.assertEqual(bounces.parse_dsn(msg),
+                         [('Dead@Example.org', bounces.HARD, '5.1.1',
+                           'smtp; 550 5.1.1 user unknown')])
+        msg = email.message_from_string(EXIM)
+        self.assertEqual(bounces.parse_dsn(msg),
+                         [('gone@exim.example.org', bounces.HARD, '', '')])
+        self.assertEqual(bounces.parse_dsn(email.message_from_string(PLAIN)),
+                         [])
+
+    def testProcess(self):
+        path = self._mbox('mbox', [
+            dsn('1', 'dead@example.org'), PLAIN, EXIM,
+            dsn('2', 'full@example.org', '4.2.2', 'delayed'),
+            dsn('3', 'full@example.org', '4.2.2', 'delayed')])
+        suppressed = bounces.SuppressionList(self.db)
+        self.assertEqual(suppressed.process(path),
+                         dict(messages=5, bounces=4, hard=2, soft=2))
+        # already seen, nothing new
+        self.assertEqual(suppressed.process(path)['bounces'], 0)
+        self.assertTrue('DEAD@example.org' in suppressed)
+        self.assertTrue('gone@exim.example.org' in suppressed)
+        self.assertFalse('full@example.org' in suppressed)
+        self.assertEqual(suppressed.get('full@example.org')[:3],
+                         (bounces.SOFT, 2, '4.2.2'))
+        # a Maildir with the third soft bounce
+        maildir = mailbox.Maildir(op_.join(self.dir, 'Maildir'))
+        maildir.add(dsn('4', 'full@example.org', '4.2.2', 'delayed'))
+        maildir.close()
+        suppressed.process(op_.join(self.dir, 'Maildir'))
+        self.assertTrue('full@example.org' in suppressed)
+        suppressed.remove('dead@example.org')
+        self.assertFalse('dead@example.org' in suppressed)
+        self.assertRaises(bounces.BounceError, suppressed.process,
+                          op_.join(self.dir, 'nothere'))
+        suppressed.close()
+
+    def testFilter(self):
+        table = RecipientTable(['a@b.c', 'dead@example.org', 'd@e.f'])
+        self.assertEqual(bounces.filter_recipients(table, self.db),
+                         (table, 0))
+        suppressed = bounces.SuppressionList(self.db)
+        suppressed.add('dead@example.org', bounces.HARD, '5.1.1')
+        suppressed.add('d@e.f', bounces.SOFT, '4.2.2')
+        suppressed.close()
+        kept, dropped = bounces.filter_recipients(table, self.db)
+        self.assertEqual((list(kept), dropped), (['a@b.c', 'd@e.f'], 1))
+
+    def testCommandLine(self):
+        path = self._mbox('mbox', [dsn('1', 'dead@example.org')])
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        common = [p_exe, m_exe, '-n', '--suppression-list', self.db]
+        out = sbp.Popen(common + ['--process-bounces', path],
+                        stdout=sbp.PIPE).communicate()[0].decode('utf-8')
+        self.assertTrue('1 bounces (1 hard, 0 soft)' in out)
+        proc = sbp.Popen(common + [
+            '--delivery', 'pickup', '--pickup-dir', pickup,
+            '-f', 'me@here.org', '-s', 'x', '-m', 'text',
+            '-r', 'dead@example.org', 'ok@example.org'], stdout=sbp.PIPE)
+        out = proc.communicate()[0].decode('utf-8')
+        self.assertEqual(proc.returncode, 0)
+        self.assertTrue('1 suppressed recipients skipped' in out)
+        self.assertEqual(len(os.listdir(pickup)), 1)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestBounces,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_credentials file
+
+
+import os
+import os.path as op_
+import sys
+import json
+import base64
+import shutil
+import tempfile
+import threading
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+sys.path.insert(0, pwd)
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import credentials
+from Multimail import delivery
+from fake_smtp import FakeSMTPServer
+
+
+class FakeOAuth2(credentials.OAuth2Credentials):
+    """OAuth2 provider with a fake token endpoint."""
+    def __init__(self, path):
+        super(FakeOAuth2, self).__init__(path)
+        self.requests = []
+
+    def request(self, url, data):
+        self.requests.append((url, data))
+        n = len(self.requests)
+        return dict(access_token='token%d' % n, expires_in=3600,
+                    refresh_token='refresh%d' % n)
+
+
+class TestCredentials(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testEnv(self):
+        os.environ['MULTIMAIL_TEST_PWD'] = 'secret'
+        try:
+            provider = credentials.from_spec('env:MULTIMAIL_TEST_PWD')
+            self.assertEqual(provider.get(), 'secret')
+        finally:
+            del os.environ['MULTIMAIL_TEST_PWD']
+        provider.invalidate()
+        self.assertRaises(credentials.CredentialError, provider.get)
+
+    def testFd(self):
+        rfd, wfd = os.pipe()
+        os.write(wfd, b'from the pipe\nother\n')
+        os.close(wfd)
+        provider = credentials.from_spec('fd:%d' % rfd)
+        self.assertEqual(provider.get(), 'from the pipe')
+        provider.invalidate()
+        self.assertEqual(provider.get(), 'from the pipe')
+
+    def testCommand(self):
+        counter = op_.join(self.dir, 'counter')
+        cmd = ('%s -c "import sys; f = open(sys.argv[1], \'a\');'
+               ' f.write(\'x\'); f.close(); print(\'pwd\')" %s'
+               % (p_exe, counter))
+        provider = credentials.from_spec('cmd:' + cmd, 60)
+        threads = [threading.Thread(target=provider.get) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual((provider.get(), provider.runs), ('pwd', 1))
+        provider.invalidate()
+        self.assertEqual((provider.get(), provider.runs), ('pwd', 2))
+        provider.ttl = 0
+        provider.invalidate()
+        provider.get()
+        provider.get()
+        self.assertEqual(provider.runs, 4)
+        with open(counter) as f:
+            self.assertEqual(f.read(), 'xxxx')
+        for spec in ('cmd:false', 'cmd:true', 'nothing', 'what:ever'):
+            self.assertRaises(credentials.CredentialError,
+                              lambda: credentials.from_spec(spec).get())
+
+    def testOAuth2(self):
+        path = op_.join(self.dir, 'oauth2.json')
+        with open(path, 'w') as f:
+            json.dump(dict(token_url='https://example.org/token',
+                           client_id='id', refresh_token='refresh0'), f)
+        provider = FakeOAuth2(path)
+        self.assertEqual(provider.mechanism, 'XOAUTH2')
+        self.assertEqual((provider.get(), provider.get()),
+                         ('token1', 'token1'))
+        self.assertEqual(provider.requests[0][1],
+                         dict(grant_type='refresh_token', client_id='id',
+                              refresh_token='refresh0'))
+        with open(path) as f:
+            self.assertEqual(json.load(f)['refresh_token'], 'refresh1')
+        provider._expires -= 3600  # expired
+        self.assertEqual(provider.get(), 'token2')
+        with open(path, 'w') as f:
+            f.write('{}')
+        self.assertRaises(credentials.CredentialError,
+                          credentials.OAuth2Credentials, path)
+
+    def testLogin(self):
+        def auth(line):
+            return line.endswith(base64.b64encode(b'\0me\0pwd').decode())
+        provider = credentials.from_spec('cmd:echo pwd')
+        with FakeSMTPServer(('AUTH PLAIN',), auth=auth) as server:
+            for _ in range(3):
+                sender = delivery.SendMails(server.host, server.port,
+                                            False, 10)
+                self.assertTrue(sender.login('me', provider))
+                sender.quit()
+            self.assertEqual(provider.runs, 1)
+            wrong = credentials.from_spec('cmd:echo wrong')
+            sender = delivery.SendMails(server.host, server.port, False, 10)
+            self.assertFalse(sender.login('me', wrong))
+            # asked again once
+            self.assertEqual(wrong.runs, 2)
+
+    def testXOAuth2(self):
+        path = op_.join(self.dir, 'oauth2.json')
+        with open(path, 'w') as f:
+            json.dump(dict(token_url='https://example.org/token',
+                           client_id='id', refresh_token='refresh0'), f)
+        provider = FakeOAuth2(path)
+        expected = credentials.xoauth2('me@here.org', 'token2')
+        with FakeSMTPServer(('AUTH XOAUTH2',),
+                            auth=lambda line: line.endswith(expected)
+                            ) as server:
+            sender = delivery.SendMails(server.host, server.port, False, 10)
+            # the first token is refused, the second one taken
+            self.assertTrue(sender.login('me@here.org', provider))
+            sender.quit()
+            self.assertEqual(len(provider.requests), 2)
+            self.assertEqual(base64.b64decode(expected.encode()),
+                             b'user=me@here.org\1auth=Bearer token2\1\1')
+
+    def testCommandLine(self):
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        proc = sbp.Popen([p_exe, m_exe, '-n', '--delivery', 'pickup',
+                          '--pickup-dir', pickup, '-f', 'me@here.org',
+                          '-s', 'x', '-m', 'text', '-r', 'a@b.org',
+                          '--password-source', 'bad'],
+                         stdout=sbp.PIPE, stderr=sbp.PIPE)
+        err = proc.communicate()[1].decode('utf-8')
+        self.assertEqual(proc.returncode, 2)
+        self.assertTrue('invalid password source' in err)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestCredentials,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_daemon file
+
+
+import os
+import os.path as op_
+import sys
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+sys.path.insert(0, pwd)
+
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+sys.path.insert(0, basepackdir)
+
+from Multimail import message
+from Multimail import daemon
+from Multimail import delivery
+from fake_smtp import FakeSMTPServer
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.smtp = FakeSMTPServer()
+        self.dir = tempfile.mkdtemp()
+        self.path = op_.join(self.dir, 'mm.sock')
+        factory = lambda: delivery.SendMails(
+            self.smtp.host, self.smtp.port, False, 10)
+        self.pool = daemon.SessionPool(factory, 'me', 'pwd', 2, 60)
+        self.server = daemon.Daemon(self.path, self.pool)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.close()
+        self.thread.join(5)
+        self.smtp.close()
+        shutil.rmtree(self.dir)
+
+    def testJobs(self):
+        msgs = (message.PlainMsg('me@here.org', '', 's', 'plain'),
+                message.MimeMsg('me@here.org', '', 's', 'mime', 'text',
+                                  [(op_.join(basepackdir, 'multimail.py'),
+                                    'spam')]))
+        for msg in msgs:
+            client = delivery.get_sender('daemon', daemon_socket=self.path)
+            self.assertTrue(client.login())
+            self.assertEqual(client.send(msg, ['a@b.c', 'd@e.f']), 0)
+            self.assertEqual((client.step, client.errors), (2, 0))
+        # one login, a RSET after each job
+        self.assertEqual(self.smtp.connections, 1)
+        self.assertEqual([c.split()[0].upper() for c in self.smtp.commands
+                          if c.split()[0].upper() in ('AUTH', 'RSET')],
+                         ['AUTH', 'RSET', 'RSET'])
+        self.assertEqual(len(self.smtp.messages), 4)
+        self.assertTrue(b'spam' in self.smtp.messages[-1][2])
+
+    def testKeepalive(self):
+        sender = self.pool.acquire()
+        self.pool.release(sender)
+        self.pool.keepalive = 0
+        self.pool.ping()
+        self.assertTrue('NOOP' in [c.upper() for c in self.smtp.commands])
+        self.assertEqual(self.pool.acquire(), sender)
+
+    def testErrors(self):
+        self.assertFalse(daemon.DaemonClient(self.path + 'x').login())
+        self.assertRaises(daemon.DaemonError,
+                          daemon.Daemon, self.path, self.pool)
+        reply = daemon.request(self.path, {'command': 'spam'})
+        self.assertFalse(reply['ok'])
+
+    def testSendErrors(self):
+        job = {'sender': 'me@here.org', 'subject': 's', 'text': 'mime',
+               'text_type': 'text',
+               'attachments': [[op_.join(self.dir, 'missing'), 'x']]}
+        reply = daemon.request(self.path, {'command': 'send', 'message': job,
+                                           'recipients': ['a@b.c']})
+        self.assertFalse(reply['ok'])
+        self.assertTrue('missing' in reply['error'])
+        class Broken(delivery.SendMails):
+            def send(self, *args):
+                raise socket.error("connection reset")
+        factory = self.pool.factory
+        self.pool.factory = lambda: Broken(self.smtp.host, self.smtp.port,
+                                           False, 10)
+        job = daemon.message_to_job(
+            message.PlainMsg('me@here.org', '', 's', 'plain'))
+        req = {'command': 'send', 'message': job, 'recipients': ['a@b.c']}
+        reply = daemon.request(self.path, req)
+        self.assertFalse(reply['ok'])
+        self.assertTrue('connection reset' in reply['error'])
+        self.assertEqual(self.pool._idle, [])  # the session is dropped
+        self.pool.factory = factory
+        reply = daemon.request(self.path, req)
+        self.assertEqual((reply['ok'], reply['retval']), (True, 0))
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestDaemon,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_deadlines file
+
+
+import os
+import os.path as op_
+import sys
+import time
+import shutil
+import tempfile
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+sys.path.insert(0, pwd)
+
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+sys.path.insert(0, basepackdir)
+m_exe = op_.join(basepackdir, 'multimail.py')
+
+from Multimail import deadlines
+from Multimail import delivery
+from Multimail import message
+from Multimail import settings
+from fake_smtp import FakeSMTPServer
+import multimail
+
+
+class TestDeadlines(unittest.TestCase):
+    def testParse(self):
+        d = deadlines.parse('connect=5, data=10 data_per_mb=2')
+        self.assertEqual((d.connect, d.data, d.data_per_mb), (5, 10, 2))
+        self.assertEqual(d.envelope, deadlines.DEFAULTS['envelope'])
+        self.assertEqual(d.expires, None)
+        self.assertEqual(d.remaining(), None)
+        self.assertFalse(d.expired())
+        for spec in ('connect', 'foo=3', 'data=x', 'auth=0', 'auth=-1'):
+            self.assertRaises(ValueError, deadlines.parse, spec)
+        self.assertRaises(ValueError, deadlines.Deadlines, foo=1)
+        self.assertRaises(settings.SettingsError, settings.validate,
+                          {'phase_timeouts': 'greeting=none'})
+        self.assertEqual(settings.validate(
+            {'phase_timeouts': 'auth=3'}).phase_timeouts, 'auth=3')
+
+    def testTimeout(self):
+        d = deadlines.parse('data=10 data_per_mb=4')
+        self.assertEqual(d.timeout('data'), 10)
+        self.assertEqual(d.timeout('data', 3 << 19), 16)
+        self.assertEqual(d.timeout('envelope', 3 << 19), 60)
+        d = deadlines.parse('data=10', 1)
+        self.assertTrue(0 < d.timeout('data', 1 << 30) <= 1)
+        d.expires = time.time() - 1
+        self.assertTrue(d.expired())
+        self.assertEqual(d.timeout('connect'), deadlines.MIN_TIMEOUT)
+        # the phases left out take the sender timeout
+        d = deadlines.parse('data=10', 3600, 50)
+        self.assertEqual((d.connect, d.envelope, d.data), (50, 50, 10))
+        self.assertEqual(d.data_per_mb, deadlines.DEFAULTS['data_per_mb'])
+
+    def testConfigTimeout(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = op_.join(tmp, 'multimail.cfg')
+            with open(path, 'w') as f:
+                f.write('[DEFAULT]\ntimeout = 50\n')
+            parser = multimail.parsopts.get_parser()
+            opts = parser.parse_args(['-C', path, '--deadline', '3600'])
+            multimail.apply_settings(opts, settings.load(path, opts.u_set))
+            d = multimail.get_deadlines(opts, parser)
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(d.timeout('connect'), 50)
+        self.assertEqual(d.timeout('data'), 50)
+
+    def testCommandLine(self):
+        args = [sys.executable, m_exe, '-n', '-H', '127.0.0.1', '-P', '1',
+                '-f', 'me@here.org', '-s', 'x', '-m', 'text', '-r', 'a@b.c',
+                '-p', 'pwd']
+        for extra in (['--phase-timeouts', 'connect=1 foo=2'],
+                      ['--deadline', '-1']):
+            proc = sbp.Popen(args + extra, stdout=sbp.PIPE, stderr=sbp.PIPE)
+            err = proc.communicate()[1].decode('utf-8')
+            self.assertEqual(proc.returncode, 2)
+            self.assertTrue('error:' in err)
+
+
+class TestRecycle(unittest.TestCase):
+    def setUp(self):
+        self.msg = message.MimeMsg('me@here.org', '', 's', 't', 'text', [])
+
+    def _sender(self, server, spec, run=None):
+        sender = delivery.SendMails(server.host, server.port, False, 10)
+        sender.verbose = False
+        sender.deadlines = deadlines.parse(spec, run)
+        return sender
+
+    def testStalled(self):
+        recs = ['a@b.c', 'x@y.z', 'd@e.f']
+        with FakeSMTPServer(stall=('x@y.z',)) as server:
+            sender = self._sender(server, 'envelope=0.3 data=0.3')
+            self.assertTrue(sender.login('me', 'pwd'))
+            self.assertEqual(sender.send(self.msg, recs), 0)
+            self.assertEqual(sender.step, 3)
+            self.assertEqual([m[1] for m in server.messages],
+                             [[r] for r in recs])
+            self.assertEqual(server.connections, 2)
+            self.assertEqual(server.commands.count('AUTH PLAIN AG1lAHB3ZA=='),
+                             2)
+
+    def testMaxRecycle(self):
+        stalled = ['s%d@b.c' % n for n in range(deadlines.MAX_RECYCLE + 1)]
+        with FakeSMTPServer(stall=stalled) as server:
+            sender = self._sender(server, 'envelope=0.2 data=0.2')
+            self.assertTrue(sender.login('me', 'pwd'))
+            # each one is sent after a new connection, but the last
+            self.assertEqual(sender.send(self.msg, stalled), 3)
+            self.assertEqual(server.connections, deadlines.MAX_RECYCLE + 1)
+            self.assertEqual([m[1] for m in server.messages],
+                             [[r] for r in stalled[:-1]])
+
+    def testGreeting(self):
+        with FakeSMTPServer(stall_banner=True) as server:
+            sender = self._sender(server, 'greeting=0.2')
+            started = time.time()
+            self.assertFalse(sender.login('me', 'pwd'))
+            self.assertTrue(time.time() - started < 5)
+
+    def testRunDeadline(self):
+        with FakeSMTPServer() as server:
+            sender = self._sender(server, '', 60)
+            self.assertTrue(sender.login('me', 'pwd'))
+            sender.deadlines.expires = time.time() - 1
+            self.assertEqual(sender.send(self.msg, ['a@b.c', 'd@e.f']), 3)
+            self.assertEqual((sender.step, sender.errors), (0, 2))
+            self.assertEqual(server.messages, [])
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestDeadlines, TestRecycle)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_delivery file
+
+
+import os
+import os.path as op_
+import sys
+import glob
+import shutil
+import tempfile
+import email.parser
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+sys.path.insert(0, basepackdir)
+
+from Multimail import message
+from Multimail import delivery
+
+FAKE_SENDMAIL = """#!%s
+import os, sys
+out_dir = %r
+data = sys.stdin.read()
+if %d:
+    sys.exit(%d)
+with open(os.path.join(out_dir, str(os.getpid())), 'w') as f:
+    f.write(data)
+"""
+
+
+class TestPickup(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testSend(self):
+        recs = ['foo@bar.baz', 'spam@eggs.org', 'x@y.z']
+        msg = message.PlainMsg('me@here.org', '', 'subj', 'text')
+        sender = delivery.get_sender('pickup', pickup_dir=self.dir)
+        self.assertTrue(sender.login())
+        self.assertEqual(sender.send(msg, recs), 0)
+        self.assertEqual(sender.errors, 0)
+        files = glob.glob(op_.join(self.dir, '*.eml'))
+        self.assertEqual(len(files), len(recs))
+        # no temporary files left
+        self.assertEqual(len(os.listdir(self.dir)), len(recs))
+        got = []
+        for path in files:
+            with open(path) as f:
+                got.append(email.parser.Parser().parse(f)['to'])
+        self.assertEqual(sorted(got), sorted(recs))
+
+    def testNoDir(self):
+        sender = delivery.PickupDirSender(op_.join(self.dir, 'nodir'))
+        self.assertFalse(sender.login())
+
+
+class TestSendmailPipe(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.out_dir = op_.join(self.dir, 'out')
+        os.mkdir(self.out_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _fake_exe(self, fail_status):
+        exe = op_.join(self.dir, 'sendmail')
+        with open(exe, 'w') as f:
+            f.write(FAKE_SENDMAIL % (sys.executable, self.out_dir,
+                                     fail_status, fail_status))
+        os.chmod(exe, 0o755)
+        return exe
+
+    def testSend(self):
+        recs = ['a@b.c', 'd@e.f', 'g@h.i', 'l@m.n']
+        msg = message.MimeMsg('me@here.org', '', 'subj', 'text', 'text', [])
+        for procs in (1, 3):
+            for f in os.listdir(self.out_dir):
+                os.remove(op_.join(self.out_dir, f))
+            sender = delivery.SendmailPipeSender(
+                [self._fake_exe(0)], procs)
+            self.assertTrue(sender.login())
+            self.assertEqual(sender.send(msg, recs), 0)
+            self.assertEqual(sender.step, len(recs))
+            self.assertEqual(len(os.listdir(self.out_dir)), len(recs))
+
+    def testFailures(self):
+        recs = ['a@b.c', 'd@e.f', 'g@h.i']
+        msg = message.PlainMsg('me@here.org', '', 'subj', 'text')
+        sender = delivery.SendmailPipeSender([self._fake_exe(75)], 1)
+        self.assertTrue(sender.login())
+        self.assertEqual(sender.send(msg, recs), 255)
+        self.assertEqual(sender.errors, len(recs))
+        self.assertEqual(sender.step, 0)
+
+    def testNoExe(self):
+        sender = delivery.get_sender(
+            'sendmail', sendmail_cmd=op_.join(self.dir, 'nocmd -t'))
+        self.assertFalse(sender.login())
+        self.assertRaises(delivery.DeliveryError,
+                          delivery.get_sender, 'pigeon')
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestPickup, TestSendmailPipe)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
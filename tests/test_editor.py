@@ -27,6 +27,158 @@ except ImportError:
 from Multimail import editor
 
 
+class FakeWindow(object):
+    """Curses window replacement, reading the keys from *keys*,
+    logging the cleared rows in self.cleared and the drawn ones
+    in self.drawn. If *burst* the keys are available all at once,
+    otherwise one at time."""
+    def __init__(self, keys, rows=5, cols=20, burst=False):
+        self.keys = list(keys)
+        self.burst = burst
+        self.delay = True
+        self.refreshed = 0
+        self.size = (rows, cols)
+        self.cleared = []
+        self.drawn = []
+        self.scrolled = []
+        self.cursor = (0, 0)
+    def getmaxyx(self):
+        return self.size
+    def idlok(self, *args):
+        pass
+    scrollok = keypad = idlok
+    def nodelay(self, flag):
+        self.delay = not flag
+    def noutrefresh(self):
+        self.refreshed += 1
+    def move(self, y, x):
+        self.cursor = (y, x)
+    def clrtoeol(self):
+        self.cleared.append(self.cursor[0])
+    def insstr(self, y, x, text):
+        self.drawn.append((y, text))
+    def scrl(self, n):
+        self.scrolled.append(n)
+    def getch(self):
+        if not (self.delay or self.burst and self.keys):
+            return -1
+        if self.keys:
+            key = self.keys.pop(0)
+            return ord(key) if isinstance(key, str) else key
+        return 7
+
+
+class TestGapBuffer(unittest.TestCase):
+    def testEdit(self):
+        line = editor.GapBuffer('hello')
+        line.insert(5, ' world')
+        line.insert(0, '>')
+        line.delete(1, 1)
+        self.assertEqual(line.text(), '>ello world')
+        line.insert(3, 'x' * 200)
+        line.delete(3, 200)
+        line.delete(10, 5)
+        self.assertEqual((line.text(), len(line)), ('>ello worl', 10))
+        tail = line.split(5)
+        self.assertEqual((line.text(), tail.text()), ('>ello', ' worl'))
+        self.assertEqual(tail.rows(2), [' w', 'or', 'l'])
+        self.assertEqual(line.rows(5), ['>ello', ''])
+        line.insert(0, 'a')
+        self.assertEqual(line.rows(5), ['a>ell', 'o'])
+
+
+class TestCursesEditor(unittest.TestCase):
+    def setUp(self):
+        if not editor.YOU_HAVE_CURSES:
+            self.skipTest('curses not available')
+        self._saved = (editor.curses.doupdate, editor.curses.beep)
+        editor.curses.doupdate = editor.curses.beep = lambda: None
+
+    def tearDown(self):
+        editor.curses.doupdate, editor.curses.beep = self._saved
+
+    def _edit(self, keys, encoding='ascii', **kwargs):
+        win = FakeWindow(keys, **kwargs)
+        ed = editor.Editor(encoding, win)
+        ed.quit_curses = lambda: None  # keep the terminal alone
+        ed.edit()
+        return ed, win
+
+    def _text(self, ed):
+        text = ed.save_text()
+        return text if isinstance(text, str) else text.decode('utf-8')
+
+    def testRedraw(self):
+        ed, win = self._edit('ab\nc')
+        self.assertEqual(self._text(ed), 'ab\nc')
+        # first the whole screen, then only the changed rows
+        self.assertEqual(win.cleared, [0, 1, 2, 3, 4, 0, 0, 1])
+        self.assertEqual(win.drawn, [(0, 'a'), (0, 'ab'), (1, 'c')])
+        self.assertEqual(win.cursor, (1, 1))
+
+    def testScroll(self):
+        ed, win = self._edit('\n' * 8 + 'x', rows=5)
+        self.assertEqual(ed._top, (4, 0))
+        self.assertEqual(win.scrolled, [1, 1, 1, 1])
+        self.assertEqual(win.cursor, (4, 1))
+        self.assertEqual(win.drawn[-1], (4, 'x'))
+        ed, win = self._edit('\n' * 8 + 'x' + '\x1bOH', rows=5)
+        self.assertEqual(ed._top, (0, 0))
+        self.assertEqual(win.scrolled[-1], -4)
+        self.assertEqual(self._text(ed), '\n' * 8 + 'x')
+
+    def testWrap(self):
+        ed, win = self._edit('abcdefghijk', cols=5)
+        self.assertEqual(win.cursor, (2, 1))
+        self.assertEqual(ed._screen_rows(), ['abcde', 'fghij', 'k', '', ''])
+        # up moves by rows, left from the start of a row goes back
+        ed, win = self._edit('abcdefghijk\x1b[A\x1b[D\x1b[D', cols=5)
+        self.assertEqual((ed._actualX, win.cursor), (4, (0, 4)))
+        # long text, scroll inside a wrapped line
+        ed, win = self._edit('x' * 40, rows=3, cols=5)
+        self.assertEqual(ed._top, (0, 6))
+        self.assertEqual(win.cursor, (2, 0))
+
+    def testEditing(self):
+        keys = ('one two\x1b[D\x1b[D\x1b[D\x0b'  # C-k: cut 'two'
+                '\nzero \x15'                      # C-u: paste it
+                '\x1b[A\x1bOF\x08\x08'            # up, end of text, 2 bs
+                '\x1bOH\x1b[3~\x0f')               # home, delete, C-o
+        ed, win = self._edit(keys)
+        self.assertEqual([l.text() for l in ed.lines],
+                         ['ne ', '', 'zero t'])
+        self.assertEqual(ed.buffer, 'two')
+        ed, win = self._edit('ab\nc\x1bOH\x1b[B\x1b[D\x04\x08')
+        self.assertEqual(self._text(ed), 'ac')
+
+    def testPaste(self):
+        text = u'line1\r\nline2\tx\n\xe8\x01'
+        keys = ('a\x1b[200~' + text.encode('utf-8').decode('latin-1')
+                + '\x1b[201~z')
+        ed, win = self._edit([ord(c) for c in keys], 'UTF-8')
+        self.assertEqual([l.text() for l in ed.lines],
+                         ['aline1', 'line2   x', u'\xe8z'])
+        # start, 'a', paste, 'z'
+        self.assertEqual(win.refreshed, 4)
+        # paste in the middle of a line
+        ed, win = self._edit('ab\x1b[D\x1b[200~1\n2\x1b[201~')
+        self.assertEqual([l.text() for l in ed.lines], ['a1', '2b'])
+        self.assertEqual(win.cursor, (1, 1))
+
+    def testBurst(self):
+        text = 'x' * 3000 + '\n' + 'y' * 10
+        ed, win = self._edit(text, burst=True, rows=10, cols=80)
+        self.assertEqual(self._text(ed), text)
+        self.assertEqual(win.refreshed, 2)
+        self.assertEqual(win.cursor, (9, 10))
+
+    def testUnicode(self):
+        keys = list(bytearray(u'caff\xe8 \u20ac'.encode('utf-8')))
+        ed, win = self._edit(keys, 'UTF-8')
+        self.assertEqual(ed.lines[0].text(), u'caff\xe8 \u20ac')
+        self.assertEqual(win.cursor, (0, 7))
+
+
 class TestMisc(unittest.TestCase):
     def testNoCurses(self):
         texts = ('foo, bar and baz',
@@ -47,7 +199,7 @@ class TestMisc(unittest.TestCase):
 
 def load_tests():
     loader = unittest.TestLoader()
-    test_cases = (TestMisc,)
+    test_cases = (TestMisc, TestGapBuffer, TestCursesEditor)
     return (loader.loadTestsFromTestCase(t) for t in test_cases)
 
 
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_esmtp file
+
+
+import os
+import os.path as op_
+import sys
+import shutil
+import smtplib
+import tempfile
+import subprocess as sbp
+import unittest
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+pwd = op_.dirname(op_.realpath(__file__))
+sys.path.insert(0, pwd)
+
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+sys.path.insert(0, basepackdir)
+
+from Multimail import message
+from Multimail import esmtp
+from Multimail import delivery
+from fake_smtp import FakeSMTPServer
+
+MSG = ('From: me@here.org\nTo: you@there.org\nSubject: dots\n\n'
+       'first line\n.second line\n..third line\r\n.\nlast')
+CRLF_MSG = MSG.replace('\r\n', '\n').replace('\n', '\r\n').encode('ascii')
+
+
+class TestPipelining(unittest.TestCase):
+    def _sendmail(self, server, rcpts, chunk_size=esmtp.CHUNK_SIZE):
+        conn = esmtp.ESMTP(server.host, server.port, timeout=10)
+        conn.chunk_size = chunk_size
+        try:
+            return conn.sendmail('me@here.org', rcpts, MSG)
+        finally:
+            conn.quit()
+
+    def testChunking(self):
+        for chunk_size in (esmtp.CHUNK_SIZE, 7):
+            with FakeSMTPServer() as server:
+                refused = self._sendmail(server, ['a@b.c', 'd@e.f'],
+                                         chunk_size)
+                self.assertEqual(refused, {})
+                self.assertEqual(server.messages,
+                                 [('me@here.org', ['a@b.c', 'd@e.f'],
+                                   CRLF_MSG)])
+                bdat = [c for c in server.commands if c.startswith('BDAT')]
+                self.assertTrue(bdat[-1].endswith('LAST'))
+                self.assertEqual(len(bdat) > 1, chunk_size == 7)
+                self.assertFalse('DATA' in server.commands)
+
+    def testData(self):
+        with FakeSMTPServer(('PIPELINING',)) as server:
+            self.assertEqual(self._sendmail(server, 'a@b.c'), {})
+            self.assertEqual(server.messages,
+                             [('me@here.org', ['a@b.c'], CRLF_MSG + b'\r\n')])
+            self.assertTrue('DATA' in server.commands)
+
+    def testNoPipelining(self):
+        with FakeSMTPServer(('8BITMIME',)) as server:
+            self.assertEqual(self._sendmail(server, 'a@b.c'), {})
+            self.assertEqual(len(server.messages), 1)
+
+    def testRefused(self):
+        for exts in (('PIPELINING',), ('PIPELINING', 'CHUNKING')):
+            with FakeSMTPServer(exts, refuse=('x@y.z', 'k@j.w')) as server:
+                conn = esmtp.ESMTP(server.host, server.port, timeout=10)
+                refused = conn.sendmail('me@here.org', ['a@b.c', 'x@y.z'], MSG)
+                self.assertEqual(list(refused.keys()), ['x@y.z'])
+                self.assertEqual(refused['x@y.z'][0], 550)
+                self.assertRaises(smtplib.SMTPRecipientsRefused,
+                                  conn.sendmail, 'me@here.org',
+                                  ['x@y.z', 'k@j.w'], MSG)
+                # the connection is still usable
+                conn.sendmail('me@here.org', ['d@e.f'], MSG)
+                conn.quit()
+                self.assertEqual([m[1] for m in server.messages],
+                                 [['a@b.c'], ['d@e.f']])
+
+    def testSendMails(self):
+        recs = ['a@b.c', 'x@y.z', 'd@e.f']
+        with FakeSMTPServer(refuse=('x@y.z',)) as server:
+            msg = message.MimeMsg('me@here.org', '', 's', 't', 'text', [])
+            sender = delivery.SendMails(server.host, server.port, False, 10)
+            self.assertTrue(sender.login('me', 'pwd'))
+            self.assertEqual(sender.send(msg, recs), 255)
+            self.assertEqual((sender.step, sender.errors), (2, 1))
+            self.assertEqual([m[1] for m in server.messages],
+                             [['a@b.c'], ['d@e.f']])
+
+    def testPrepared(self):
+        expected = b'Subject: x\r\n\r\nbody\r\n.dot\r\nend'
+        for exts in (('PIPELINING', 'CHUNKING'), ('PIPELINING',), ()):
+            # spooled in a temporary file
+            body = esmtp.PreparedBody(b'body\n.dot\nend', 4)
+            with FakeSMTPServer(exts) as server:
+                conn = esmtp.ESMTP(server.host, server.port, timeout=10)
+                conn.chunk_size = 3
+                for rec in ('a@b.c', 'd@e.f'):
+                    conn.send_prepared('me@here.org', rec,
+                                       b'Subject: x\n\n', body)
+                conn.quit()
+                data = expected + (b'' if 'CHUNKING' in exts else b'\r\n')
+                self.assertEqual(server.messages,
+                                 [('me@here.org', [r], data)
+                                  for r in ('a@b.c', 'd@e.f')])
+            body.close()
+
+    def testMessageParts(self):
+        attachment = op_.join(tempfile.mkdtemp(), 'data.txt')
+        try:
+            with open(attachment, 'w') as f:
+                f.write('.attached\n' * 100)
+            for msg in (message.PlainMsg('me@here.org', '', 's', 'text\n.'),
+                        message.MimeMsg('me@here.org', '', 's', 'text',
+                                        'text', [(attachment, None)])):
+                headers, body = msg.get_parts('a@b.c')
+                other, same = msg.get_parts('d@e.f')
+                self.assertTrue(body is same)
+                self.assertTrue(b'\r\nTo: d@e.f\r\n' in other)
+                whole = esmtp.fix_eols(msg.get_message('a@b.c').encode())
+                self.assertEqual(whole.split(b'\r\n\r\n', 1)[1],
+                                 body.getvalue())
+                self.assertEqual(
+                    sorted(l for l in whole.split(b'\r\n\r\n')[0].split(
+                        b'\r\n') if not l.startswith(b'Date:')),
+                    sorted(l for l in headers[:-4].split(b'\r\n')
+                           if not l.startswith(b'Date:')))
+        finally:
+            shutil.rmtree(op_.dirname(attachment))
+
+    def test8bit(self):
+        text = u'un caff\xe8 per favore, grazie mille\n' * 50
+        for exts, body in ((('AUTH PLAIN', '8BITMIME'), b'8bit'),
+                           (('AUTH PLAIN',), b'quoted-printable')):
+            with FakeSMTPServer(exts) as server:
+                msg = message.MimeMsg('me@here.org', '', 's', text,
+                                      'text', [])
+                sender = delivery.SendMails(server.host, server.port,
+                                            False, 10)
+                sender.verbose = False
+                self.assertTrue(sender.login('me', 'pwd'))
+                self.assertEqual(sender.send(msg, ['a@b.c']), 0)
+                data = server.messages[0][2]
+                self.assertTrue(b'Content-Transfer-Encoding: ' + body in data)
+                mail = [c for c in server.commands if c.upper().startswith('MAIL')]
+                self.assertEqual(mail[0].endswith('BODY=8BITMIME'),
+                                 body == b'8bit')
+                if body == b'8bit':
+                    self.assertTrue(text.encode('utf-8').replace(
+                        b'\n', b'\r\n') in data)
+
+
+class TestTLS(unittest.TestCase):
+    def setUp(self):
+        if not hasattr(ssl, 'SSLSession'):
+            self.skipTest('TLS session resumption not available')
+        self.dir = tempfile.mkdtemp()
+        cert, key = (op_.join(self.dir, f) for f in ('cert.pem', 'key.pem'))
+        try:
+            sbp.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048',
+                            '-nodes', '-days', '1', '-subj', '/CN=localhost',
+                            '-keyout', key, '-out', cert],
+                           stdout=sbp.PIPE, stderr=sbp.PIPE)
+        except (OSError, sbp.CalledProcessError):
+            shutil.rmtree(self.dir)
+            self.skipTest("can't create a certificate (openssl needed)")
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        esmtp.set_tls_context(None)
+
+    def _run(self, implicit_tls):
+        esmtp.set_tls_context(None)
+        recs = ['a@b.c', 'd@e.f']
+        resumed = []
+        with FakeSMTPServer(ssl_context=self.context,
+                            implicit_tls=implicit_tls) as server:
+            for rec in recs:
+                msg = message.PlainMsg('me@here.org', '', 's', 't')
+                sender = delivery.SendMails(server.host, server.port,
+                                            implicit_tls, 10,
+                                            not implicit_tls)
+                self.assertTrue(sender.login('me', 'pwd'))
+                resumed.append(sender.connection.tls_resumed)
+                self.assertEqual(sender.send(msg, [rec]), 0)
+            self.assertEqual([m[1] for m in server.messages],
+                             [[r] for r in recs])
+            if not implicit_tls:
+                self.assertEqual(server.commands.count('STARTTLS'), 2)
+        self.assertEqual(resumed, [False, True])
+
+    def testStartTLS(self):
+        self._run(False)
+
+    def testImplicitTLS(self):
+        self._run(True)
+
+    def testNoStartTLS(self):
+        with FakeSMTPServer() as server:
+            sender = delivery.SendMails(server.host, server.port,
+                                        False, 10, True)
+            self.assertFalse(sender.login('me', 'pwd'))
+            self.assertEqual(sender.connection, None)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestPipelining, TestTLS)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -7,6 +7,9 @@
 import sys
 import os
 import os.path as op_
+import base64
+import shutil
+import tempfile
 from io import BytesIO
 import email.message
 import email.parser
@@ -26,7 +29,7 @@ p_exe = sys.executable
 basepackdir = op_.join(op_.split(pwd)[0], 'src')
 sys.path.insert(0, basepackdir)
 
-import multimail
+from Multimail import message
 
 
 class TestMessage(unittest.TestCase):
@@ -36,7 +39,7 @@ class TestMessage(unittest.TestCase):
                  ('unknown@nowhere.foo', 'x@y.z, bar@bar.bar', 'X', 'Y'),]
        #sender, receiver, subject, text
        for vals in values:
-           msg = multimail.PlainMsg(*vals)
+           msg = message.PlainMsg(*vals)
            headers = email.parser.Parser().parsestr(msg.get_message())
            for p, h in enumerate(('from', 'to', 'subject')):
                self.assertEqual(headers[h], vals[p])
@@ -49,7 +52,7 @@ class TestMessage(unittest.TestCase):
                   'text', [(op_.join(basepackdir, 'multimail.py'), 'spam')]),]
        #sender, receiver, subject, text, ttype, attachments
        for vals in values:
-           msg = multimail.MimeMsg(*vals)
+           msg = message.MimeMsg(*vals)
            headers = email.parser.Parser().parsestr(msg.get_message())
            if vals[-1]:
                self.assertTrue(isinstance(msg.msg, MIMEMultipart))
@@ -73,9 +76,107 @@ class TestMessage(unittest.TestCase):
                                            
                    
             
+class TestEncoding(unittest.TestCase):
+   def testChoose(self):
+       latin = u'caff\xe8 e t\xe8, per favore\n'.encode('utf-8') * 20
+       cjk = u'\u4f60\u597d\u4e16\u754c\n'.encode('utf-8') * 20
+       for data, eightbit, expected in (
+               (b'plain ascii\n', False, '7bit'),
+               (b'plain ascii\n', True, '7bit'),
+               (latin, False, 'quoted-printable'),
+               (latin, True, '8bit'),
+               (cjk, False, 'base64'),
+               (cjk, True, '8bit'),
+               (b'x' * 1000, True, 'quoted-printable'),
+               (b'\0\xff' * 10, True, 'base64')):
+           self.assertEqual(message.choose_encoding(data, eightbit), expected)
+
+   def testMime(self):
+       text = u'un caff\xe8 per favore, grazie mille\n' * 50
+       for attachments in ([], [(op_.join(basepackdir, 'multimail.py'), 'x')]):
+           msg = message.MimeMsg('me@here.org', 'you@there.org', 's',
+                                 text, 'text', attachments)
+           part = msg._text_part
+           self.assertEqual(part['Content-Transfer-Encoding'],
+                            'quoted-printable')
+           self.assertEqual(part.get_payload(decode=True),
+                            text.encode('utf-8'))
+           size = len(msg.get_message())
+           msg.set_8bit(True)
+           self.assertEqual(len(part.get_all('Content-Transfer-Encoding')), 1)
+           self.assertEqual(part['Content-Transfer-Encoding'], '8bit')
+           out = msg.get_message()
+           out = out if isinstance(out, bytes) else out.encode('utf-8')
+           self.assertTrue(text.encode('utf-8') in out)
+           self.assertTrue(len(out) < size)
+           msg.set_8bit(False)
+           self.assertEqual(part['Content-Transfer-Encoding'],
+                            'quoted-printable')
+
+
+class TestAttachmentCache(unittest.TestCase):
+   def setUp(self):
+       self.dir = tempfile.mkdtemp()
+       self.files = []
+       for n in range(3):
+           path = op_.join(self.dir, 'att%d' % n)
+           with open(path, 'wb') as f:
+               f.write(os.urandom(3000))
+           self.files.append(path)
+
+   def tearDown(self):
+       shutil.rmtree(self.dir)
+
+   def testCache(self):
+       cache = message.AttachmentCache()
+       first = cache.get(self.files[0])
+       with open(self.files[0], 'rb') as f:
+           self.assertEqual(base64.b64decode(first), f.read())
+       self.assertTrue(cache.get(self.files[0]) is first)
+       self.assertEqual((cache.hits, cache.misses), (1, 1))
+       with open(self.files[0], 'ab') as f:
+           f.write(b'changed')
+       changed = cache.get(self.files[0])
+       self.assertNotEqual(changed, first)
+       self.assertEqual((cache.misses, len(cache)), (2, 1))
+       self.assertRaises(IOError, cache.get, op_.join(self.dir, 'nothere'))
+
+   def testSpool(self):
+       # room for one part in memory, the others are spooled
+       cache = message.AttachmentCache(max_bytes=5000, spool_size=4500)
+       parts = [cache.get(path) for path in self.files]
+       self.assertEqual((len(cache._parts), len(cache._spooled)), (1, 2))
+       self.assertTrue(cache.size <= 5000)
+       self.assertEqual([cache.get(path) for path in self.files], parts)
+       self.assertEqual((cache.hits, cache.misses), (3, 3))
+       big = message.AttachmentCache(spool_size=100)
+       self.assertEqual(big.get(self.files[0]), parts[0])
+       self.assertEqual((big.size, len(big._spooled)), (0, 1))
+       spool_dir = big._dir
+       big.clear()
+       self.assertFalse(op_.exists(spool_dir))
+
+   def testRebuild(self):
+       cache = message.ATTACHMENTS
+       misses = cache.misses
+       attachments = [(path, None) for path in self.files]
+       msg = message.MimeMsg('me@here.org', 'you@there.org', 's',
+                             'text', 'text', list(attachments))
+       sign = op_.join(self.dir, 'sign')
+       with open(sign, 'w') as f:
+           f.write('signature')
+       msg.sign(sign, True)
+       other = message.MimeMsg('me@here.org', 'you@there.org', 's',
+                               'other', 'text', list(attachments))
+       self.assertEqual(cache.misses - misses, 4)
+       self.assertEqual(len(msg.msg.get_payload()), 5)
+       self.assertEqual(msg.msg.get_payload()[1].get_payload(decode=True),
+                        other.msg.get_payload()[1].get_payload(decode=True))
+
+
 def load_tests():
     loader = unittest.TestLoader()
-    test_cases = (TestMessage,)
+    test_cases = (TestMessage, TestEncoding, TestAttachmentCache)
     return (loader.loadTestsFromTestCase(t) for t in test_cases)
 
 
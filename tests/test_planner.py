@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_planner file
+
+
+import os
+import os.path as op_
+import re
+import sys
+import shutil
+import tempfile
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import bounces
+from Multimail import planner
+
+
+RECIPIENTS = ['z@b.org', 'a@c.org', 'x@A.org', ' ', 'b@b.org', 'z@B.ORG',
+              'y@a.org', 'a@c.org', 'm@b.org', 'A@c.org']
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testSort(self):
+        expected = ['x@a.org', 'y@a.org', 'b@b.org', 'm@b.org', 'z@b.org',
+                    'A@c.org', 'a@c.org']
+        for run_size, runs in ((3, 3), (100, 0)):
+            plan = planner.Planner(run_size, self.dir)
+            self.assertEqual(list(plan.sort(RECIPIENTS)), expected)
+            self.assertEqual(plan.runs, runs)
+            self.assertEqual((plan.total, plan.duplicates), (9, 2))
+            self.assertEqual(plan.domains, {'a.org': 2, 'b.org': 3,
+                                            'c.org': 2})
+            self.assertEqual(os.listdir(self.dir), [])
+
+    def testBig(self):
+        addresses = ['user%d@domain%d.org' % (n, n % 13)
+                     for n in range(5000)]
+        plan = planner.Planner(500, self.dir)
+        result = list(plan.sort(reversed(addresses)))
+        self.assertEqual(plan.runs, 10)
+        self.assertEqual(sorted(result), sorted(addresses))
+        domains = [a.partition('@')[2] for a in result]
+        self.assertEqual(domains, sorted(domains))
+
+    def testReport(self):
+        plan = planner.Planner()
+        list(plan.sort(RECIPIENTS))
+        report = plan.report(2)
+        self.assertEqual(report[0],
+                         '7 addresses, 3 domains, 2 duplicates dropped')
+        self.assertTrue(report[1].split()[:2] == ['b.org', '3'])
+        self.assertTrue(report[3].split()[:3] == ['(1', 'others)', '2'])
+        self.assertEqual(len(plan.report(None)), 4)
+
+    def testCommandLine(self):
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        args = [p_exe, m_exe, '-n', '--delivery', 'pickup', '--pickup-dir',
+                pickup, '-f', 'me@here.org', '-s', 'x', '-m', 'text',
+                '-r'] + [r for r in RECIPIENTS if r.strip()]
+        proc = sbp.Popen(args + ['--plan'], stdout=sbp.PIPE, stderr=sbp.PIPE)
+        out = proc.communicate()[0].decode('utf-8')
+        self.assertEqual(proc.returncode, 0)
+        self.assertTrue('7 addresses, 3 domains' in out)
+        self.assertEqual(os.listdir(pickup), [])
+        proc = sbp.Popen(args + ['--sort-domains'],
+                         stdout=sbp.PIPE, stderr=sbp.PIPE)
+        proc.communicate()
+        self.assertEqual(proc.returncode, 0)
+        sent = []
+        for name in sorted(os.listdir(pickup),
+                           key=lambda n: int(n.split('_')[1].split('.')[0])):
+            with open(op_.join(pickup, name)) as f:
+                sent.append(re.search(r'(?m)^To: (.*)$', f.read())
+                            .group(1).strip())
+        self.assertEqual([s.partition('@')[2] for s in sent],
+                         ['a.org'] * 2 + ['b.org'] * 3 + ['c.org'] * 2)
+
+    def testSuppressed(self):
+        db = op_.join(self.dir, 'suppressed')
+        suppressed = bounces.SuppressionList(db)
+        suppressed.add('x@a.org', bounces.HARD, '5.1.1')
+        suppressed.add('m@b.org', bounces.HARD, '5.1.1')
+        suppressed.close()
+        path = op_.join(self.dir, 'recipients')
+        with open(path, 'w') as f:
+            f.write('\n'.join(RECIPIENTS[5:]) + '\n')
+        proc = sbp.Popen([p_exe, m_exe, '-n', '-f', 'me@here.org', '-r']
+                         + [r for r in RECIPIENTS[:5] if r.strip()]
+                         + ['--from-file', path, '--plan',
+                            '--suppression-list', db],
+                         stdout=sbp.PIPE, stderr=sbp.PIPE)
+        out = proc.communicate()[0].decode('utf-8')
+        self.assertEqual(proc.returncode, 0)
+        self.assertTrue('2 suppressed recipients skipped' in out)
+        self.assertTrue('5 addresses, 3 domains, 2 duplicates' in out)
+        self.assertTrue(re.search(r'(?m)^\s+a\.org\s+1 ', out))
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestPlanner,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_rcptreader file
+
+
+import io
+import os
+import os.path as op_
+import sys
+import pickle
+import shutil
+import tempfile
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+sys.path.insert(0, basepackdir)
+
+from Multimail import addrcheck
+from Multimail import rcptreader
+from Multimail import recipients
+
+
+class TestReader(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = op_.join(self.dir, 'list.txt')
+        lines = []
+        for n in range(500):
+            lines.append(u'user%d@domain%d.org' % (n, n % 7))
+            if n % 50 == 0:
+                lines.extend([u'', u'  bad%d@' % n, u'x@deny.org\r'])
+        lines.append(u'caf\xe8@example.org')
+        lines.append(u'last@example.org')  # no final newline
+        self.lines = lines
+        with io.open(self.path, 'w', encoding='utf-8') as f:
+            f.write(u'\n'.join(lines))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testRanges(self):
+        ranges = rcptreader.split_ranges(self.path, 100)
+        self.assertTrue(len(ranges) > 50)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], op_.getsize(self.path))
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[end-1:end], b'\n')
+        empty = op_.join(self.dir, 'empty')
+        open(empty, 'w').close()
+        self.assertEqual(rcptreader.split_ranges(empty), [])
+
+    def testLoad(self):
+        checker = addrcheck.Checker((), ('deny.org',))
+        rejects = op_.join(self.dir, 'expected')
+        lines = self.lines
+        if str is bytes:  # python2, as read from a file
+            lines = [l.encode('utf-8') for l in lines]
+        expected, count = checker.filter(lines, rejects)
+        for workers, ordered in ((1, True), (3, True), (3, False)):
+            table = recipients.RecipientTable(['first@here.org'])
+            path = op_.join(self.dir, 'rejected%d%s' % (workers, ordered))
+            self.assertEqual(rcptreader.load(self.path, table, (),
+                                             ('deny.org',), path, workers,
+                                             ordered, 200), count)
+            self.assertEqual(table[0], 'first@here.org')
+            result, wanted = list(table)[1:], list(expected)
+            with open(path) as got, open(rejects) as f:
+                if ordered:
+                    self.assertEqual(got.read(), f.read())
+                else:
+                    result, wanted = sorted(result), sorted(wanted)
+            self.assertEqual(result, wanted)
+            self.assertEqual(sorted(table.domains()),
+                             sorted(['here.org'] + expected.domains()))
+
+    def testMerge(self):
+        one = recipients.RecipientTable(['a@b.c', 'd@e.f'])
+        two = recipients.RecipientTable(['g@e.f', 'h@i.j'])
+        two.mark(1, recipients.FAILED, 'refused')
+        one.merge(two)
+        self.assertEqual(list(one), ['a@b.c', 'd@e.f', 'g@e.f', 'h@i.j'])
+        self.assertEqual(one.domains(), ['b.c', 'e.f', 'i.j'])
+        self.assertEqual(one.failures(), [('h@i.j', 'refused')])
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(one, protocol))
+            self.assertEqual(list(copy), list(one))
+            self.assertEqual(copy.failures(), one.failures())
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestReader,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
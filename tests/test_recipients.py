@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_recipients file
+
+
+import os
+import os.path as op_
+import sys
+import shutil
+import tempfile
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+sys.path.insert(0, basepackdir)
+
+from Multimail import recipients
+from Multimail import delivery
+from Multimail import message
+from Multimail.recipients import RecipientTable, PENDING, SENT, FAILED
+
+
+class FailingSender(delivery.PickupDirSender):
+    """Pickup sender failing the deliveries to the *bad* addresses."""
+    def __init__(self, pickup_dir, bad):
+        super(FailingSender, self).__init__(pickup_dir)
+        self.bad = bad
+
+    def _deliver(self, sender, receiver, message, index=None):
+        if receiver in self.bad:
+            raise IOError("refused")
+        super(FailingSender, self)._deliver(sender, receiver, message, index)
+
+
+class TestRecipients(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testTable(self):
+        addrs = ['a@x.org', 'b@y.org', 'c@x.org', 'local', '"q@r"@x.org']
+        table = RecipientTable(addrs + ['  ', '\n'])
+        self.assertEqual(len(table), 5)
+        self.assertEqual(list(table), addrs)
+        self.assertEqual((table[-1], table[3]), (addrs[-1], 'local'))
+        self.assertEqual(table.domains(), ['x.org', 'y.org', ''])
+        self.assertEqual(table.domain(4), 'x.org')
+        self.assertRaises(IndexError, table.__getitem__, 5)
+        view = table[1:3]
+        self.assertEqual((len(view), list(view)), (2, addrs[1:3]))
+        self.assertEqual(len(table[4:100]), 1)
+        view.mark(1, FAILED, 'no way', 10)
+        view.mark(1, SENT)
+        table.mark(0, FAILED, 'gone')
+        self.assertEqual(list(table.status), [FAILED, 0, SENT, 0, 0])
+        self.assertEqual((table.attempts[2], table.count(PENDING)), (2, 3))
+        self.assertEqual(table.failures(), [('a@x.org', 'gone')])
+        self.assertTrue(table.updated[2] > 10)
+
+    def testBigBuffer(self):
+        if sys.maxsize <= 1 << 32:
+            return
+        # past 4 GiB of local parts (faked, only the offsets)
+        table = RecipientTable()
+        table._offsets.append(5 << 30)
+        table.merge(RecipientTable(['a@b.c']))
+        self.assertEqual(list(table._offsets), [0, 5 << 30, (5 << 30) + 1])
+
+    def testFile(self):
+        path = op_.join(self.dir, 'list')
+        with open(path, 'w') as f:
+            f.write('one@a.b\n\n  two@a.b \n')
+        self.assertEqual(list(RecipientTable.from_file(path)),
+                         ['one@a.b', 'two@a.b'])
+
+    def testUnicode(self):
+        table = RecipientTable([u'p\xe8@a.b'])
+        # native strings: encoded on python2
+        expected = u'p\xe8@a.b'
+        if recipients._NATIVE_BYTES:
+            expected = expected.encode('utf-8')
+        self.assertEqual(table[0], expected)
+
+    def testSender(self):
+        table = RecipientTable('r%d@b.c' % i for i in range(6))
+        sender = FailingSender(self.dir, ('r1@b.c', 'r4@b.c'))
+        sender.verbose = False
+        self.assertTrue(sender.login())
+        msg = message.PlainMsg('me@here.org', '', 's', 'text')
+        self.assertEqual(sender.send(msg, table[0:3], True), 255)
+        self.assertEqual(list(table.status), [1, 2, 1, 0, 0, 0])
+        self.assertEqual(sender.send(msg, table[3:]), 255)
+        self.assertEqual(table.failures(),
+                         [('r1@b.c', 'refused'), ('r4@b.c', 'refused')])
+        self.assertEqual(len(os.listdir(self.dir)), 4)
+        # plain lists still work
+        sender.login()
+        self.assertEqual(sender.send(msg, ['x@y.z']), 0)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestRecipients,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
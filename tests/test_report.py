@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_report file
+
+
+import os
+import os.path as op_
+import sys
+import json
+import shutil
+import smtplib
+import tempfile
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+sys.path.insert(0, pwd)
+
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import delivery
+from Multimail import message
+from Multimail import report
+from fake_smtp import FakeSMTPServer
+
+
+class TestReport(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testHistogram(self):
+        hist = report.Histogram()
+        self.assertEqual(hist.percentile(50), None)
+        values = [n / 1000.0 for n in range(1, 1001)]
+        for value in reversed(values):
+            hist.add(value)
+        self.assertEqual(hist.count, 1000)
+        for p in (50, 95, 99):
+            expected = values[p * 10 - 1]
+            self.assertTrue(abs(hist.percentile(p) - expected)
+                            <= expected * (report.GROWTH - 1))
+        self.assertEqual(hist.percentile(100), 1.0)
+        self.assertTrue(len(hist.buckets) < 200)
+        other = report.Histogram()
+        other.add(5.0)
+        hist.merge(other)
+        self.assertEqual((hist.count, hist.max), (1001, 5.0))
+        self.assertEqual(hist.percentile(100), 5.0)
+
+    def testTimeline(self):
+        line = report.Timeline(0, 1, 4)
+        for when in (0.5, 1.5, 1.7, 3.2):
+            line.add(10, when)
+        self.assertEqual(line.messages, [1, 2, 0, 1])
+        line.add(10, 7.5)
+        self.assertEqual((line.interval, line.messages), (2, [3, 1, 0, 1]))
+        self.assertEqual(line.bytes, [30, 10, 0, 10])
+        line.add(1, 100)
+        self.assertEqual(line.interval, 32)
+        self.assertEqual(line.messages, [5, 0, 0, 1])
+
+    def testRecord(self):
+        run = report.RunReport()
+        run.expected = 5
+        run.record('a@b.c', 0.1, 100)
+        run.record('d@B.C', 0.2, 50)
+        run.record('x@y.z', 0.3, 0, smtplib.SMTPRecipientsRefused(
+            {'x@y.z': (550, 'no such user')}))
+        run.record('k@y.z', 0.4, 0, smtplib.SMTPDataError(452, 'full'))
+        run.error(smtplib.SMTPServerDisconnected('gone'))
+        data = run.as_dict()
+        self.assertEqual((data['sent'], data['failed'], data['not_sent']),
+                         (2, 2, 1))
+        self.assertEqual(data['bytes'], 150)
+        self.assertEqual(data['codes'], {'550': 1, '452': 1})
+        self.assertEqual(data['errors'], {'SMTPRecipientsRefused': 1,
+                                          'SMTPDataError': 1,
+                                          'SMTPServerDisconnected': 1})
+        self.assertEqual(data['domains']['b.c'],
+                         {'sent': 2, 'failed': 0, 'success': 1.0})
+        self.assertEqual(data['domains']['y.z']['success'], 0.0)
+        self.assertEqual(data['latency']['count'], 4)
+        self.assertEqual(sum(data['throughput']['messages']), 2)
+        lines = run.summary()
+        self.assertTrue(lines[0].startswith('2 sent, 2 failed, 1 not sent'))
+        self.assertTrue(lines[-1].split()[0] == 'y.z')
+        path = op_.join(self.dir, 'report.json')
+        run.write(path)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['codes'], data['codes'])
+
+    def testSender(self):
+        recs = ['a@b.c', 'x@y.z', 'd@e.f']
+        with FakeSMTPServer(refuse=('x@y.z',)) as server:
+            msg = message.MimeMsg('me@here.org', '', 's', 't', 'text', [])
+            sender = delivery.SendMails(server.host, server.port, False, 10)
+            sender.verbose = False
+            sender.run_report = report.RunReport()
+            self.assertTrue(sender.login('me', 'pwd'))
+            self.assertEqual(sender.send(msg, recs), 255)
+        data = sender.run_report.as_dict()
+        self.assertEqual((data['expected'], data['sent'], data['failed']),
+                         (3, 2, 1))
+        self.assertEqual(data['codes'], {'550': 1})
+        self.assertEqual(data['bytes'], sum(len(m[2])
+                                            for m in server.messages))
+
+    def testCommandLine(self):
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        path = op_.join(self.dir, 'report.json')
+        args = [p_exe, m_exe, '-n', '--delivery', 'pickup', '--pickup-dir',
+                pickup, '-f', 'me@here.org', '-s', 'x', '-m', 'text',
+                '-r', 'a@b.org', 'c@d.org', '--report', path]
+        proc = sbp.Popen(args, stdout=sbp.PIPE, stderr=sbp.PIPE)
+        out = proc.communicate()[0].decode('utf-8')
+        self.assertEqual(proc.returncode, 0)
+        self.assertTrue('2 sent, 0 failed' in out)
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(sorted(data['domains']), ['b.org', 'd.org'])
+        self.assertEqual(data['latency']['count'], 2)
+        proc = sbp.Popen(args + ['--shards', '2'],
+                         stdout=sbp.PIPE, stderr=sbp.PIPE)
+        proc.communicate()
+        self.assertEqual(proc.returncode, 2)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestReport,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
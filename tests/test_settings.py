@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_settings file
+
+
+import os
+import os.path as op_
+import sys
+import time
+import shutil
+import tempfile
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+p_exe = sys.executable
+data_dir = op_.join(pwd, 'data')
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import settings
+
+CONFIG = """
+[DEFAULT]
+sender = me@here.org
+host = smtp.here.org
+secure_conn = true
+ssl_port = 465
+timeout = 50
+delay =
+delivery = smtp
+
+[common]
+login = me
+delay = 0.5
+host =
+delivery = pickup
+
+[relay]
+host = relay.there.org
+secure_conn = no
+port = 2525
+
+[work]
+inherit = common, relay
+login = worker
+pickup_dir = %(here)s/pickup
+here = /var/spool
+
+[plain]
+host =
+
+[loop1]
+inherit = loop2
+
+[loop2]
+inherit = loop1
+
+[bad]
+timeout = soon
+"""
+
+
+class TestSettings(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = op_.join(self.dir, 'multimail.cfg')
+        with open(self.path, 'w') as f:
+            f.write(CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testTypes(self):
+        s = settings.load(self.path)
+        self.assertEqual((s.secure_conn, s.ssl_port, s.timeout, s.delay),
+                         (True, 465, 50, 0.0))
+        self.assertEqual((s.port, s.password, s.pipelining), (None, None, True))
+        self.assertRaises(AttributeError, setattr, s, 'spam', 1)
+        self.assertEqual(settings.load(op_.join(data_dir, 'config_ok.cfg'))
+                         .delivery, 'smtp')
+
+    def testInherit(self):
+        s = settings.load(self.path, 'work')
+        self.assertEqual((s.login, s.delay, s.host, s.port, s.secure_conn),
+                         ('worker', 0.5, 'relay.there.org', 2525, False))
+        self.assertEqual((s.sender, s.timeout), ('me@here.org', 50))
+        self.assertEqual((s.pickup_dir, s.delivery),
+                         ('/var/spool/pickup', 'pickup'))
+        # without inherit the empty values are kept
+        self.assertEqual(settings.load(self.path, 'plain').host, '')
+
+    def testErrors(self):
+        for section in ('loop1', 'bad', 'missing'):
+            self.assertRaises(settings.SettingsError,
+                              settings.load, self.path, section)
+        self.assertRaises(settings.SettingsError,
+                          settings.load, self.path + 'x')
+
+    def testCache(self):
+        s = settings.load(self.path, 'work')
+        self.assertTrue(settings.load(self.path, 'work') is s)
+        with open(self.path, 'a') as f:
+            f.write('\n[new]\nlogin = new\n')
+        os.utime(self.path, (time.time() + 10, time.time() + 10))
+        self.assertEqual(settings.load(self.path, 'new').login, 'new')
+        self.assertFalse(settings.load(self.path, 'work') is s)
+
+    def testCommandLine(self):
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        with open(self.path, 'a') as f:
+            # delivery = pickup comes from [common]
+            f.write('\n[mine]\ninherit = work\npickup_dir = %s\n' % pickup)
+        sbp.check_call([p_exe, m_exe, '-C', self.path, '-u', 'mine',
+                        '-r', 'a@b.c', '-s', 'x', '-m', 'text'],
+                       stdout=sbp.PIPE)
+        self.assertEqual(len(os.listdir(pickup)), 1)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestSettings,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_shard file
+
+
+import json
+import os
+import os.path as op_
+import sys
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+sys.path.insert(0, pwd)
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import daemon
+from Multimail import delivery
+from Multimail import message
+from Multimail import shard
+from fake_smtp import FakeSMTPServer
+
+
+def _job():
+    return daemon.message_to_job(
+        message.MimeMsg('me@here.org', '', 'subject', 'text', 'text', []))
+
+
+class TestShard(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testSplit(self):
+        recs = ['user%d@example%d.org' % (n, n % 7) for n in range(200)]
+        self.assertEqual(shard.shard_of('A@B.org', 5),
+                         shard.shard_of(' a@b.ORG\n', 5))
+        tables = shard.split(recs + ['', '  '], 4)
+        self.assertEqual(sorted(a for t in tables for a in t), sorted(recs))
+        self.assertTrue(all(len(t) > 20 for t in tables))
+        # the order of the source doesn't matter
+        again = shard.split(reversed(recs), 4)
+        self.assertEqual([sorted(t) for t in tables],
+                         [sorted(t) for t in again])
+        self.assertEqual(shard.parse_node('8025'), ('127.0.0.1', 8025))
+        self.assertEqual(shard.parse_node('host:25'), ('host', 25))
+        self.assertRaises(shard.ShardError, shard.parse_node, 'host:')
+
+    def testLocal(self):
+        recs = ['a%d@b.c' % n for n in range(30)] + ['no@b.c']
+        with FakeSMTPServer(refuse=('no@b.c',)) as server:
+            factory = lambda: delivery.SendMails(server.host, server.port,
+                                                 False, 10)
+            coordinator = shard.Coordinator(_job(), shard.split(recs, 3),
+                                            factory, 'me', 'pwd')
+            self.assertEqual(coordinator.run(), 255)
+            self.assertEqual(len(server.messages), 30)
+        self.assertEqual(coordinator.totals(), (31, 30, 1, 31))
+        self.assertEqual([f[0] for f in coordinator.failures], ['no@b.c'])
+        self.assertEqual(len(coordinator.report()), 3)
+
+    def testNode(self):
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        node = shard.NodeServer(('127.0.0.1', 0),
+                                lambda: delivery.PickupDirSender(pickup),
+                                None, None)
+        thread = threading.Thread(target=node.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            recs = ['a%d@b.c' % n for n in range(250)]
+            updates = []
+            coordinator = shard.Coordinator(
+                _job(), shard.split(recs, 2), nodes=[node.server_address])
+            self.assertEqual(coordinator.run(
+                lambda c: updates.append(c.totals())), 0)
+            self.assertEqual(len(os.listdir(pickup)), 250)
+            self.assertEqual(updates[-1], (250, 250, 0, 250))
+            self.assertTrue(len(updates) > 2)  # progress of the batches
+            # an attachment missing on the node
+            job = _job()
+            job['attachments'] = [[op_.join(self.dir, 'missing'), 'x']]
+            coordinator = shard.Coordinator(
+                job, shard.split(recs[:10], 1), nodes=[node.server_address])
+            self.assertEqual(coordinator.run(), 3)
+            self.assertTrue(coordinator.status[0]['error'])
+            self.assertEqual(len(os.listdir(pickup)), 250)
+            # a stream truncated before the recipients announced
+            conn = socket.create_connection(node.server_address)
+            header = dict(command='shard', shard=0, message=_job(), count=3)
+            conn.sendall((json.dumps(header) + '\na@b.c\n').encode('utf-8'))
+            conn.shutdown(socket.SHUT_WR)
+            answer = json.loads(conn.makefile('rb').readline().decode('utf-8'))
+            conn.close()
+            self.assertFalse(answer['ok'])
+            self.assertTrue(answer['error'].startswith('bad request:'))
+            self.assertEqual(len(os.listdir(pickup)), 250)
+            # the coordinator doesn't need a server or credentials
+            args = [p_exe, m_exe, '-n', '-f', 'me@here.org', '-s', 'x',
+                    '-m', 'text', '-r', 'z@b.c', '--nodes',
+                    '%s:%d' % node.server_address]
+            proc = sbp.Popen(args, stdin=sbp.PIPE, stdout=sbp.PIPE,
+                             stderr=sbp.PIPE)
+            proc.communicate(b'')
+            self.assertEqual(proc.returncode, 0)
+            self.assertEqual(len(os.listdir(pickup)), 251)
+            proc = sbp.Popen(args + ['-a', m_exe], stdout=sbp.PIPE,
+                             stderr=sbp.PIPE)
+            err = proc.communicate()[1].decode('utf-8')
+            self.assertEqual(proc.returncode, 2)
+            self.assertTrue('attachments' in err)
+        finally:
+            node.shutdown()
+            node.server_close()
+        # node unreachable
+        coordinator = shard.Coordinator(_job(), shard.split(recs, 2),
+                                        nodes=[node.server_address])
+        self.assertEqual(coordinator.run(), 3)
+        self.assertEqual(coordinator.totals(), (250, 0, 250, 250))
+        self.assertTrue(coordinator.status[0]['error'])
+
+    def testCommandLine(self):
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        args = [p_exe, m_exe, '-n', '--delivery', 'pickup', '--pickup-dir',
+                pickup, '-f', 'me@here.org', '-s', 'x', '-m', 'text',
+                '-r'] + ['a%d@b.org' % n for n in range(20)]
+        proc = sbp.Popen(args + ['--shards', '3'],
+                         stdout=sbp.PIPE, stderr=sbp.PIPE)
+        out = proc.communicate()[0].decode('utf-8')
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(len(os.listdir(pickup)), 20)
+        self.assertEqual(out.count('shard '), 3)
+        for extra, error in ((['--shards', '2', '--sign'], 'sign'),
+                             (['--nodes', 'host:'], 'invalid node')):
+            proc = sbp.Popen(args + extra, stdout=sbp.PIPE, stderr=sbp.PIPE)
+            err = proc.communicate()[1].decode('utf-8')
+            self.assertEqual(proc.returncode, 2)
+            self.assertTrue(error in err)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestShard,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
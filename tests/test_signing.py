@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_signing file
+
+
+import os
+import os.path as op_
+import sys
+import time
+import email
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+sys.path.insert(0, basepackdir)
+
+from Multimail import signing
+from Multimail import message
+from Multimail.mmutils import SignError
+
+
+class FakeSigner(object):
+    """Signer returning the sha256 of the data, logging the calls."""
+    def __init__(self, log, delay=0):
+        self.log = log
+        self.delay = delay
+
+    def __call__(self, data):
+        self.log.append((threading.current_thread().name, data))
+        time.sleep(self.delay)
+        if b'fail' in data:
+            raise SignError('bad data')
+        return ('-----BEGIN PGP SIGNATURE-----\n\n%s\n'
+                '-----END PGP SIGNATURE-----\n'
+                % hashlib.sha256(data).hexdigest()).encode('ascii')
+
+
+def signed_data(text):
+    """Return the canonical signed part and the signature part of
+    the multipart/signed message *text*."""
+    msg = email.message_from_string(text)
+    boundary = '\n--' + msg.get_boundary() + '\n'
+    body = '\n' + text.split('\n\n', 1)[1]
+    signed = body.split(boundary)[1]
+    return signed.replace('\n', '\r\n').encode('ascii'), msg.get_payload()[1]
+
+
+class TestSigning(unittest.TestCase):
+    def setUp(self):
+        self.log = []
+        self.pool = signing.SignerPool(lambda: FakeSigner(self.log, 0.05), 3)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def testPool(self):
+        results = [self.pool.submit(('data %d' % (n % 3)).encode('ascii'))
+                   for n in range(9)]
+        self.assertTrue(results[0] is results[3])
+        self.assertEqual(self.pool.sign(b'data 1'), results[1].get())
+        self.assertEqual(self.pool.signed, 3)
+        self.assertEqual(len(self.log), 3)
+        # the signatures made at once
+        self.assertEqual(len(set(name for name, data in self.log)), 3)
+        self.assertRaises(SignError, self.pool.sign, b'fail')
+
+    def testMessage(self):
+        text = u'trailing space \nFrom here\ncaff\xe8\n'
+        msg = message.MimeMsg('me@here.org', '', 's', text, 'text',
+                              [(op_.join(basepackdir, 'multimail.py'), None)])
+        msg.pgp_sign(self.pool)
+        msg.set_8bit(True)
+        self.assertFalse(msg.eightbit)
+        self.assertEqual(msg._text_part['Content-Transfer-Encoding'],
+                         'quoted-printable')
+        first = msg.get_message('one@b.org')
+        second = msg.get_message('two@b.org')
+        outer = email.message_from_string(first)
+        self.assertEqual(outer.get_content_type(), 'multipart/signed')
+        self.assertEqual(outer.get_param('protocol'),
+                         'application/pgp-signature')
+        self.assertEqual(outer.get_param('micalg'), 'pgp-sha256')
+        self.assertEqual(outer['To'], 'one@b.org')
+        data, sig = signed_data(first)
+        self.assertTrue(data.startswith(b'Content-Type: multipart/mixed'))
+        self.assertEqual(sig.get_payload(), FakeSigner([])(data).decode())
+        self.assertEqual(signed_data(second)[0], data)
+        self.assertEqual(len(self.log), 1)
+        # the same text in another message, signed once
+        other = message.MimeMsg('me@here.org', '', 's', text, 'text',
+                                [(op_.join(basepackdir, 'multimail.py'),
+                                  None)])
+        other.pgp_sign(self.pool)
+        self.assertEqual(signed_data(other.get_message('x@b.org'))[0], data)
+        self.assertEqual(len(self.log), 1)
+        failing = message.MimeMsg('me@here.org', '', 's', 'fail', 'text', [])
+        failing.pgp_sign(self.pool)
+        self.assertRaises(SignError, failing.get_message)
+
+    def testCommandLine(self):
+        common = [p_exe, m_exe, '-n', '-f', 'me@here.org', '-s', 'x',
+                  '-m', 'text', '-r', 'a@b.org', '--pgp-mime']
+        for args in (['-T', 'plain'], ['--sign'],
+                     ['--delivery', 'queue']):
+            proc = sbp.Popen(common + args, stdout=sbp.PIPE, stderr=sbp.PIPE)
+            err = proc.communicate()[1].decode('utf-8')
+            self.assertEqual(proc.returncode, 2)
+            self.assertTrue('PGP/MIME' in err)
+
+    def testGpg(self):
+        gpg = None
+        for path in os.environ.get('PATH', '').split(os.pathsep):
+            if op_.isfile(op_.join(path, 'gpg')):
+                gpg = op_.join(path, 'gpg')
+                break
+        if gpg is None:
+            self.skipTest('gpg not available')
+        home = tempfile.mkdtemp()
+        env = dict(os.environ, GNUPGHOME=home)
+        old_home = os.environ.get('GNUPGHOME')
+        try:
+            os.chmod(home, 0o700)
+            if sbp.call([gpg, '--batch', '--passphrase', '',
+                         '--quick-gen-key', 'test@example.org', 'default',
+                         'sign', 'never'], env=env,
+                        stdout=sbp.PIPE, stderr=sbp.PIPE):
+                self.skipTest("can't create a gpg key")
+            os.environ['GNUPGHOME'] = home
+            pool = signing.gpg_pool(gpg, 'test@example.org')
+            msg = message.MimeMsg('me@here.org', '', 's', 'text\n', 'text',
+                                  [])
+            msg.pgp_sign(pool)
+            data, sig = signed_data(msg.get_message('you@b.org'))
+            pool.close()
+            with open(op_.join(home, 'data'), 'wb') as f:
+                f.write(data)
+            with open(op_.join(home, 'data.asc'), 'w') as f:
+                f.write(sig.get_payload())
+            self.assertEqual(sbp.call([gpg, '--verify',
+                                       op_.join(home, 'data.asc'),
+                                       op_.join(home, 'data')], env=env,
+                                      stdout=sbp.PIPE, stderr=sbp.PIPE), 0)
+            self.assertRaises(SignError, signing.GpgSigner(gpg, 'nokey'),
+                              b'data')
+        finally:
+            if old_home is None:
+                os.environ.pop('GNUPGHOME', None)
+            else:
+                os.environ['GNUPGHOME'] = old_home
+            try:
+                sbp.call(['gpgconf', '--kill', 'gpg-agent'], env=env,
+                         stdout=sbp.PIPE, stderr=sbp.PIPE)
+            except OSError:
+                pass
+            shutil.rmtree(home, ignore_errors=True)
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestSigning,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_spool file
+
+
+import os
+import os.path as op_
+import sys
+import time
+import json
+import shutil
+import tempfile
+import unittest
+from array import array
+
+pwd = op_.dirname(op_.realpath(__file__))
+sys.path.insert(0, pwd)
+
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+sys.path.insert(0, basepackdir)
+
+from Multimail import message
+from Multimail import spool
+from Multimail import daemon
+from Multimail import delivery
+from fake_smtp import FakeSMTPServer
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.spool = spool.Spool(op_.join(self.dir, 'spool'))
+        self.smtp = None
+
+    def tearDown(self):
+        if self.smtp is not None:
+            self.smtp.close()
+        shutil.rmtree(self.dir)
+
+    def _job(self, attachments=()):
+        msg = message.MimeMsg('me@here.org', '', 's', 'text', 'text',
+                                list(attachments))
+        return daemon.message_to_job(msg)
+
+    def _pool(self, size=1):
+        self.smtp = FakeSMTPServer()
+        factory = lambda: delivery.SendMails(
+            self.smtp.host, self.smtp.port, False, 10)
+        return daemon.SessionPool(factory, 'me', 'pwd', size, 60)
+
+    def testOrder(self):
+        now = time.time()
+        low = self.spool.submit(self._job(), ['a@b.c'], 7, now - 10)
+        high = self.spool.submit(self._job(), ['a@b.c'], 1, now - 5)
+        later = self.spool.submit(self._job(), ['a@b.c'], 0, now + 3600)
+        self.assertEqual(self.spool.waiting(now)[1], 1)
+        self.assertEqual([self.spool.claim(now)[1]['id'] for i in range(2)],
+                         [high, low])
+        self.assertEqual(self.spool.claim(now), None)
+        self.assertEqual(self.spool.claim(now + 3600)[1]['id'], later)
+        self.assertRaises(spool.SpoolError,
+                          self.spool.submit, self._job(), [], 10)
+
+    def testAttachments(self):
+        src = op_.join(self.dir, 'att.txt')
+        with open(src, 'w') as f:
+            f.write('spam')
+        self.spool.submit(self._job([(src, 'eggs')]), ['a@b.c'])
+        os.remove(src)
+        name, job = self.spool.claim()
+        path, filename = job['attachments'][0]
+        self.assertEqual(filename, 'eggs')
+        with open(path) as f:
+            self.assertEqual(f.read(), 'spam')
+        self.spool.finish(name, job)
+        self.assertFalse(op_.exists(op_.dirname(path)))
+
+    def testRunJob(self):
+        recs = ['r%d@b.c' % i for i in range(7)]
+        pool = self._pool()
+        self.spool.submit(self._job(), recs)
+        name, job = self.spool.claim()
+        spool.run_job(self.spool, pool, name, job, batch_size=3)
+        pool.close()
+        self.assertEqual([r for m in self.smtp.messages for r in m[1]], recs)
+        status = self.spool.status()
+        self.assertEqual((status['queued'], status['done']), (0, 1))
+
+    def testResume(self):
+        recs = ['r%d@b.c' % i for i in range(5)]
+        job_id = self.spool.submit(self._job(), recs)
+        name, job = self.spool.claim()
+        # a runner stopped after the first three recipients
+        self.spool.record(job_id, 3, 2, 1, array('B', [1, 2, 1]))
+        self.assertEqual(list(self.spool.recipient_table(job_id).status),
+                         [1, 2, 1, 0, 0])
+        self.spool.recover()
+        self.assertEqual(self.spool.status()['running'], 0)
+        pool = self._pool()
+        name, job = self.spool.claim()
+        spool.run_job(self.spool, pool, name, job)
+        pool.close()
+        self.assertEqual([r for m in self.smtp.messages for r in m[1]],
+                         recs[3:])
+        with open(op_.join(self.spool.path, 'done', name)) as f:
+            done = json.load(f)
+        self.assertEqual((done['sent'], done['errors']), (4, 1))
+        self.assertEqual(done['failures'], [['r1@b.c', None]])
+        self.assertEqual(os.listdir(op_.join(self.spool.path, 'journal')), [])
+
+    def testRetry(self):
+        self.spool.submit(self._job(), ['a@b.c'])
+        factory = lambda: delivery.SendMails('127.0.0.1', 1, False, 1)
+        pool = daemon.SessionPool(factory, 'me', 'pwd', 1, 60)
+        for i in range(spool.MAX_ATTEMPTS):
+            claimed = self.spool.claim(time.time() + spool.RETRY_DELAY * 2)
+            spool.run_job(self.spool, pool, claimed[0], claimed[1])
+        status = self.spool.status()
+        self.assertEqual((status['queued'], status['scheduled'],
+                          status['failed']), (0, 0, 1))
+
+    def testPartialRetry(self):
+        recs = ['r%d@b.c' % i for i in range(5)]
+        pickup = op_.join(self.dir, 'pickup')
+        os.mkdir(pickup)
+        class Dropping(delivery.PickupDirSender):
+            fatal_errors = (EOFError,)
+            drop = set(['r3@b.c'])
+            def _deliver(self, sender, receiver, message, index=None):
+                if receiver in self.drop:
+                    self.drop.discard(receiver)
+                    raise EOFError("connection lost")
+                super(Dropping, self)._deliver(sender, receiver, message)
+        pool = daemon.SessionPool(lambda: Dropping(pickup), None, None)
+        job_id = self.spool.submit(self._job(), recs)
+        name, job = self.spool.claim()
+        spool.run_job(self.spool, pool, name, job)
+        self.assertEqual(len(os.listdir(pickup)), 3)
+        self.assertEqual(self.spool.progress(job_id), (3, 3, 0))
+        name, job = self.spool.claim(time.time() + spool.RETRY_DELAY * 2)
+        self.assertEqual(job['attempts'], 1)
+        spool.run_job(self.spool, pool, name, job)
+        sent = []
+        for filename in os.listdir(pickup):
+            with open(op_.join(pickup, filename)) as f:
+                sent.extend(l.split()[1] for l in f if l.startswith('To:'))
+        self.assertEqual(sorted(sent), recs)
+        with open(op_.join(self.spool.path, 'done', name)) as f:
+            self.assertEqual(json.load(f)['sent'], 5)
+
+    def testBadJob(self):
+        src = op_.join(self.dir, 'att.txt')
+        with open(src, 'w') as f:
+            f.write('spam')
+        job_id = self.spool.submit(self._job([(src, 'eggs')]), ['a@b.c'])
+        shutil.rmtree(op_.join(self.spool.path, 'data', job_id))
+        pool = self._pool()
+        for i in range(spool.MAX_ATTEMPTS):
+            name, job = self.spool.claim(time.time()
+                                         + spool.RETRY_DELAY * 2)
+            spool.try_job(self.spool, pool, name, job)
+        pool.close()
+        status = self.spool.status()
+        self.assertEqual((status['running'], status['queued'],
+                          status['failed']), (0, 0, 1))
+        with open(op_.join(self.spool.path, 'failed', name)) as f:
+            self.assertTrue(json.load(f)['error'])
+
+    def testRunner(self):
+        recs = ['r%d@b.c' % i for i in range(4)]
+        pool = self._pool()
+        pool.close()
+        for i in range(3):
+            self.spool.submit(self._job(), recs)
+        factory = lambda: delivery.SendMails(
+            self.smtp.host, self.smtp.port, False, 10)
+        runner = spool.QueueRunner(self.spool.path, factory, 'me', 'pwd', 2)
+        deadline = time.time() + 30
+        runner.run(lambda r: (r.spool.status()['done'] == 3
+                              or time.time() > deadline))
+        self.assertEqual((runner.sent, runner.errors), (12, 0))
+        self.assertEqual(self.smtp.connections, 2)
+        status = self.spool.status()
+        self.assertEqual((status['done'], status['sent']), (3, 12))
+
+    def testLock(self):
+        self.spool.submit(self._job(), ['a@b.c'])
+        name, job = self.spool.claim()
+        lock = self.spool.lock()
+        try:
+            # a second runner doesn't requeue the job being processed
+            runner = spool.QueueRunner(self.spool.path, None, 'me', 'pwd')
+            self.assertRaises(spool.SpoolError, runner.run)
+            self.assertEqual(runner.workers, [])
+            self.assertEqual(self.spool.status()['running'], 1)
+        finally:
+            lock.close()
+        self.spool.lock().close()
+
+    def testSubmitter(self):
+        sender = delivery.get_sender('queue', spool_dir=self.spool.path)
+        sender.verbose = False
+        self.assertTrue(sender.login())
+        msg = message.PlainMsg('me@here.org', '', 's', 'plain')
+        self.assertEqual(sender.send(msg, ['a@b.c', 'd@e.f']), 0)
+        name, job = self.spool.claim()
+        self.assertEqual(job['id'], sender.job_id)
+        self.assertEqual(job['total'], 2)
+        self.assertEqual(list(self.spool.recipients(job['id'])),
+                         [(0, 'a@b.c'), (1, 'd@e.f')])
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestSpool,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
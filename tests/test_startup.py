@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# multimail - massive mail sender | test_startup file
+
+
+import os
+import os.path as op_
+import sys
+import shutil
+import tempfile
+import subprocess as sbp
+import unittest
+
+pwd = op_.dirname(op_.realpath(__file__))
+p_exe = sys.executable
+basepackdir = op_.join(op_.split(pwd)[0], 'src')
+m_exe = op_.join(basepackdir, 'multimail.py')
+
+# modules which must be loaded only by the code paths using them
+HEAVY = ('smtplib', 'ssl', 'curses', 'email', 'zipfile', 'tarfile',
+         'tempfile', 'subprocess', 'getpass', 'platform', 'multiprocessing',
+         'json', 'Multimail.editor', 'Multimail.delivery', 'Multimail.esmtp',
+         'Multimail.message', 'Multimail.daemon', 'Multimail.spool')
+
+LOADED = """
+import sys, atexit
+atexit.register(lambda: sys.stderr.write('MODULES:' + ' '.join(sys.modules)))
+sys.path.insert(0, %r)
+sys.argv = ['multimail'] + %r
+import multimail
+if len(sys.argv) > 1:
+    multimail.main(sys.argv[1:])
+"""
+
+
+def loaded_modules(args=()):
+    """Return the modules loaded by multimail run with *args*."""
+    proc = sbp.Popen([p_exe, '-c', LOADED % (basepackdir, list(args))],
+                     stdout=sbp.PIPE, stderr=sbp.PIPE)
+    out, err = proc.communicate()
+    err = err.decode('utf-8')
+    return set(err[err.rindex('MODULES:') + 8:].split())
+
+
+def heavy(modules):
+    return sorted(m for m in modules
+                  if any(m == h or m.startswith(h + '.') for h in HEAVY))
+
+
+class TestStartup(unittest.TestCase):
+    def testImport(self):
+        self.assertEqual(heavy(loaded_modules()), [])
+
+    def testOptions(self):
+        for args in (['--version'], ['--help'], ['-n', '-s', 'x']):
+            modules = loaded_modules(args)
+            self.assertTrue('Multimail.parsopts' in modules)
+            self.assertEqual(heavy(modules), [], args)
+
+    def testPickup(self):
+        # sending without SMTP doesn't need smtplib (nor the editor)
+        pickup = tempfile.mkdtemp()
+        try:
+            modules = loaded_modules(['-n', '-f', 'me@here.org',
+                                      '-r', 'a@b.c', '-s', 'x', '-m', 'text',
+                                      '--delivery', 'pickup',
+                                      '--pickup-dir', pickup])
+            self.assertEqual(len(os.listdir(pickup)), 1)
+        finally:
+            shutil.rmtree(pickup)
+        self.assertTrue('Multimail.message' in modules)
+        self.assertEqual([m for m in heavy(modules)
+                          if m.split('.')[0] in ('smtplib', 'curses')],
+                         [])
+
+
+def load_tests():
+    loader = unittest.TestLoader()
+    test_cases = (TestStartup,)
+    return (loader.loadTestsFromTestCase(t) for t in test_cases)
+
+
+if __name__ == '__main__':
+    os.chdir(pwd)
+    unittest.TextTestRunner(verbosity=2).run(unittest.TestSuite(load_tests()))
@@ -10,10 +10,6 @@ import subprocess as sbp
 import sys
 import time
 import glob
-try:
-    import ConfigParser as configparser
-except ImportError:
-    import configparser
 import platform
 import zipfile
 import tarfile
@@ -38,6 +34,7 @@ except ImportError:
     sys.path.insert(0, basepackdir)
 
 from Multimail import mmutils
+from Multimail import settings
 
 
 class TestArchives(unittest.TestCase):
@@ -105,27 +102,20 @@ class TestFormatTime(unittest.TestCase):
 class TestConfig(unittest.TestCase):
     def testRead(self):
         for file in glob.glob(op_.join(data_dir, '*.cfg')):
-            config = mmutils.read_config(file)
-            self.assertTrue(isinstance(config, configparser.ConfigParser))
+            config = settings.load(file)
             for opt in config_file_opts:
-                config.get('DEFAULT', opt)
+                getattr(config, opt)
             for opt in config_file_no_opts:
-                self.assertRaises(
-                    configparser.NoOptionError,
-                    config.get, 'DEFAULT', opt)
-                
-    def testFakeConfig(self):
-        for section in ('spam', 'eggs', 'foobar'):
-            config = mmutils.fake_config(section)
-            for opt in config_file_opts:
-                config.get(section, opt)
-                self.assertRaises(
-                    configparser.NoOptionError,
-                    config.get, 'DEFAULT', opt)
-        config = mmutils.fake_config('DEFAULT')
-        for opt in config_file_opts:
-            config.get('DEFAULT', opt)
-            
+                self.assertRaises(AttributeError, getattr, config, opt)
+
+    def testNoConfig(self):
+        # -n|--no-config: the settings defaults
+        for section in ('spam', 'eggs', 'foobar', 'DEFAULT'):
+            config = settings.Settings(section)
+            self.assertEqual(config.section, section)
+            for name, conv, default in settings.OPTIONS:
+                self.assertEqual(getattr(config, name), default)
+
 
 class TestGNUPG(unittest.TestCase):
     def testBuildCommand(self):